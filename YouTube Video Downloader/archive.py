@@ -0,0 +1,207 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+from paths import user_data_dir
+
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+PRUNE_BATCH_SIZE = 1000
+
+COLUMNS = ("video_id", "format_id", "path", "size", "sha256", "completed_at")
+
+
+def file_checksum(path, algorithm="sha256"):
+    """Hex digest of a file, read in blocks so large videos are never loaded whole"""
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DownloadArchive:
+    """Index of finished downloads keyed by video ID and format ID.
+
+    Every row records where a download was saved, its size and SHA-256 so
+    bulk jobs can skip videos that are already on disk. The set of archived
+    video IDs is kept in memory, so contains() is a dictionary lookup that
+    never touches the database or the network; it is read on first use so
+    opening a large archive does not slow down startup. Entries are returned
+    as plain dicts with the keys in COLUMNS.
+    """
+
+    def __init__(self, path=None, checksums=True):
+        self.path = path or os.path.join(user_data_dir(), "archive.sqlite3")
+        self.checksums = checksums
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                video_id TEXT NOT NULL,
+                format_id TEXT NOT NULL,
+                path TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (video_id, format_id)
+            ) WITHOUT ROWID
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS downloads_completed ON downloads (completed_at)")
+        self._db.commit()
+        # video ID -> set of archived format IDs, see _ids()
+        self._index = None
+
+    def _ids(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    index = {}
+                    for video_id, format_id in self._db.execute("SELECT video_id, format_id FROM downloads"):
+                        index.setdefault(video_id, set()).add(format_id)
+                    self._index = index
+                index = self._index
+        return index
+
+    def contains(self, video_id, format_id=None):
+        """True if the video (in `format_id`, or in any format) was downloaded before"""
+        formats = self._ids().get(video_id)
+        if not formats:
+            return False
+        return format_id is None or format_id in formats
+
+    def __contains__(self, video_id):
+        return self.contains(video_id)
+
+    def record(self, video_id, format_id, path=None, size=None, sha256=None):
+        """Add or replace the entry for a finished download.
+
+        Size and checksum are read from `path` when not given; hashing is
+        skipped if the archive was created with checksums=False.
+        """
+        self._ids()
+        if path and os.path.isfile(path):
+            if size is None:
+                size = os.path.getsize(path)
+            if sha256 is None and self.checksums:
+                sha256 = file_checksum(path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO downloads (video_id, format_id, path, size, sha256, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, format_id, path, size, sha256, time.time())
+            )
+            self._db.commit()
+            self._index.setdefault(video_id, set()).add(format_id)
+
+    def record_many(self, entries):
+        """Add (video_id, format_id, path, size, sha256) tuples in one transaction"""
+        now = time.time()
+        rows = [(video_id, format_id, path, size, sha256, now)
+                for video_id, format_id, path, size, sha256 in entries]
+        self._ids()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO downloads (video_id, format_id, path, size, sha256, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+            for video_id, format_id, *_ in rows:
+                self._index.setdefault(video_id, set()).add(format_id)
+        return len(rows)
+
+    def get(self, video_id, format_id=None):
+        """Return the newest entry for a video (optionally in one format) or None"""
+        entries = self.query(video_id=video_id, format_id=format_id, limit=1)
+        return entries[0] if entries else None
+
+    def query(self, video_id=None, format_id=None, since=None, limit=None):
+        """Return matching entries, most recently completed first"""
+        clauses, params = [], []
+        for column, value in (("video_id", video_id), ("format_id", format_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("completed_at >= ?")
+            params.append(since)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM downloads"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY completed_at DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def remove(self, video_id, format_id=None):
+        """Forget a video so it is downloaded again; returns the number of entries removed"""
+        self._ids()
+        with self._lock:
+            if format_id is None:
+                cursor = self._db.execute("DELETE FROM downloads WHERE video_id = ?", (video_id,))
+                self._index.pop(video_id, None)
+            else:
+                cursor = self._db.execute("DELETE FROM downloads WHERE video_id = ? AND format_id = ?",
+                                          (video_id, format_id))
+                self._discard(video_id, format_id)
+            self._db.commit()
+            return cursor.rowcount
+
+    def prune(self, missing=True, older_than=None):
+        """Drop entries whose file is gone or changed size, or older than `older_than` seconds.
+
+        Returns the number of entries removed.
+        """
+        stale = []
+        self._ids()
+        with self._lock:
+            rows = self._db.execute("SELECT video_id, format_id, path, size, completed_at FROM downloads").fetchall()
+        cutoff = time.time() - older_than if older_than is not None else None
+        for video_id, format_id, path, size, completed_at in rows:
+            if cutoff is not None and completed_at < cutoff:
+                stale.append((video_id, format_id))
+            elif missing and path:
+                try:
+                    changed = size is not None and os.path.getsize(path) != size
+                except OSError:
+                    changed = True  # deleted or renamed
+                if changed:
+                    stale.append((video_id, format_id))
+
+        with self._lock:
+            for start in range(0, len(stale), PRUNE_BATCH_SIZE):
+                batch = stale[start:start + PRUNE_BATCH_SIZE]
+                self._db.executemany("DELETE FROM downloads WHERE video_id = ? AND format_id = ?", batch)
+                for video_id, format_id in batch:
+                    self._discard(video_id, format_id)
+            self._db.commit()
+        return len(stale)
+
+    def _discard(self, video_id, format_id):
+        # Called with the lock held
+        formats = self._index.get(video_id)
+        if formats is not None:
+            formats.discard(format_id)
+            if not formats:
+                del self._index[video_id]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM downloads")
+            self._db.commit()
+            self._index = {}
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,126 @@
+"""Bandwidth caps for downloads that can be changed while they run.
+
+A BandwidthLimiter holds one TokenBucket of bytes shared by every download
+(the global cap) and hands out a BandwidthThrottle per job, whose own
+bucket enforces the job's cap. Downloads report their progress to the
+throttle, which sleeps in the downloading thread until both buckets allow
+the bytes just received; the reader stalls, and TCP flow control slows the
+sender down with it. Bytes are paid for after they arrived, so the buckets
+start empty; a full one would let the first burst through for free.
+
+Rates are in bytes per second; None or 0 means unlimited.
+"""
+import threading
+import weakref
+
+from ratelimit import TokenBucket
+
+# Bytes a bucket may save up: a tenth of a second, but at least a read block
+BURST_SECONDS = 0.1
+MIN_BURST = 256 * 1024
+# Suffixes accepted by parse_rate(), binary like yt-dlp's --limit-rate
+RATE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def _burst(rate):
+    return max(MIN_BURST, rate * BURST_SECONDS) if rate else None
+
+
+class BandwidthThrottle:
+    """Caps one download; `rate` None follows the limiter's per-job default"""
+
+    def __init__(self, limiter, rate=None):
+        self.limiter = limiter
+        self.rate = rate
+        effective = self.effective_rate
+        self.bucket = TokenBucket(effective or 0, _burst(effective), tokens=0)
+        self._seen = None
+        self._lock = threading.Lock()
+
+    @property
+    def effective_rate(self):
+        return self.rate if self.rate is not None else self.limiter.job_rate
+
+    def set_rate(self, rate):
+        """Change this job's cap; None goes back to the per-job default"""
+        self.rate = rate
+        self._apply()
+
+    def _apply(self):
+        effective = self.effective_rate
+        self.bucket.set_rate(effective or 0, _burst(effective))
+
+    def consume(self, nbytes, cancelled=None):
+        """Wait until `nbytes` fit in the job's and the global cap"""
+        self.bucket.acquire(nbytes, cancelled)
+        self.limiter.bucket.acquire(nbytes, cancelled)
+
+    def update(self, downloaded_bytes, cancelled=None):
+        """Throttle for the bytes received since the last update.
+
+        The first update only sets the baseline, so bytes resumed from an
+        earlier run are not paid for again.
+        """
+        with self._lock:
+            seen = self._seen
+            self._seen = downloaded_bytes
+        if seen is not None and downloaded_bytes > seen:
+            self.consume(downloaded_bytes - seen, cancelled)
+
+
+class BandwidthLimiter:
+    """Global cap (`rate`) and default per-job cap (`job_rate`) of all downloads"""
+
+    def __init__(self, rate=None, job_rate=None):
+        self.rate = rate
+        self.job_rate = job_rate
+        self.bucket = TokenBucket(rate or 0, _burst(rate), tokens=0)
+        self._throttles = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def throttle(self, rate=None):
+        """Return a BandwidthThrottle for a new job, capped at `rate` if given"""
+        throttle = BandwidthThrottle(self, rate)
+        with self._lock:
+            self._throttles.add(throttle)
+        return throttle
+
+    def set_rate(self, rate):
+        """Change the global cap; running downloads follow within a read block"""
+        self.rate = rate
+        self.bucket.set_rate(rate or 0, _burst(rate))
+
+    def set_job_rate(self, rate):
+        """Change the default cap of every job without a cap of its own"""
+        self.job_rate = rate
+        with self._lock:
+            throttles = list(self._throttles)
+        for throttle in throttles:
+            if throttle.rate is None:
+                throttle._apply()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_bandwidth_limiter():
+    """Return the limiter shared by every download of this process"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = BandwidthLimiter()
+        return _limiter
+
+
+def parse_rate(text):
+    """Parse "500K", "2.5M" or a plain number of bytes per second; "0" or "" is unlimited"""
+    text = (text or "").strip().lower().removesuffix("/s").removesuffix("b")
+    if not text:
+        return None
+    unit = text[-1] if text[-1] in RATE_UNITS else ""
+    try:
+        value = float(text[:len(text) - len(unit)])
+    except ValueError:
+        raise ValueError(f"Invalid rate: {text!r} (use e.g. 500K or 2M)") from None
+    return int(value * RATE_UNITS[unit]) or None
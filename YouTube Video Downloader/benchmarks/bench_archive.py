@@ -0,0 +1,72 @@
+"""Measure the download archive with a large number of entries.
+
+Fills an archive with --entries finished downloads, then times opening it
+(which loads the in-memory ID index), membership checks, queueing a bulk
+job whose videos are all archived, queries and a prune pass.
+
+    python benchmarks/bench_archive.py --entries 100000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from archive import DownloadArchive  # noqa: E402
+from engine import InProcessEngine  # noqa: E402
+from download_queue import DownloadQueue, SKIPPED  # noqa: E402
+import stub_ytdlp  # noqa: E402
+
+
+def timed(label, func, count=None):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    rate = f"  {count / elapsed:12.0f} ops/s" if count else ""
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms{rate}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=1000000)
+    args = parser.parse_args()
+
+    ids = [f"a{n:010d}" for n in range(args.entries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "archive.sqlite3")
+        archive = DownloadArchive(path)
+        timed("insert", lambda: archive.record_many(
+            (video_id, "auto", os.path.join(tmp, f"{video_id}.mp4"), 1024, None) for video_id in ids),
+            args.entries)
+        archive.close()
+
+        archive = timed("open + load index", lambda: DownloadArchive(path))
+        probes = [ids[n % len(ids)] if n % 2 else f"m{n:010d}" for n in range(args.lookups)]
+        hits = timed("contains", lambda: sum(1 for video_id in probes if archive.contains(video_id)),
+                     args.lookups)
+        print(f"{'':<28} {hits} hits")
+
+        engine = InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL)
+        queue = DownloadQueue(tmp, engine=engine, archive=archive)
+        items = timed("queue bulk job (archived)", lambda: queue.add_many(
+            f"https://www.youtube.com/watch?v={video_id}" for video_id in ids), args.entries)
+        skipped = sum(1 for item in items if item.state == SKIPPED)
+        print(f"{'':<28} {skipped} of {len(items)} skipped without network access")
+
+        timed("query by video ID", lambda: [archive.get(ids[n]) for n in range(0, len(ids), 100)],
+              len(range(0, len(ids), 100)))
+        timed("query newest 100", lambda: archive.query(limit=100))
+        # None of the recorded files exist, so every entry is pruned
+        removed = timed("prune missing files", archive.prune)
+        print(f"{'':<28} {removed} removed, {len(archive)} left")
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
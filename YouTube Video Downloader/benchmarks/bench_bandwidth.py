@@ -0,0 +1,186 @@
+"""Check that bandwidth caps hold and that the disk write path is not slower.
+
+Downloads from the local media server go through ChunkedDownloader and a
+BandwidthLimiter, fed from the progress hook the way the download queue
+does it. Every scenario prints the measured rate next to the cap, plus OK
+or FAIL for the ±5% tolerance. The scenarios are:
+
+- a per-job cap;
+- a global cap shared by several jobs;
+- a cap raised halfway through a download.
+
+The write test then compares the current write path (a preallocated file,
+1 MB reads into one reused buffer, each written in one call) with the
+previous one (a sparse file, one 256 KB read and write at a time) at full
+speed. Both run --runs times, alternating; the medians are printed with
+their interquartile range, and only a drop of more than 5% that is also
+larger than that spread counts as a regression.
+
+    python benchmarks/bench_bandwidth.py --cap 8 --seconds 4 --jobs 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from bandwidth import BandwidthLimiter  # noqa: E402
+from chunked_download import ChunkedDownloader, ChunkedDownloadError  # noqa: E402
+from progress import DOWNLOADING  # noqa: E402
+from media_server import MediaServer, make_payload  # noqa: E402
+
+MB = 1024 * 1024
+TOLERANCE = 0.05
+LEGACY_READ_SIZE = 256 * 1024
+RUNS = 7
+MIN_SECONDS = 2  # the cap change needs a second half long enough to measure
+SETTLE = 0.5  # seconds skipped after the cap change, while the bucket refills
+
+
+class LegacyChunkedDownloader(ChunkedDownloader):
+    """The write path before preallocation and buffered writes, for comparison"""
+
+    def _fetch_chunk(self, index):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        with self._request(start=start, end=end) as response, open(self.part_path, "r+b") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = response.read(min(LEGACY_READ_SIZE, remaining))
+                if not data:
+                    raise ChunkedDownloadError(f"Connection closed early in chunk {index}")
+                f.write(data)
+                remaining -= len(data)
+                self._report(len(data))
+        with self._lock:
+            self._done[index] = True
+            self._save_state()
+
+
+def throttled_hook(throttle, samples=None):
+    def hook(event):
+        if event.status == DOWNLOADING:
+            throttle.update(event.downloaded_bytes)
+            if samples is not None:
+                samples.append((time.perf_counter(), event.downloaded_bytes))
+    return hook
+
+
+def download(url, path, hook, connections):
+    ChunkedDownloader(url, path, connections=connections, chunk_size=MB, progress_hook=hook).run()
+    os.remove(path)
+
+
+def report(label, rate, cap):
+    ok = abs(rate - cap) <= cap * TOLERANCE
+    print(f"{label:<34} {rate / MB:7.2f} MB/s  cap {cap / MB:6.2f} MB/s  {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def job_cap(server, tmp, cap, seconds, connections):
+    limiter = BandwidthLimiter()
+    size = int(cap * seconds)
+    server.add_file("/job.mp4", make_payload(size))
+    start = time.perf_counter()
+    download(server.url("/job.mp4"), os.path.join(tmp, "job.mp4"), throttled_hook(limiter.throttle(cap)),
+             connections)
+    return report(f"per-job cap, {connections} connections", size / (time.perf_counter() - start), cap)
+
+
+def global_cap(server, tmp, cap, seconds, jobs):
+    limiter = BandwidthLimiter(rate=cap)
+    size = int(cap * seconds / jobs)
+    server.add_file("/global.mp4", make_payload(size))
+    threads = [threading.Thread(target=download, args=(server.url("/global.mp4"), os.path.join(tmp, f"g{n}.mp4"),
+                                                       throttled_hook(limiter.throttle()), 2))
+               for n in range(jobs)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return report(f"global cap, {jobs} jobs", size * jobs / (time.perf_counter() - start), cap)
+
+
+def adjusted_cap(server, tmp, cap, seconds):
+    # Half the time at `cap`, then the rest of the file at twice the cap
+    limiter = BandwidthLimiter()
+    throttle = limiter.throttle(cap)
+    size = int(cap * seconds / 2 + 2 * cap * seconds / 2)
+    server.add_file("/adjust.mp4", make_payload(size))
+    samples = []
+    timer = threading.Timer(seconds / 2, throttle.set_rate, (2 * cap,))
+    timer.start()
+    download(server.url("/adjust.mp4"), os.path.join(tmp, "adjust.mp4"), throttled_hook(throttle, samples), 1)
+    if not samples:
+        print("cap doubled while downloading: no progress was reported  FAIL")
+        return False
+    changed = samples[0][0] + seconds / 2
+    after = [(t, n) for t, n in samples if t >= changed + SETTLE]
+    if len(after) < 2 or after[-1][0] <= after[0][0]:
+        print(f"cap doubled while downloading: only {len(after)} progress samples after the change, "
+              f"try a longer --seconds  FAIL")
+        return False
+    rate = (after[-1][1] - after[0][1]) / (after[-1][0] - after[0][0])
+    return report("cap doubled while downloading", rate, 2 * cap)
+
+
+def write_throughput(server, tmp, size, connections, runs=RUNS):
+    server.add_file("/write.mp4", make_payload(size))
+    samples = {"previous": [], "current": []}
+    # Alternate the two so both see the same conditions
+    for _ in range(runs):
+        for label, cls in (("previous", LegacyChunkedDownloader), ("current", ChunkedDownloader)):
+            path = os.path.join(tmp, f"write-{label}.mp4")
+            start = time.perf_counter()
+            cls(server.url("/write.mp4"), path, connections=connections, chunk_size=4 * MB).run()
+            samples[label].append(size / (time.perf_counter() - start))
+            os.remove(path)
+    rates, quartiles = {}, {}
+    for label, values in samples.items():
+        rates[label] = statistics.median(values)
+        quartiles[label] = statistics.quantiles(values, n=4)[::2] if len(values) > 1 else [values[0]] * 2
+        low, high = quartiles[label]
+        print(f"write path {label:<23} {rates[label] / MB:7.1f} MB/s  IQR {low / MB:7.1f}-{high / MB:7.1f} MB/s  "
+              f"({connections} connections, median of {runs})")
+    # A slower median alone is noise if the runs of both overlap
+    slower = rates["current"] < rates["previous"] * (1 - TOLERANCE)
+    return not (slower and quartiles["current"][1] < quartiles["previous"][0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cap", type=float, default=8, help="cap in MB/s")
+    parser.add_argument("--seconds", type=float, default=4,
+                        help=f"length of each capped download, at least {MIN_SECONDS}")
+    parser.add_argument("--jobs", type=int, default=4, help="parallel jobs under the global cap")
+    parser.add_argument("--write-size", type=int, default=256, help="MB written by the write test")
+    parser.add_argument("--runs", type=int, default=RUNS, help="runs of each write path")
+    args = parser.parse_args()
+    if args.seconds < MIN_SECONDS:
+        parser.error(f"--seconds must be at least {MIN_SECONDS}")
+
+    cap = args.cap * MB
+    with MediaServer() as server, tempfile.TemporaryDirectory() as tmp:
+        results = [
+            job_cap(server, tmp, cap, args.seconds, 1),
+            job_cap(server, tmp, cap, args.seconds, 4),
+            global_cap(server, tmp, cap, args.seconds, args.jobs),
+            adjusted_cap(server, tmp, cap, args.seconds),
+        ]
+        for connections in (1, 4):
+            if not write_throughput(server, tmp, args.write_size * MB, connections, args.runs):
+                print("write throughput regressed by more than 5% and more than the spread between runs")
+                results.append(False)
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Measure ranged download throughput at 1, 4 and 16 connections.
+
+The local media server caps every connection at --rate MB/s, like a CDN
+that limits single-connection throughput, so the aggregate rate should
+grow with the number of connections. With --resume the benchmark also
+checks that an interrupted download only re-fetches missing chunks.
+
+    python benchmarks/bench_chunked.py --size 64 --rate 8 --connections 1 4 16
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from chunked_download import ChunkedDownloader  # noqa: E402
+from media_server import MediaServer, make_payload  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def check_resume(server, tmp, expected):
+    """Interrupt a download half way and make sure the rerun skips done chunks"""
+    path = os.path.join(tmp, "resume.bin")
+    chunk_size = MB
+    n_chunks = len(expected) // chunk_size
+
+    def interrupt(event):
+        if event.percent and event.percent >= 50:
+            raise KeyboardInterrupt
+
+    try:
+        ChunkedDownloader(server.url("/video.mp4"), path, connections=1, chunk_size=chunk_size,
+                          progress_hook=interrupt).run()
+    except KeyboardInterrupt:
+        pass
+
+    del server.requests[:]
+    ChunkedDownloader(server.url("/video.mp4"), path, connections=4, chunk_size=chunk_size).run()
+    fetched = sum(1 for method, _, rng in server.requests if method == "GET" and rng != "bytes=0-0")
+    with open(path, "rb") as f:
+        intact = hashlib.sha256(f.read()).digest() == hashlib.sha256(expected).digest()
+    print(f"resume: re-fetched {fetched} of {n_chunks} chunks, file intact: {intact}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=64, help="file size in MB")
+    parser.add_argument("--rate", type=float, default=8, help="per-connection cap in MB/s (0 = none)")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--chunk-size", type=int, default=4, help="chunk size in MB")
+    parser.add_argument("--resume", action="store_true", help="also check resuming")
+    args = parser.parse_args()
+
+    payload = make_payload(args.size * MB)
+    rate = args.rate * MB if args.rate else None
+    with MediaServer({"/video.mp4": payload}, rate=rate) as server, tempfile.TemporaryDirectory() as tmp:
+        for connections in args.connections:
+            path = os.path.join(tmp, f"video-{connections}.mp4")
+            start = time.perf_counter()
+            ChunkedDownloader(server.url("/video.mp4"), path, connections=connections,
+                              chunk_size=args.chunk_size * MB).run()
+            elapsed = time.perf_counter() - start
+            print(f"{connections:3d} connections  {args.size / elapsed:8.1f} MB/s")
+            os.remove(path)
+        if args.resume:
+            check_resume(server, tmp, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare cold (subprocess) and warm (in-process) metadata lookup latency.
+
+Both backends are pointed at the stub extractor in stub_ytdlp.py, so the
+numbers only measure engine overhead and never touch the network.
+
+    python benchmarks/bench_engine.py --runs 20 [--real-import]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from engine import InProcessEngine, SubprocessEngine  # noqa: E402
+import stub_ytdlp  # noqa: E402
+
+
+def time_lookups(engine, runs):
+    timings = []
+    for n in range(runs):
+        start = time.perf_counter()
+        engine.extract_info(f"https://www.youtube.com/watch?v=stub{n:07d}")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<12} first {timings[0]:8.1f} ms   "
+          f"median {statistics.median(timings):8.1f} ms   "
+          f"mean {statistics.mean(timings):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--formats", type=int, default=40, help="formats per stub video")
+    parser.add_argument("--real-import", action="store_true",
+                        help="make each cold lookup import the real yt-dlp extractors")
+    args = parser.parse_args()
+
+    os.environ["STUB_FORMATS"] = str(args.formats)
+    if args.real_import:
+        os.environ["STUB_IMPORT_YTDLP"] = "1"
+
+    cold = SubprocessEngine(command=[sys.executable, os.path.join(HERE, "stub_ytdlp.py")])
+    warm = InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL)
+    if args.real_import:
+        # The in-process engine pays the import once, like the app at startup
+        import yt_dlp.extractor  # noqa: F401
+    warm.warm_up().result()
+
+    report("subprocess", time_lookups(cold, args.runs))
+    report("in-process", time_lookups(warm, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measure what recording progress in the job journal costs a download.
+
+Several threads each play one job and update its progress as fast as they
+can, the way the queue's progress callbacks do. "batched" is the JobJournal
+as the queue uses it, one commit per flush interval. "per update" commits
+every single update, the straightforward way to make progress durable, for
+comparison.
+
+    python benchmarks/bench_journal.py --jobs 8 --updates 2000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from journal import JobJournal  # noqa: E402
+from download_queue import DOWNLOADING, DONE  # noqa: E402
+
+
+class CommitEveryUpdate(JobJournal):
+    """Writes each update in its own transaction"""
+
+    def update(self, job_id, **fields):
+        super().update(job_id, **fields)
+        self.flush()
+
+
+def play(journal, job_id, updates):
+    for n in range(1, updates + 1):
+        journal.update(job_id, state=DOWNLOADING, progress=100.0 * n / updates, downloaded_bytes=n * 65536)
+    journal.update(job_id, state=DONE, progress=100.0)
+
+
+def run(cls, path, jobs, updates, interval):
+    journal = cls(path, flush_interval=interval)
+    job_ids = [journal.add(f"https://www.youtube.com/watch?v=j{n:010d}") for n in range(jobs)]
+    threads = [threading.Thread(target=play, args=(journal, job_id, updates)) for job_id in job_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.close()
+    elapsed = time.perf_counter() - start
+    # Everything has to be on disk after close()
+    reopened = JobJournal(path)
+    finished = len(reopened.query(state=DONE))
+    reopened.close()
+    os.remove(path)
+    return jobs * updates / elapsed, finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=2000, help="progress updates per job")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between batched commits")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.sqlite3")
+        for label, cls in (("per update", CommitEveryUpdate), ("batched", JobJournal)):
+            rate, finished = run(cls, path, args.jobs, args.updates, args.interval)
+            print(f"{label:<11} {rate:12,.0f} updates/s  {1e6 / rate:8.2f} us/update  "
+                  f"{finished}/{args.jobs} jobs recorded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare parsing `yt-dlp -J` output into a full dict and into a VideoInfo.
+
+"json.loads" keeps the whole document like the app used to, "VideoInfo"
+keeps only the summary and "pruned" also drops unused keys while decoding.
+
+For each recorded fixture (plus stub documents with many formats) this
+prints the parse time, the peak memory while parsing and the memory that
+stays resident per parsed video.
+
+    python benchmarks/bench_metadata.py --runs 200 --keep 200
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from metadata import VideoInfo  # noqa: E402
+import stub_ytdlp  # noqa: E402
+
+PARSERS = {
+    'json.loads': json.loads,
+    'VideoInfo': lambda text: VideoInfo.from_json(text, prune=False),
+    'pruned': VideoInfo.from_json,
+}
+
+
+def documents():
+    for path in sorted(glob.glob(os.path.join(HERE, "fixtures", "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            yield os.path.basename(path), f.read()
+    for n_formats in (40, 400):
+        yield f"stub, {n_formats} formats", json.dumps(stub_ytdlp.make_info(n_formats=n_formats))
+
+
+def parse_time(parse, text, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        parse(text)
+    return (time.perf_counter() - start) / runs
+
+
+def memory(parse, text, keep):
+    """Return (peak bytes while parsing one, resident bytes per kept result)"""
+    tracemalloc.start()
+    parse(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [parse(text) for _ in range(keep)]
+    resident = (tracemalloc.get_traced_memory()[0] - before) / keep
+    tracemalloc.stop()
+    del kept
+    return peak, resident
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200, help="parses timed per document")
+    parser.add_argument("--keep", type=int, default=200, help="parsed videos kept to measure resident memory")
+    args = parser.parse_args()
+
+    print(f"{'document':<24} {'size':>9} {'parser':<11} {'parse':>9} {'peak':>10} {'resident':>10}")
+    for name, text in documents():
+        for label, parse in PARSERS.items():
+            seconds = parse_time(parse, text, args.runs)
+            peak, resident = memory(parse, text, args.keep)
+            print(f"{name:<24} {len(text) / 1024:7.0f} KB {label:<11} {seconds * 1000:7.2f} ms "
+                  f"{peak / 1024:7.0f} KB {resident / 1024:7.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Measure how quickly playlist entries stream in and how much memory it takes.
+
+The stub playlist returns pages of 100 entries with a simulated latency per
+page; the report shows the time to the first entry, the total time and the
+peak Python memory while iterating.
+
+    python benchmarks/bench_playlist.py --size 1000 --page-latency 0.2
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from engine import InProcessEngine, SubprocessEngine  # noqa: E402
+from core import Downloader  # noqa: E402
+import stub_ytdlp  # noqa: E402
+
+
+def measure(name, downloader, url):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in downloader.iter_playlist(url):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name:<12} {count} entries  first {first * 1000:7.1f} ms  "
+          f"total {total:6.2f} s  peak {peak / 1024:8.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--page-latency", type=float, default=0.2, help="seconds per page of 100 entries")
+    args = parser.parse_args()
+
+    os.environ["STUB_PLAYLIST_SIZE"] = str(args.size)
+    os.environ["STUB_PAGE_LATENCY"] = str(args.page_latency)
+    url = "https://www.youtube.com/playlist?list=PLstubplaylist"
+
+    warm = InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL)
+    cold = SubprocessEngine(command=[sys.executable, os.path.join(HERE, "stub_ytdlp.py")])
+    measure("in-process", Downloader(engine=warm, cache=False), url)
+    measure("subprocess", Downloader(engine=cold, cache=False), url)
+
+
+if __name__ == "__main__":
+    main()
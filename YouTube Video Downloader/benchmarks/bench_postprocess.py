@@ -0,0 +1,93 @@
+"""Compare post-processing after the whole batch with the overlapped pipeline.
+
+"after" downloads every item through the queue and then runs the pipeline
+on each file in turn, like the separate scripts we used to run. "overlapped"
+gives the queue the pipeline, so finished files are processed in the
+PostProcessor's worker processes while the next ones download.
+
+Downloads come from the stub extractor. The default "hash" pipeline works on
+random bytes. Stages that run ffmpeg need real media, so with --media each
+download is a copy of a tiny clip generated with ffmpeg's test sources.
+
+    python benchmarks/bench_postprocess.py --items 16 --size 64
+    python benchmarks/bench_postprocess.py --media --pipeline "audio:mp3, tags:nocover, hash"
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from engine import InProcessEngine  # noqa: E402
+from download_queue import DownloadQueue, DONE  # noqa: E402
+from merge import find_ffmpeg  # noqa: E402
+from postprocess import PostProcessor, parse_pipeline, run_pipeline  # noqa: E402
+import stub_ytdlp  # noqa: E402
+
+
+def make_clip(path, seconds):
+    """A small H.264 + AAC clip of color bars and a tone"""
+    subprocess.run([
+        find_ffmpeg(), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc=duration={seconds}:size=320x180:rate=25",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def run(engine, directory, args, overlapped):
+    pipeline = parse_pipeline(args.pipeline)
+    processor = PostProcessor(args.processes)
+    queue = DownloadQueue(directory, workers=args.workers, engine=engine,
+                          postprocessor=processor, pipeline=pipeline if overlapped else ())
+    start = time.perf_counter()
+    queue.add_many(f"https://www.youtube.com/watch?v=p{n:010d}" for n in range(args.items))
+    queue.wait()
+    downloaded = time.perf_counter() - start
+    if not overlapped:
+        for item in queue.items:
+            if item.state == DONE:
+                run_pipeline(item.path, pipeline)
+    elapsed = time.perf_counter() - start
+    processor.shutdown()
+    failed = [item.error for item in queue.items if item.state != DONE]
+    return downloaded, elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="parallel downloads")
+    parser.add_argument("--processes", type=int, default=None, help="post-processing workers (default: CPUs)")
+    parser.add_argument("--size", type=int, default=64, help="MB per download (without --media)")
+    parser.add_argument("--delay", type=float, default=0.005, help="seconds per 1%% of a download")
+    parser.add_argument("--pipeline", default="hash")
+    parser.add_argument("--media", action="store_true", help="download a generated clip (needs ffmpeg)")
+    parser.add_argument("--seconds", type=int, default=10, help="length of the generated clip")
+    args = parser.parse_args()
+
+    os.environ["STUB_DELAY"] = str(args.delay)
+    os.environ["STUB_SIZE"] = str(args.size * 1024 * 1024)
+    os.environ["STUB_WRITE"] = "1"
+    engine = InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL, workers=args.workers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.media:
+            os.environ["STUB_MEDIA"] = os.path.join(tmp, "clip.mp4")
+            make_clip(os.environ["STUB_MEDIA"], args.seconds)
+        print(f"{args.items} items, pipeline {args.pipeline!r}, {args.processes or os.cpu_count()} processes")
+        for label, overlapped in (("after", False), ("overlapped", True)):
+            directory = os.path.join(tmp, label)
+            os.makedirs(directory)
+            downloaded, elapsed, failed = run(engine, directory, args, overlapped)
+            print(f"{label:<11} downloads done {downloaded:6.2f} s  all done {elapsed:6.2f} s"
+                  + (f"  {len(failed)} failed: {failed[0]}" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Count how many progress updates reach a UI consumer through the queue.
+
+Fast downloads report thousands of progress events; the queue should
+coalesce them so the listener sees at most ~10 updates per second per job.
+
+    python benchmarks/bench_progress.py --steps 20000 --jobs 4 [--subprocess]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from engine import InProcessEngine, SubprocessEngine  # noqa: E402
+from download_queue import DownloadQueue  # noqa: E402
+import stub_ytdlp  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=20000, help="progress events per download")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.0001, help="seconds between events")
+    parser.add_argument("--subprocess", action="store_true", help="parse --progress-template output")
+    args = parser.parse_args()
+
+    os.environ["STUB_STEPS"] = str(args.steps)
+    os.environ["STUB_DELAY"] = str(args.delay)
+    if args.subprocess:
+        engine = SubprocessEngine(command=[sys.executable, os.path.join(HERE, "stub_ytdlp.py")])
+    else:
+        engine = InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL)
+
+    updates = 0
+    events = 0
+    lock = threading.Lock()
+
+    def on_update(item):
+        nonlocal updates
+        with lock:
+            updates += 1
+
+    def on_progress(event):
+        nonlocal events
+        with lock:
+            events += 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = DownloadQueue(tmp, workers=args.jobs, engine=engine, on_update=on_update, on_progress=on_progress)
+        start = time.perf_counter()
+        queue.add_many(f"https://www.youtube.com/watch?v=p{n:010d}" for n in range(args.jobs))
+        queue.wait()
+        elapsed = time.perf_counter() - start
+
+    produced = args.jobs * (args.steps + 2)
+    print(f"{produced} events produced in {elapsed:.2f} s, {events} forwarded, "
+          f"{updates} UI updates ({updates / elapsed / args.jobs:.1f} per second and job)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Measure download queue throughput for different worker counts.
+
+Each item pays a simulated metadata latency and a simulated transfer time
+through the stub extractor, so throughput should grow linearly with the
+worker count.
+
+    python benchmarks/bench_queue.py --items 64 --workers 1 2 4 8 16
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from engine import InProcessEngine  # noqa: E402
+from download_queue import DownloadQueue  # noqa: E402
+import stub_ytdlp  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per metadata lookup")
+    parser.add_argument("--delay", type=float, default=0.0005, help="seconds per 1%% of a download")
+    args = parser.parse_args()
+
+    os.environ["STUB_LATENCY"] = str(args.latency)
+    os.environ["STUB_DELAY"] = str(args.delay)
+    os.environ["STUB_SIZE"] = "1000000"
+    engine = InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL, workers=max(args.workers))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            queue = DownloadQueue(tmp, workers=workers, engine=engine)
+            start = time.perf_counter()
+            queue.add_many(f"https://www.youtube.com/watch?v=q{n:010d}" for n in range(args.items))
+            queue.wait()
+            elapsed = time.perf_counter() - start
+            print(f"{workers:3d} workers  {elapsed:7.2f} s  {args.items / elapsed:8.1f} items/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Check the shared rate limiter against a local server that answers 429/403.
+
+Runs these scenarios and prints the limiter metrics of each: many threads
+sharing one token bucket, a 429 with Retry-After, a 403 with it, 403s
+without it (not retried unless the policy lists 403), 429s without it
+(exponential backoff with jitter) and a call that gives up after its
+RetryPolicy runs out of attempts.
+
+    python benchmarks/bench_ratelimit.py --rate 20 --threads 8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from chunked_download import ChunkedDownloader, ChunkedDownloadError  # noqa: E402
+from engine import EngineError  # noqa: E402
+from ratelimit import RateLimiter, RetryPolicy, http_status  # noqa: E402
+from media_server import MediaServer, make_payload  # noqa: E402
+
+SIZE = 1024 * 1024
+
+
+def shared_bucket(rate, threads, calls):
+    limiter = RateLimiter(rate=rate, burst=1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda n: limiter.call(lambda: None), range(threads * calls)))
+    elapsed = time.perf_counter() - start
+    print(f"shared bucket: {threads * calls} calls from {threads} threads at "
+          f"{threads * calls / elapsed:.1f}/s (limit {rate}/s)")
+
+
+def fetch(limiter, server, tmp, policy=None):
+    path = os.path.join(tmp, "video.mp4")
+    start = time.perf_counter()
+    try:
+        # A fresh downloader per attempt, like a queue item starting over
+        limiter.call(lambda: ChunkedDownloader(server.url("/video.mp4"), path, connections=2,
+                                               chunk_size=SIZE // 4).run(), policy=policy)
+        outcome = "ok"
+    except ChunkedDownloadError as e:
+        outcome = f"gave up ({e})"
+    finally:
+        for name in (path, path + ".part", path + ".chunks.json"):
+            if os.path.exists(name):
+                os.remove(name)
+    return outcome, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=10, help="calls per thread")
+    args = parser.parse_args()
+
+    shared_bucket(args.rate, args.threads, args.calls)
+    status = http_status(EngineError("ERROR: unable to download video data: HTTP Error 429: Too Many Requests"))
+    print(f"yt-dlp error message parsed as {status}")
+
+    policy = RetryPolicy(max_attempts=4, base_delay=0.2, max_delay=2)
+    with MediaServer({"/video.mp4": make_payload(SIZE)}) as server, tempfile.TemporaryDirectory() as tmp:
+        scenarios = [
+            ("429 + Retry-After: 1", 429, {"Retry-After": "1"}, 1, policy),
+            ("403 + Retry-After: 1", 403, {"Retry-After": "1"}, 1, policy),
+            ("403 x2, no Retry-After", 403, {}, 2, policy),
+            ("403 x2, opted in", 403, {}, 2, RetryPolicy(max_attempts=4, base_delay=0.2, max_delay=2,
+                                                         statuses=(429, 403))),
+            ("429 x2, no Retry-After", 429, {}, 2, policy),
+            ("429 x5, 3 attempts", 429, {}, 5, RetryPolicy(max_attempts=3, base_delay=0.1)),
+        ]
+        for label, code, headers, count, scenario_policy in scenarios:
+            del server.requests[:]
+            server.fail_with(code, headers, count)
+            limiter = RateLimiter(rate=0, policy=scenario_policy)
+            outcome, elapsed = fetch(limiter, server, tmp)
+            with server.httpd.lock:
+                server.httpd.status_queue.clear()
+            print(f"{label:<24} {elapsed:5.2f} s  {outcome}  {limiter.metrics.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
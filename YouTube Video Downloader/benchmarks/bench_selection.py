@@ -0,0 +1,40 @@
+"""Show and time the stream selection for every recorded `-J` fixture.
+
+    python benchmarks/bench_selection.py --rules "<=1080p, prefer av1 then vp9, max 2 GB"
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from format_selection import SelectionRules, select_pair, merge_container  # noqa: E402
+
+FIXTURES = os.path.join(HERE, "fixtures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", default="")
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+
+    rules = SelectionRules.parse(args.rules)
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            info = json.load(f)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            video, audio = select_pair(info, rules)
+        elapsed = (time.perf_counter() - start) / args.runs * 1e6
+        picked = f"{video['format_id']}+{audio['format_id']} -> {merge_container(video, audio, rules)}" \
+            if audio else video['format_id']
+        print(f"{os.path.basename(path):<24} {picked:<20} {elapsed:8.1f} us/selection")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Measure how long the GUI takes to start, in a fresh interpreter per run.
+
+"import" is the time until `import main` returns, "first frame" until the
+window is mapped and drawn, and "interactive" until the background yt-dlp
+check has finished. "deferred" lists the heavy modules that were not yet
+loaded when the first frame was drawn; PIL, requests and yt_dlp should
+all be there.
+
+Every run gets an empty data directory and the app's caches live in a
+temporary directory too (through XDG_DATA_HOME and XDG_CACHE_HOME), so the
+user's own job journal and archive are never opened and no queued
+downloads are resumed. Warm runs share one cache, filled by an untimed
+first run; --cold gives every run an empty one.
+
+Needs a display (e.g. `xvfb-run`); without one only the import is timed.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+
+HEAVY_MODULES = ("PIL", "requests", "yt_dlp", "urllib.request")
+TIMEOUT = 60
+
+# Runs in the child; prints one JSON line. Times are seconds since `start`,
+# which is taken before any of the app's modules are imported.
+CHILD = r"""
+import sys, time, json
+start = time.perf_counter()
+import main
+result = {'import': time.perf_counter() - start}
+try:
+    import tkinter as tk
+    root = tk.Tk()
+except Exception as e:  # no display
+    result['error'] = str(e)
+    result['deferred'] = [m for m in HEAVY_MODULES if m not in sys.modules]
+    print(json.dumps(result))
+    sys.exit(0)
+
+def on_map(event):
+    if 'first_frame' not in result:
+        root.update_idletasks()
+        result['first_frame'] = time.perf_counter() - start
+        result['deferred'] = [m for m in HEAVY_MODULES if m not in sys.modules]
+
+def wait_ready():
+    if app.ytdlp_ready and 'first_frame' in result:
+        result['interactive'] = time.perf_counter() - start
+        root.destroy()
+    else:
+        root.after(5, wait_ready)
+
+root.bind("<Map>", on_map)
+app = main.YouTubeDownloaderApp(root)
+root.after(5, wait_ready)
+root.mainloop()
+print(json.dumps(result))
+"""
+
+
+def run_once(cache_dir):
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ, XDG_DATA_HOME=data_dir, XDG_CACHE_HOME=cache_dir)
+        code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + CHILD
+        output = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR, env=env,
+                                capture_output=True, text=True, timeout=TIMEOUT, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_cold():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        return run_once(cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--cold", action="store_true", help="start without a cached yt-dlp version")
+    args = parser.parse_args()
+
+    if args.cold:
+        results = [run_cold() for _ in range(args.runs)]
+    else:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            run_once(cache_dir)
+            results = [run_once(cache_dir) for _ in range(args.runs)]
+    if "error" in results[0]:
+        print(f"No display ({results[0]['error']}), timing the import only")
+
+    for phase in ("import", "first_frame", "interactive"):
+        times = [r[phase] for r in results if phase in r]
+        if times:
+            print(f"{phase.replace('_', ' '):<12} median {statistics.median(times) * 1000:7.1f} ms  "
+                  f"max {max(times) * 1000:7.1f} ms")
+    print(f"deferred     {', '.join(results[-1].get('deferred', [])) or 'nothing'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Measure URL list import speed: the regex checks against the urllib.parse normalizer.
+
+A file of --lines lines is generated from every URL form the app accepts
+(watch with extra parameters, youtu.be, shorts, embed, live, mobile,
+playlists, channels), with repeated videos, blank lines, comments and junk
+mixed in. "previous" validates and cleans each line with the regexes the
+app used before, "normalizer" streams the file through iter_url_file().
+Both report lines per second, how many URLs they kept and how many of
+those are unique videos.
+
+    python benchmarks/bench_urls.py --lines 1000000
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from urls import iter_url_file, extract_video_id  # noqa: E402
+
+TEMPLATES = [
+    "https://www.youtube.com/watch?v={id}",
+    "https://www.youtube.com/watch?v={id}&list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf&index=4&t=42s",
+    "https://youtu.be/{id}?si=Xq3a7bC9dE1fG2hI",
+    "https://m.youtube.com/watch?feature=share&v={id}",
+    "https://www.youtube.com/shorts/{id}",
+    "https://www.youtube.com/embed/{id}?start=10&autoplay=1",
+    "https://www.youtube.com/live/{id}?feature=shared",
+    "youtube.com/watch?v={id}",
+    "https://www.youtube.com/playlist?list=PL{id}",
+    "https://www.youtube.com/@channel{n}/videos",
+    "https://example.com/watch?v={id}",
+    "not a url {n}",
+    "# comment {n}",
+    "",
+]
+ID_CHARS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+
+# The checks urls.py made before the normalizer
+def legacy_is_playlist_url(url):
+    playlist_regex = r'(https?://)?(www\.|m\.)?youtube\.com/(playlist\?(.*&)?list=|channel/|c/|user/|@)[\w.-]+'
+    return re.match(playlist_regex, url) is not None
+
+
+def legacy_is_valid_youtube_url(url):
+    youtube_regex = r'(https?://)?(www\.)?(youtube\.com/watch\?v=|youtu\.be/|youtube\.com/shorts/)[\w-]+'
+    return re.match(youtube_regex, url) is not None or legacy_is_playlist_url(url)
+
+
+def legacy_extract_video_id(url):
+    patterns = [
+        r"youtu\.be/([A-Za-z0-9_-]{11})",
+        r"youtube\.com/watch\?v=([A-Za-z0-9_-]{11})",
+        r"youtube\.com/shorts/([A-Za-z0-9_-]{11})",
+        r"youtube\.com/embed/([A-Za-z0-9_-]{11})"
+    ]
+    for pat in patterns:
+        match = re.search(pat, url)
+        if match:
+            return match.group(1)
+    match = re.search(r"[?&]v=([A-Za-z0-9_-]{11})", url)
+    return match.group(1) if match else None
+
+
+def legacy_clean_youtube_url(url):
+    video_id = legacy_extract_video_id(url)
+    return f"https://www.youtube.com/watch?v={video_id}" if video_id else url
+
+
+def legacy_import(path):
+    # The old batch file reader: strip, skip comments, validate, clean
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and legacy_is_valid_youtube_url(line):
+                yield legacy_clean_youtube_url(line)
+
+
+def write_input(path, lines, videos, seed=0):
+    rng = random.Random(seed)
+    ids = ["".join(rng.choice(ID_CHARS) for _ in range(11)) for _ in range(videos)]
+    with open(path, "w", encoding="utf-8") as f:
+        for n in range(lines):
+            f.write(rng.choice(TEMPLATES).format(id=rng.choice(ids), n=n) + "\n")
+
+
+def run(label, urls, lines):
+    start = time.perf_counter()
+    kept = list(urls)
+    elapsed = time.perf_counter() - start
+    videos = {extract_video_id(url) for url in kept} - {None}
+    print(f"{label:<11} {lines / elapsed:12,.0f} lines/s  {elapsed:6.2f} s  "
+          f"{len(kept):9,} URLs kept  {len(videos):9,} unique videos")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--videos", type=int, default=200_000, help="distinct video IDs in the input")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "urls.txt")
+        write_input(path, args.lines, args.videos)
+        print(f"{args.lines:,} lines, {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+        run("previous", legacy_import(path), args.lines)
+        run("normalizer", iter_url_file(path), args.lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Local HTTP server that serves generated media with Range support.
+
+Each response can be throttled per connection to reproduce the
+single-connection throughput limit seen on real CDN links, and every
+request is counted so callers can check which ranges were fetched.
+"""
+import os
+import re
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+BLOCK_SIZE = 64 * 1024
+
+
+def make_payload(size, seed=b"ytd-bench"):
+    """Deterministic, non-compressible-looking payload of `size` bytes"""
+    block = (seed * (BLOCK_SIZE // len(seed) + 1))[:BLOCK_SIZE]
+    block = bytes((b + i) % 256 for i, b in enumerate(block))
+    return (block * (size // BLOCK_SIZE + 1))[:size]
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, head_only):
+        server = self.server
+        payload = server.files.get(self.path.split("?", 1)[0])
+        if payload is None:
+            self.send_error(404)
+            return
+        with server.lock:
+            server.requests.append((self.command, self.path, self.headers.get("Range")))
+            status = server.status_queue.pop(0) if server.status_queue else None
+        if status:
+            code, headers = status
+            self.send_response(code)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start, end = 0, len(payload) - 1
+        match = RANGE_RE.match(self.headers.get("Range", ""))
+        if match and server.ranges:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes" if server.ranges else "none")
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head_only:
+            return
+
+        # Throttle each connection to `rate` bytes per second
+        view = memoryview(payload)[start:end + 1]
+        began = time.perf_counter()
+        for offset in range(0, len(view), BLOCK_SIZE):
+            self.wfile.write(view[offset:offset + BLOCK_SIZE])
+            if server.rate:
+                ahead = (offset + BLOCK_SIZE) / server.rate - (time.perf_counter() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def do_GET(self):
+        try:
+            self._send(False)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_HEAD(self):
+        self._send(True)
+
+
+class MediaServer:
+    """Context manager running a MediaHandler server on a free local port.
+
+    `rate` limits every connection to that many bytes per second, `ranges`
+    turns Range support off when False, and `fail_with(code, headers)`
+    queues error responses (e.g. 429 with Retry-After) for the next
+    requests.
+    """
+
+    def __init__(self, files=None, rate=None, ranges=True):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.files = dict(files or {})
+        self.httpd.rate = rate
+        self.httpd.ranges = ranges
+        self.httpd.requests = []
+        self.httpd.status_queue = []
+        self.httpd.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def add_file(self, path, payload):
+        self.httpd.files[path] = payload
+
+    def set_rate(self, rate):
+        self.httpd.rate = rate
+
+    def fail_with(self, code, headers=None, count=1):
+        with self.httpd.lock:
+            self.httpd.status_queue.extend([(code, headers or {})] * count)
+
+    def url(self, path):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}{path}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    size = int(os.environ.get("MEDIA_SIZE", str(64 * 1024 * 1024)))
+    with MediaServer({"/video.mp4": make_payload(size)}) as server:
+        print(f"Serving {size} bytes at {server.url('/video.mp4')} (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
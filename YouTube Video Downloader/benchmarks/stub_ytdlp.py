@@ -0,0 +1,256 @@
+"""Stand-in for yt-dlp used by the benchmarks.
+
+It can be used in-process (the `YoutubeDL` class mimics the parts of the
+yt-dlp API the engine relies on) or run as a script that understands the
+same `--version`, `-J` and download command lines as `python -m yt_dlp`.
+Set STUB_IMPORT_YTDLP=1 to also import the real yt-dlp extractors on start,
+which reproduces the import cost a real cold lookup pays, and
+STUB_WRITE=1 to write a file of STUB_SIZE random bytes (or a copy of the
+media file named by STUB_MEDIA) for every in-process download, for
+benchmarks that process the downloaded files.
+
+STUB_FIXTURE names a recorded `-J` document (see fixtures/) that lookups
+return instead of a generated one. With STUB_SOURCE set to the URL of a
+file on the local media server, downloads really fetch it and report
+progress per block as the bytes arrive, like yt-dlp's HTTP downloader.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+
+__version__ = "stub"
+
+VIDEO_HEIGHTS = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+VIDEO_CODECS = ["avc1.4d401e", "vp9", "av01.0.08M.08"]
+AUDIO_FORMATS = [(48, "m4a", "mp4a.40.5"), (70, "webm", "opus"), (129, "m4a", "mp4a.40.2"), (160, "webm", "opus")]
+
+
+def make_info(video_id="dQw4w9WgXcQ", n_formats=40, seed=0):
+    """Build a `-J` style document with roughly `n_formats` formats"""
+    rng = random.Random(seed)
+    formats = []
+    for i in range(n_formats):
+        kind = i % 4
+        height = VIDEO_HEIGHTS[i % len(VIDEO_HEIGHTS)]
+        fmt = {
+            'format_id': str(100 + i),
+            'url': f"https://rr1---sn-stub.googlevideo.com/videoplayback?id={video_id}&itag={100 + i}",
+            'protocol': "https",
+            'filesize': rng.randint(1, 400) * 1024 * 1024,
+            'http_headers': {'User-Agent': "Mozilla/5.0"},
+            'fragments': [{'path': f"sq/{n}"} for n in range(rng.randint(0, 20))],
+        }
+        if kind == 0:
+            abr, ext, acodec = AUDIO_FORMATS[i % len(AUDIO_FORMATS)]
+            fmt.update({'ext': ext, 'vcodec': "none", 'acodec': acodec, 'abr': abr,
+                        'tbr': abr, 'asr': 48000, 'audio_channels': 2})
+        else:
+            vcodec = VIDEO_CODECS[i % len(VIDEO_CODECS)]
+            fmt.update({'ext': "webm" if vcodec == "vp9" else "mp4", 'vcodec': vcodec,
+                        'width': height * 16 // 9, 'height': height,
+                        'fps': rng.choice([24, 30, 60]), 'vbr': height * 3.5,
+                        'tbr': height * 3.5,
+                        'acodec': "mp4a.40.2" if kind == 1 else "none"})
+        formats.append(fmt)
+    return {
+        'id': video_id,
+        'title': f"Stub video {video_id}",
+        'thumbnail': f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg",
+        'thumbnails': [{'url': f"https://i.ytimg.com/vi/{video_id}/{n}.jpg", 'id': str(n)} for n in range(40)],
+        'description': "Lorem ipsum dolor sit amet. " * 200,
+        'duration': 212,
+        'uploader': "Stub Channel",
+        'channel_id': "UCstubstubstubstubstubst",
+        'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+        'extractor': "youtube",
+        'formats': formats,
+        'automatic_captions': {lang: [{'ext': "vtt", 'url': f"https://example.invalid/{lang}"}]
+                               for lang in ("en", "de", "fr", "es", "ja", "pt", "ru", "it")},
+    }
+
+
+_fixtures = {}
+
+
+def load_info(video_id):
+    """The STUB_FIXTURE document if one is set, else a generated one"""
+    path = os.environ.get("STUB_FIXTURE")
+    if not path:
+        return make_info(video_id, int(os.environ.get("STUB_FORMATS", "40")))
+    text = _fixtures.get(path)
+    if text is None:
+        with open(path, encoding="utf-8") as f:
+            text = _fixtures[path] = f.read()
+    # A fresh document per lookup, as the extractor would build
+    return json.loads(text)
+
+
+def iter_playlist_entries(playlist_id, size=None, page_size=100):
+    """Yield flat playlist entries a page at a time, like the YouTube tab extractor"""
+    size = int(os.environ.get("STUB_PLAYLIST_SIZE", "1000")) if size is None else size
+    for n in range(size):
+        if n % page_size == 0:
+            time.sleep(float(os.environ.get("STUB_PAGE_LATENCY", "0")))
+        video_id = f"{playlist_id[:4]}{n:07d}"
+        yield {
+            '_type': "url",
+            'ie_key': "Youtube",
+            'id': video_id,
+            'url': f"https://www.youtube.com/watch?v={video_id}",
+            'title': f"Playlist entry {n}",
+            'duration': 60 + n % 600,
+        }
+
+
+def progress_dicts(total=None, steps=None):
+    """Yield yt-dlp style progress hook dictionaries for one download"""
+    total = int(os.environ.get("STUB_SIZE", str(10 * 1024 * 1024))) if total is None else total
+    steps = int(os.environ.get("STUB_STEPS", "100")) if steps is None else steps
+    delay = float(os.environ.get("STUB_DELAY", "0"))
+    started = time.monotonic()
+    for n in range(steps + 1):
+        done = total * n // steps
+        elapsed = time.monotonic() - started
+        speed = done / elapsed if elapsed > 0 else None
+        yield {
+            'status': "downloading",
+            'downloaded_bytes': done,
+            'total_bytes': total,
+            'speed': speed,
+            'eta': int((total - done) / speed) if speed else None,
+            'fragment_index': n,
+            'fragment_count': steps,
+            'elapsed': elapsed,
+        }
+        if delay:
+            time.sleep(delay)
+    yield {'status': "finished", 'downloaded_bytes': total, 'total_bytes': total,
+           'elapsed': time.monotonic() - started}
+
+
+def transfer_dicts(source, filepath, block_size=None):
+    """Download `source` into `filepath`, yielding a progress dict per block"""
+    import urllib.request
+    block_size = block_size or int(os.environ.get("STUB_BLOCK_SIZE", str(256 * 1024)))
+    started = time.monotonic()
+    done = 0
+    with urllib.request.urlopen(source) as response, open(filepath, "wb") as f:
+        total = int(response.headers.get("Content-Length") or 0) or None
+        while True:
+            block = response.read(block_size)
+            if not block:
+                break
+            f.write(block)
+            done += len(block)
+            elapsed = time.monotonic() - started
+            speed = done / elapsed if elapsed > 0 else None
+            yield {
+                'status': "downloading",
+                'downloaded_bytes': done,
+                'total_bytes': total,
+                'speed': speed,
+                'eta': int((total - done) / speed) if speed and total else None,
+                'elapsed': elapsed,
+                'filename': filepath,
+            }
+    yield {'status': "finished", 'downloaded_bytes': done, 'total_bytes': done,
+           'elapsed': time.monotonic() - started, 'filename': filepath}
+
+
+def download_dicts(filepath):
+    """Progress of one download, fetching STUB_SOURCE into `filepath` when it is set"""
+    if os.environ.get("STUB_SOURCE"):
+        return transfer_dicts(os.environ["STUB_SOURCE"], filepath)
+    return progress_dicts()
+
+
+def _video_id(url):
+    return url.rsplit("v=", 1)[-1][:11] if "v=" in url else "dQw4w9WgXcQ"
+
+
+class YoutubeDL:
+    """Minimal in-process replacement for yt_dlp.YoutubeDL"""
+
+    __version__ = __version__
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, url, download=False, process=True):
+        time.sleep(float(os.environ.get("STUB_LATENCY", "0")))
+        if "list=" in url:
+            playlist_id = url.rsplit("list=", 1)[-1]
+            return {'_type': "playlist", 'id': playlist_id, 'title': f"Stub playlist {playlist_id}",
+                    'entries': iter_playlist_entries(playlist_id)}
+        return load_info(_video_id(url))
+
+    @staticmethod
+    def sanitize_info(info):
+        return info
+
+    def process_ie_result(self, ie_result, download=True, extra_info=None):
+        if download:
+            self.download([ie_result['webpage_url']])
+        return ie_result
+
+    def download(self, urls):
+        video_id = _video_id(urls[0])
+        filepath = self.params.get('outtmpl', "%(title)s [%(id)s].%(ext)s") % {
+            'id': video_id, 'title': f"Stub video {video_id}", 'ext': "mp4"}
+        for d in download_dicts(filepath):
+            for hook in self.params.get('progress_hooks', []):
+                hook(d)
+        if os.environ.get("STUB_SOURCE"):
+            pass  # already fetched by download_dicts()
+        elif os.environ.get("STUB_MEDIA"):
+            shutil.copyfile(os.environ["STUB_MEDIA"], filepath)
+        elif os.environ.get("STUB_WRITE") == "1":
+            with open(filepath, "wb") as f:
+                f.write(random.Random(video_id).randbytes(int(os.environ.get("STUB_SIZE", str(10 * 1024 * 1024)))))
+        for hook in self.params.get('post_hooks', []):
+            hook(filepath)
+        return 0
+
+
+def main(argv):
+    if os.environ.get("STUB_IMPORT_YTDLP") == "1":
+        import yt_dlp.extractor  # noqa: F401
+    if "--version" in argv:
+        print(__version__)
+        return 0
+    if "--flat-playlist" in argv:
+        for entry in iter_playlist_entries(argv[-1].rsplit("list=", 1)[-1]):
+            print(json.dumps(entry), flush=True)
+        return 0
+    if "-J" in argv:
+        json.dump(load_info(_video_id(argv[-1])), sys.stdout)
+        return 0
+    template = argv[argv.index("--progress-template") + 1] if "--progress-template" in argv else None
+    output = argv[argv.index("-o") + 1] if "-o" in argv else "%(title)s [%(id)s].%(ext)s"
+    info = {'id': _video_id(argv[-1]), 'title': f"Stub video {_video_id(argv[-1])}", 'ext': "mp4"}
+    for d in download_dicts(output % info):
+        if template:
+            # Same output as yt-dlp for "download:<prefix>%(progress)j"
+            print(template.split(":", 1)[1].replace("%(progress)j", json.dumps(d)), flush=True)
+        elif d['status'] == "downloading" and d['total_bytes']:
+            percent = d['downloaded_bytes'] * 100.0 / d['total_bytes']
+            print(f"[download] {percent:5.1f}% of ~{d['total_bytes'] / 1048576:.2f}MiB "
+                  f"at  5.00MiB/s ETA 00:{d['eta'] or 0:02d}", flush=True)
+    if "--print" in argv:
+        # Only "after_move:<prefix>%(filepath)s" is supported
+        when, template = argv[argv.index("--print") + 1].split(":", 1)
+        print(template.replace("%(filepath)s", output % info), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
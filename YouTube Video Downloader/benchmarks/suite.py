@@ -0,0 +1,344 @@
+"""Run the offline benchmark suite and save the results as JSON.
+
+Everything runs against local stand-ins: stub_ytdlp.py plays yt-dlp, both
+in-process and as the `python -m yt_dlp` subprocess, and media_server.py
+serves the media with Range support. Nothing touches YouTube. Scenarios:
+
+- metadata: lookup latency through Downloader.fetch_video_info for each
+  document, with both engines;
+- formats: parsing a `-J` document into a VideoInfo, and picking the "auto"
+  video + audio pair;
+- download: MB/s of full Downloader.download() calls, through yt-dlp's
+  progress hooks, the subprocess progress output and the chunked
+  downloader;
+- ui: the rate at which queue updates reach a polled Scheduler, and the
+  time each poll tick blocks, in a headless copy of the Tk poll loop;
+- urls: URLs cleaned and validated per second, and normalized as a URL file
+  import does.
+
+Documents are the recorded fixtures in fixtures/ plus generated ones with
+40, 400 and 2000 formats. Each scenario runs in its own process, so its
+peak RSS is its own. Results go to results/suite-<time>.json unless
+--output is given. --compare prints the change of every number from an
+earlier run.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --only metadata formats --compare results/suite-20260101-120000.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import stub_ytdlp  # noqa: E402
+
+SCENARIOS = ("metadata", "formats", "download", "ui", "urls")
+GENERATED_FORMATS = (40, 400, 2000)
+POLL_INTERVAL_MS = 50  # as in main.py
+MB = 1024 * 1024
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, None where unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarize(timings):
+    """Median and 95th percentile of `timings` (seconds) in milliseconds"""
+    timings = sorted(timings)
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+    }
+
+
+def timed(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def documents(directory):
+    """(name, path) of every recorded fixture and of the generated documents"""
+    for path in sorted(glob.glob(os.path.join(HERE, "fixtures", "*.json"))):
+        yield os.path.splitext(os.path.basename(path))[0], path
+    for n_formats in GENERATED_FORMATS:
+        path = os.path.join(directory, f"stub-{n_formats}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(stub_ytdlp.make_info(n_formats=n_formats), f)
+        yield f"stub-{n_formats}-formats", path
+
+
+def engines():
+    from engine import InProcessEngine, SubprocessEngine
+    return {
+        'in-process': InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL),
+        'subprocess': SubprocessEngine(command=[sys.executable, os.path.join(HERE, "stub_ytdlp.py")]),
+    }
+
+
+def downloader(directory, engine):
+    # Only the code under test: no cache, archive, journal or limits
+    from core import Downloader
+    return Downloader(directory, engine=engine, cache=False, archive=False, limiter=False, bandwidth=False,
+                      journal=False)
+
+
+def run_metadata(args, tmp):
+    results = {}
+    for name, path in documents(tmp):
+        os.environ["STUB_FIXTURE"] = path
+        result = results[name] = {'size_kb': round(os.path.getsize(path) / 1024, 1)}
+        for label, engine in engines().items():
+            app = downloader(tmp, engine)
+            url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+            app.fetch_video_info(url)  # warm up
+            runs = args.runs if label == "in-process" else args.subprocess_runs
+            result[label] = summarize(timed(lambda: app.fetch_video_info(url), runs))
+    return results
+
+
+def run_formats(args, tmp):
+    from metadata import VideoInfo
+    from format_selection import select_pair
+    results = {}
+    for name, path in documents(tmp):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        info = json.loads(text)
+        results[name] = {
+            'formats': len(info.get('formats') or ()),
+            'parse': summarize(timed(lambda: VideoInfo.from_json(text), args.runs)),
+            'select': summarize(timed(lambda: select_pair(info), args.runs)),
+        }
+    return results
+
+
+def run_download(args, tmp):
+    from media_server import MediaServer, make_payload
+    size = args.size * MB
+    results = {}
+    with MediaServer({"/video.mp4": make_payload(size)}) as server:
+        os.environ["STUB_SOURCE"] = server.url("/video.mp4")
+        # For the chunked downloader, a progressive HTTP format on the server
+        fixture = os.path.join(tmp, "served.json")
+        info = stub_ytdlp.make_info()
+        info['formats'] = [{'format_id': "18", 'ext': "mp4", 'protocol': "http", 'url': server.url("/video.mp4"),
+                            'vcodec': "avc1.42001E", 'acodec': "mp4a.40.2", 'height': 360, 'filesize': size}]
+        with open(fixture, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.environ["STUB_FIXTURE"] = fixture
+
+        all_engines = engines()
+        # Downloader only uses the chunked downloader with several connections
+        cases = [
+            ("in-process", all_engines['in-process'], "best", 1),
+            ("subprocess", all_engines['subprocess'], "best", 1),
+            ("chunked, 2 connections", all_engines['in-process'], "18", 2),
+            ("chunked, 4 connections", all_engines['in-process'], "18", 4),
+        ]
+        for label, engine, format_id, connections in cases:
+            app = downloader(tmp, engine)
+            rates, events = [], []
+            for _ in range(args.download_runs):
+                received = []
+                start = time.perf_counter()
+                path = app.download("https://www.youtube.com/watch?v=dQw4w9WgXcQ", format_id, tmp,
+                                    progress_hook=received.append, connections=connections)
+                elapsed = time.perf_counter() - start
+                rates.append(size / elapsed / MB)
+                events.append(len(received) / elapsed)
+                if path and os.path.exists(path):
+                    os.remove(path)
+            results[label] = {
+                'mb_per_s': round(statistics.median(rates), 1),
+                'progress_events_per_s': round(statistics.median(events)),
+            }
+    return results
+
+
+def run_ui(args, tmp):
+    from engine import InProcessEngine
+    from download_queue import DownloadQueue, DOWNLOADING
+    from scheduler import Scheduler
+    from progress import describe_progress
+
+    os.environ["STUB_DELAY"] = str(args.delay)
+    os.environ["STUB_WRITE"] = "0"
+    scheduler = Scheduler(polled=True)
+    callbacks = []
+
+    def update(item):
+        # The work main.py's _update_queue_item does besides touching widgets
+        status = describe_progress(item.last_event) if item.state == DOWNLOADING and item.last_event else item.state
+        queue.counts()
+        callbacks.append(status)
+
+    queue = DownloadQueue(tmp, workers=args.workers, engine=InProcessEngine(ydl_class=stub_ytdlp.YoutubeDL),
+                          scheduler=scheduler, on_update=lambda item: scheduler.call_soon(update, item))
+    queue.add_many(f"https://www.youtube.com/watch?v=u{n:010d}" for n in range(args.items))
+    ticks, lags = [], []
+    start = time.perf_counter()
+    next_tick = start
+    while True:
+        now = time.perf_counter()
+        lags.append(max(0.0, now - next_tick))
+        scheduler.poll()
+        ticks.append(time.perf_counter() - now)
+        if queue.wait(timeout=0) and not scheduler.poll():
+            break
+        next_tick = time.perf_counter() + POLL_INTERVAL_MS / 1000
+        time.sleep(POLL_INTERVAL_MS / 1000)
+    elapsed = time.perf_counter() - start
+    scheduler.shutdown()
+    return {
+        'items': args.items,
+        'callbacks_per_s': round(len(callbacks) / elapsed, 1),
+        'poll_tick': summarize(ticks),
+        'poll_tick_max_ms': round(max(ticks) * 1000, 3),
+        'tick_lag': summarize(lags),
+    }
+
+
+def run_urls(args, tmp):
+    from urls import clean_youtube_url, is_valid_youtube_url, normalize_urls
+    templates = [
+        "https://www.youtube.com/watch?v={id}",
+        "https://www.youtube.com/watch?v={id}&list=PL{id}{id}&index=3&t=42s",
+        "https://youtu.be/{id}?si=abcdefgh",
+        "https://m.youtube.com/watch?feature=share&v={id}",
+        "https://www.youtube.com/shorts/{id}",
+        "https://www.youtube.com/embed/{id}?start=10",
+        "www.youtube.com/watch?v={id}",
+        "https://example.com/watch?v={id}",
+    ]
+    urls = [template.format(id=f"{n:011d}") for n in range(args.urls // len(templates))
+            for template in templates]
+
+    def validate_and_clean():
+        for url in urls:
+            if is_valid_youtube_url(url):
+                clean_youtube_url(url)
+
+    timings = timed(validate_and_clean, 5)
+    # The URL file import path: one parse per line, deduplicated
+    normalize_timings = timed(lambda: list(normalize_urls(urls)), 5)
+    return {'urls': len(urls), 'urls_per_s': round(len(urls) / statistics.median(timings)),
+            'normalized_per_s': round(len(urls) / statistics.median(normalize_timings))}
+
+
+def run_child(name, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        result = globals()[f"run_{name}"](args, tmp)
+    rss = peak_rss()
+    result['peak_rss_mb'] = round(rss / MB, 1) if rss else None
+    return result
+
+
+def flatten(result, prefix=""):
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, name + " / ")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="result file (default: results/suite-<time>.json)")
+    parser.add_argument("--compare", metavar="FILE", help="earlier result file to compare with")
+    parser.add_argument("--runs", type=int, default=50, help="timed runs of in-process operations")
+    parser.add_argument("--subprocess-runs", type=int, default=5, help="timed lookups through the subprocess")
+    parser.add_argument("--size", type=int, default=64, help="MB per download")
+    parser.add_argument("--download-runs", type=int, default=3)
+    parser.add_argument("--items", type=int, default=16, help="queue items in the ui scenario")
+    parser.add_argument("--workers", type=int, default=4, help="parallel downloads in the ui scenario")
+    parser.add_argument("--delay", type=float, default=0.01, help="seconds per 1%% of a ui scenario download")
+    parser.add_argument("--urls", type=int, default=80000, help="URLs in the urls scenario")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args)))
+        return 0
+
+    # Forward the options, not the scenario selection, to every child
+    forwarded = sys.argv[1:]
+    for option in ("--only", "--output", "--compare"):
+        while option in forwarded:
+            i = forwarded.index(option)
+            j = i + 1
+            while j < len(forwarded) and not forwarded[j].startswith("--"):
+                j += 1
+            del forwarded[i:j]
+
+    results = {}
+    for name in args.only:
+        started = time.perf_counter()
+        child = subprocess.run([sys.executable, __file__, "--child", name] + forwarded,
+                               capture_output=True, text=True)
+        if child.returncode:
+            print(f"{name}: failed\n{child.stderr}", file=sys.stderr)
+            results[name] = {'error': child.stderr.strip().splitlines()[-1] if child.stderr.strip() else "failed"}
+            continue
+        results[name] = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"{name}: done in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'options': {key: value for key, value in vars(args).items() if key not in ("child", "output", "compare")},
+        'results': results,
+    }
+    output = args.output or os.path.join(HERE, "results", f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = dict(flatten(json.load(f)['results']))
+    for name, value in flatten(results):
+        line = f"{name:<64} {value:>12,.3f}" if isinstance(value, float) else f"{name:<64} {value:>12,}"
+        old = previous.get(name)
+        if old:
+            line += f"  was {old:>12,.3f}  {(value - old) / old * 100:+6.1f}%"
+        print(line)
+    print(f"Results written to {output}")
+    return 1 if any('error' in result for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import errno
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+from engine import EngineError
+from format_selection import resolve_format
+from progress import ProgressEvent, FINISHED
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+# Reads fill one reused buffer this large, which goes to disk in one write
+BLOCK_SIZE = 1024 * 1024
+# Room left over for the file system, the chunk map and post-processing temp files
+FREE_SPACE_MARGIN = 64 * 1024 * 1024
+
+
+class ChunkedDownloadError(EngineError):
+    """Raised when a ranged download cannot be completed"""
+
+
+class InsufficientSpaceError(ChunkedDownloadError):
+    """Raised before a download starts when its file will not fit on the disk"""
+
+
+def check_free_space(directory, needed, margin=FREE_SPACE_MARGIN):
+    """Raise InsufficientSpaceError unless `needed` more bytes fit in `directory`.
+
+    A directory that does not exist yet is measured on its nearest existing
+    parent, the file system it will be created on.
+    """
+    if not needed:
+        return
+    existing = os.path.abspath(directory)
+    while not os.path.isdir(existing) and os.path.dirname(existing) != existing:
+        existing = os.path.dirname(existing)
+    free = shutil.disk_usage(existing).free
+    if free < needed + margin:
+        raise InsufficientSpaceError(f"Not enough free space in {directory}: {needed / 1e6:.0f} MB needed, "
+                                     f"{free / 1e6:.0f} MB free")
+
+
+def preallocate(f, size):
+    """Reserve `size` bytes for an open file so it is laid out in one piece.
+
+    Uses posix_fallocate where the platform and file system support it,
+    else only sets the length (a sparse file).
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise InsufficientSpaceError(f"Not enough free space for {f.name}") from e
+    f.truncate(size)
+
+
+def copy_stream(response, f, nbytes=None, on_data=None):
+    """Copy `nbytes` (or everything) from a response into `f`; returns the bytes copied.
+
+    Reads land in one reused buffer that is written out whole, so nothing
+    is copied on the way and the disk sees few big writes; `f` should be
+    unbuffered. `on_data(n)` follows every block.
+    """
+    buffer = memoryview(bytearray(BLOCK_SIZE))
+    copied = 0
+    while nbytes is None or copied < nbytes:
+        size = BLOCK_SIZE if nbytes is None else min(BLOCK_SIZE, nbytes - copied)
+        n = response.readinto(buffer[:size])
+        if not n:
+            break
+        f.write(buffer[:n])
+        copied += n
+        if on_data is not None:
+            on_data(n)
+    return copied
+
+
+class ChunkedDownloader:
+    """Downloads a single HTTP resource over several connections at once.
+
+    The file is split into fixed size chunks that are fetched with Range
+    requests and written straight to their offset in `<path>.part`, which is
+    preallocated once the size is known and the free space checked. Finished
+    chunks are recorded in `<path>.chunks.json`, so running the same
+    download again only fetches the chunks that are still missing, even if
+    the URL has changed in the meantime (YouTube format URLs expire). The
+    first chunk that fails stops the others and its error is raised.
+    """
+
+    def __init__(self, url, path, connections=DEFAULT_CONNECTIONS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 headers=None, progress_hook=None, timeout=30):
+        self.url = url
+        self.path = path
+        self.part_path = path + ".part"
+        self.state_path = path + ".chunks.json"
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.headers = dict(headers or {})
+        self.progress_hook = progress_hook
+        self.timeout = timeout
+        self.size = None
+        self._done = []
+        self._downloaded = 0
+        self._resumed = 0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()  # set when a chunk failed, the others give up
+
+    def _request(self, method="GET", start=None, end=None):
+        import urllib.request  # pulls in http.client and ssl; only needed here
+        headers = dict(self.headers)
+        if start is not None:
+            headers["Range"] = f"bytes={start}-{end}"
+        request = urllib.request.Request(self.url, headers=headers, method=method)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _probe(self):
+        """Return (size, supports_ranges) for the remote resource"""
+        with self._request(start=0, end=0) as response:
+            content_range = response.headers.get("Content-Range", "")
+            if response.status == 206 and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                if total.isdigit():
+                    return int(total), True
+            length = response.headers.get("Content-Length")
+            return (int(length) if length else None), False
+
+    def _load_state(self):
+        n_chunks = (self.size + self.chunk_size - 1) // self.chunk_size
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            if (state['size'] == self.size and state['chunk_size'] == self.chunk_size
+                    and os.path.getsize(self.part_path) == self.size):
+                return [c == "1" for c in state['done']]
+        except (OSError, ValueError, KeyError):
+            pass
+        return [False] * n_chunks
+
+    def _save_state(self):
+        # Called with the lock held; write to a temporary file so a crash
+        # never leaves a truncated chunk map behind
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                'url': self.url,
+                'size': self.size,
+                'chunk_size': self.chunk_size,
+                'done': "".join("1" if done else "0" for done in self._done),
+            }, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _report(self, nbytes, status="downloading"):
+        with self._lock:
+            self._downloaded += nbytes
+            downloaded = self._downloaded
+            done_chunks = sum(self._done)
+        if not self.progress_hook:
+            return
+        # Speed only counts bytes fetched in this run, not resumed chunks
+        elapsed = time.monotonic() - self._started
+        speed = (downloaded - self._resumed) / elapsed if elapsed > 0 else None
+        eta = (self.size - downloaded) / speed if speed and self.size else None
+        self.progress_hook(ProgressEvent(
+            status=status,
+            downloaded_bytes=downloaded,
+            total_bytes=self.size,
+            speed=speed,
+            eta=eta,
+            fragment_index=done_chunks if self._done else None,
+            fragment_count=len(self._done) or None,
+        ))
+
+    def _fetch_chunk(self, index):
+        if self._stop.is_set():
+            return
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+
+        def on_data(n):
+            if self._stop.is_set():
+                raise ChunkedDownloadError("Stopped, another chunk failed")
+            self._report(n)
+
+        with self._request(start=start, end=end) as response, \
+                open(self.part_path, "r+b", buffering=0) as f:
+            if response.status != 206:
+                raise ChunkedDownloadError(f"Server ignored the range request (HTTP {response.status})")
+            f.seek(start)
+            if copy_stream(response, f, end - start + 1, on_data) != end - start + 1:
+                raise ChunkedDownloadError(f"Connection closed early in chunk {index}")
+        with self._lock:
+            self._done[index] = True
+            self._save_state()
+
+    def _download_single(self):
+        # Fallback for servers without range support: one plain stream
+        with self._request() as response, open(self.part_path, "wb", buffering=0) as f:
+            if self.size:
+                check_free_space(os.path.dirname(os.path.abspath(self.path)), self.size)
+                preallocate(f, self.size)
+            copied = copy_stream(response, f, on_data=self._report)
+            # The server may have sent less than it announced
+            f.truncate(copied)
+
+    def run(self):
+        """Download the file, resuming from an earlier chunk map if present"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.size, ranges = self._probe()
+            if not ranges or not self.size:
+                self._download_single()
+            else:
+                self._done = self._load_state()
+                if not any(self._done):
+                    check_free_space(os.path.dirname(os.path.abspath(self.path)), self.size)
+                    with open(self.part_path, "wb") as f:
+                        preallocate(f, self.size)
+                missing = [i for i, done in enumerate(self._done) if not done]
+                # Count the chunks kept from an earlier run as already downloaded
+                self._resumed = sum(min(self.chunk_size, self.size - i * self.chunk_size)
+                                    for i, done in enumerate(self._done) if done)
+                self._report(self._resumed)
+                with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                    futures = [executor.submit(self._fetch_chunk, index) for index in missing]
+                    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+                    failed = [future for future in futures if future in done and future.exception()]
+                    if failed:
+                        # Stop at the first error instead of fetching every
+                        # remaining chunk first; finished chunks stay in the map
+                        self._stop.set()
+                        for future in pending:
+                            future.cancel()
+                        raise failed[0].exception()
+        except OSError as e:
+            raise ChunkedDownloadError(str(e)) from e
+
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        self._report(0, FINISHED)
+        return self.path
+
+
+def direct_http_format(info, format_id):
+    """Return the format dict `format_id` (an ID, "best" or "worst") picks if it is a single HTTP(S) file"""
+    fmt = resolve_format(info, format_id)
+    if fmt and fmt.get('protocol') in ('http', 'https') and fmt.get('url') and not fmt.get('fragments'):
+        return fmt
+    return None
+
+
+def sanitize_filename(name):
+    for char in '<>:"/\\|?*':
+        name = name.replace(char, "_")
+    return name.strip().rstrip(".") or "video"
+
+
+def output_basename(info):
+    """File name without extension, matching yt-dlp's "%(title)s [%(id)s]" template"""
+    title = sanitize_filename(info.get('title') or info.get('id') or "video")
+    if info.get('id'):
+        return f"{title} [{sanitize_filename(info['id'])}]"
+    return title
+
+
+def download_format(info, fmt, output_dir, connections=DEFAULT_CONNECTIONS, progress_hook=None):
+    """Download one format of a video with a ChunkedDownloader"""
+    filename = f"{output_basename(info)}.{fmt.get('ext', 'mp4')}"
+    downloader = ChunkedDownloader(fmt['url'], os.path.join(output_dir, filename), connections=connections,
+                                   headers=fmt.get('http_headers'), progress_hook=progress_hook)
+    return downloader.run()
@@ -0,0 +1,316 @@
+"""Command line interface for the downloader; works without a display.
+
+    python cli.py search URL
+    python cli.py list-formats URL
+    python cli.py playlist URL
+    python cli.py select URL --rules "<=1080p, prefer av1 then vp9, max 2 GB"
+    python cli.py download URL [URL ...] [-f FORMAT] [-o DIR] [-a FILE] [-j N] [--force]
+                           [--post "audio:mp3, tags, hash"] [--limit-rate 5M] [--job-rate 1M]
+    python cli.py resume [--list] [-j N]
+    python cli.py archive list|prune|remove [VIDEO_ID]
+
+Global options such as --metrics-log, --metrics-port and --profile go
+before the command:
+
+    python cli.py --metrics-log spans.jsonl --metrics-port 9464 download -a urls.txt
+    python cli.py --profile download.prof download URL
+"""
+import sys
+import json
+import time
+import argparse
+
+from engine import create_engine, EngineError
+from core import Downloader, DEFAULT_DOWNLOAD_PATH, describe_error, is_valid_youtube_url, is_playlist_url
+from urls import iter_url_file
+from download_queue import DEFAULT_WORKERS, DONE, FAILED, SKIPPED
+from format_selection import SelectionRules, FormatSelectionError, select_pair
+from progress import ProgressThrottle, describe_progress
+from ratelimit import RateLimiter, RetryPolicy, DEFAULT_RATE, THROTTLE_STATUSES
+from postprocess import parse_pipeline, STAGES
+from bandwidth import BandwidthLimiter, parse_rate
+from merge import has_ffmpeg
+from instrumentation import get_metrics, JsonLinesLog, MetricsServer, profile_call
+
+
+def print_progress(event):
+    sys.stderr.write(f"\rDownloading: {describe_progress(event):<40}")
+    sys.stderr.flush()
+
+
+def cmd_search(downloader, args):
+    if args.refresh:
+        info = downloader.fetch_video_info(args.url)
+    else:
+        info, _ = downloader.lookup(args.url)
+    if args.json:
+        print(json.dumps({key: getattr(info, key) for key in ('id', 'title', 'thumbnail', 'webpage_url')}))
+    else:
+        print(info.title)
+        print(info.webpage_url)
+        print(f"{len(info.formats)} formats available")
+    return 0
+
+
+def cmd_list_formats(downloader, args):
+    formats = downloader.list_formats(args.url)
+    if args.json:
+        print(json.dumps([fmt.as_dict() for fmt in formats]))
+    else:
+        for fmt in formats:
+            print(f"{fmt.format_id:>8}  {fmt.name}")
+    return 0
+
+
+def cmd_select(downloader, args):
+    # What "-f auto" would download on this machine
+    video, audio = select_pair(downloader.extract_info(args.url), downloader.rules, separate=has_ffmpeg())
+    for kind, fmt in (("video", video), ("audio", audio)):
+        if fmt:
+            print(f"{kind}: {fmt['format_id']:>6}  {fmt.get('ext')}  {fmt.get('vcodec')}  "
+                  f"{fmt.get('acodec')}  {fmt.get('height') or ''}  {fmt.get('tbr') or ''}")
+    return 0
+
+
+def cmd_playlist(downloader, args):
+    # Entries are printed as soon as yt-dlp yields them
+    for n, entry in enumerate(downloader.iter_playlist(args.url), 1):
+        if args.json:
+            print(json.dumps(entry), flush=True)
+        else:
+            print(f"{n:5d}  {entry['id']}  {entry['title']}", flush=True)
+        if args.limit and n >= args.limit:
+            break
+    return 0
+
+
+def print_item(item):
+    if item.state in (DONE, FAILED, SKIPPED):
+        detail = item.title or item.url
+        if item.state == FAILED:
+            detail += f": {describe_error(item.error)}"
+        print(f"[{item.state}] {detail}", flush=True)
+
+
+def finish_queue(downloader, queue):
+    queue.wait()
+    counts = queue.counts()
+    print(f"{counts[DONE]} downloaded, {counts[SKIPPED]} already archived, {counts[FAILED]} failed")
+    metrics = downloader.limiter.metrics.snapshot() if downloader.limiter else None
+    if metrics and metrics['rate_limited']:
+        print(f"Rate limited {metrics['rate_limited']} times, waited {metrics['throttled_seconds']:.0f} s "
+              f"in total, {metrics['retries']} retries", file=sys.stderr)
+    return 1 if counts[FAILED] else 0
+
+
+def cmd_download(downloader, args):
+    urls = list(args.urls)
+    if args.batch_file:
+        skipped = []
+        urls.extend(iter_url_file(args.batch_file, on_invalid=skipped.append))
+        if skipped:
+            print(f"Skipped {len(skipped)} lines that are not YouTube URLs, e.g. {skipped[0]}", file=sys.stderr)
+    if not urls:
+        print("error: no URLs given", file=sys.stderr)
+        return 2
+    pipeline = parse_pipeline(args.post)
+
+    if len(urls) == 1 and not is_playlist_url(urls[0]):
+        entry = None if args.force else downloader.archived(urls[0], args.format)
+        if entry is not None:
+            print(f"Already downloaded: {entry['path'] or entry['video_id']}")
+            return 0
+        path = downloader.download(urls[0], args.format, args.output,
+                                   progress_hook=ProgressThrottle(print_progress),
+                                   connections=args.connections, force=args.force, pipeline=pipeline)
+        sys.stderr.write("\n")
+        print(f"Downloaded to {path or args.output}")
+        return 0
+
+    queue = downloader.create_queue(workers=args.workers, format_id=args.format, on_update=print_item,
+                                    connections=args.connections, force=args.force, pipeline=pipeline)
+    # Playlists are expanded while the first entries are already downloading
+    queue.add_many(downloader.expand_urls(urls))
+    return finish_queue(downloader, queue)
+
+
+def cmd_resume(downloader, args):
+    journal = downloader.journal
+    if journal is None:
+        print("error: the job journal is disabled", file=sys.stderr)
+        return 2
+    if args.list:
+        for job in journal.unfinished():
+            print(f"{job['id']:5d}  {job['state']:<11}  {job['progress'] or 0:5.1f}%  {job['title'] or job['url']}")
+        return 0
+    queue = downloader.create_queue(workers=args.workers, on_update=print_item, connections=args.connections)
+    items = queue.resume_unfinished()
+    if not items:
+        print("No unfinished downloads")
+        return 0
+    print(f"Resuming {len(items)} unfinished downloads", file=sys.stderr)
+    return finish_queue(downloader, queue)
+
+
+def cmd_archive(downloader, args):
+    archive = downloader.archive
+    if archive is None:
+        print("error: the download archive is disabled", file=sys.stderr)
+        return 2
+    if args.action == "list":
+        for entry in archive.query(video_id=args.video_id, limit=args.limit):
+            if args.json:
+                print(json.dumps(entry))
+            else:
+                completed = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['completed_at']))
+                print(f"{entry['video_id']}  {entry['format_id']:>8}  {completed}  {entry['path'] or ''}")
+    elif args.action == "prune":
+        older_than = args.older_than * 86400 if args.older_than else None
+        removed = archive.prune(missing=not args.keep_missing, older_than=older_than)
+        print(f"Removed {removed} entries, {len(archive)} left")
+    elif args.action == "remove":
+        if not args.video_id:
+            print("error: remove needs a video ID", file=sys.stderr)
+            return 2
+        print(f"Removed {archive.remove(args.video_id)} entries")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="YouTube Video Downloader")
+    parser.add_argument("--engine", choices=["auto", "in-process", "subprocess"], default=None,
+                        help="yt-dlp backend (default: in-process when available)")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the metadata cache")
+    parser.add_argument("--no-archive", action="store_true",
+                        help="neither skip nor record videos in the download archive")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="do not record queued downloads for resuming after a restart")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="lookups and downloads started per second (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=4,
+                        help="retries after HTTP 429 responses, with exponential backoff")
+    parser.add_argument("--retry-403", action="store_true",
+                        help="also retry HTTP 403 responses without Retry-After, which are usually permanent")
+    parser.add_argument("--rules", default="",
+                        help='stream selection rules for the "auto" format, e.g. "<=1080p, prefer vp9, max 2 GB"')
+    parser.add_argument("--metrics-log", metavar="FILE",
+                        help="append a JSON line for every timed stage (extract, parse, download, ...) and failure")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run the command under cProfile and write the stats to FILE")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search = subparsers.add_parser("search", help="show information about a video")
+    search.add_argument("url")
+    search.add_argument("--refresh", action="store_true", help="ignore cached metadata")
+    search.add_argument("--json", action="store_true", help="print JSON")
+    search.set_defaults(func=cmd_search)
+
+    list_formats = subparsers.add_parser("list-formats", help="list the available formats")
+    list_formats.add_argument("url")
+    list_formats.add_argument("--json", action="store_true", help="print JSON")
+    list_formats.set_defaults(func=cmd_list_formats)
+
+    select = subparsers.add_parser("select", help="show the streams the auto format would pick")
+    select.add_argument("url")
+    select.set_defaults(func=cmd_select)
+
+    playlist = subparsers.add_parser("playlist", help="list the videos of a playlist or channel")
+    playlist.add_argument("url")
+    playlist.add_argument("--limit", type=int, default=0, help="stop after this many entries")
+    playlist.add_argument("--json", action="store_true", help="print one JSON object per entry")
+    playlist.set_defaults(func=cmd_playlist)
+
+    download = subparsers.add_parser("download", help="download videos, playlists or channels")
+    download.add_argument("urls", nargs="*")
+    download.add_argument("-f", "--format", default="best",
+                          help='format ID, yt-dlp format spec or "auto" for the best video + audio pair')
+    download.add_argument("-o", "--output", default=DEFAULT_DOWNLOAD_PATH, help="output directory")
+    download.add_argument("-a", "--batch-file", help="text file with one URL per line")
+    download.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS,
+                          help="number of parallel downloads")
+    download.add_argument("-N", "--connections", type=int, default=1,
+                          help="connections (byte ranges or fragments) per download")
+    download.add_argument("--force", action="store_true",
+                          help="download videos again even if they are in the archive")
+    download.add_argument("--limit-rate", type=parse_rate, default=None, metavar="RATE",
+                          help="total bandwidth of all downloads in bytes per second, e.g. 5M (default: unlimited)")
+    download.add_argument("--job-rate", type=parse_rate, default=None, metavar="RATE",
+                          help="bandwidth of each download, e.g. 500K (default: unlimited)")
+    download.add_argument("--post", default="", metavar="STAGES",
+                          help=f"post-processing stages run on each download, e.g. \"remux:mkv, audio:mp3, tags, "
+                               f"hash\" (stages: {', '.join(STAGES)})")
+    download.set_defaults(func=cmd_download)
+
+    resume = subparsers.add_parser("resume", help="finish the downloads an earlier run left unfinished")
+    resume.add_argument("--list", action="store_true", help="only list the unfinished downloads")
+    resume.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS, help="number of parallel downloads")
+    resume.add_argument("-N", "--connections", type=int, default=1,
+                        help="connections (byte ranges or fragments) per download")
+    resume.set_defaults(func=cmd_resume)
+
+    archive = subparsers.add_parser("archive", help="inspect or prune the archive of finished downloads")
+    archive.add_argument("action", choices=["list", "prune", "remove"])
+    archive.add_argument("video_id", nargs="?", help="only this video (list) or the video to forget (remove)")
+    archive.add_argument("--limit", type=int, default=0, help="list at most this many entries")
+    archive.add_argument("--json", action="store_true", help="print one JSON object per entry")
+    archive.add_argument("--older-than", type=float, default=0, help="prune entries older than this many days")
+    archive.add_argument("--keep-missing", action="store_true",
+                         help="do not prune entries whose file was deleted, moved or changed")
+    archive.set_defaults(func=cmd_archive)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    for url in [getattr(args, "url", None)] + getattr(args, "urls", []):
+        if url and not is_valid_youtube_url(url):
+            print(f"error: invalid YouTube URL: {url}", file=sys.stderr)
+            return 2
+
+    try:
+        rules = SelectionRules.parse(args.rules)
+    except FormatSelectionError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    downloader = Downloader(
+        getattr(args, "output", DEFAULT_DOWNLOAD_PATH),
+        engine=create_engine(args.engine),
+        cache=False if args.no_cache else None,
+        rules=rules,
+        archive=False if args.no_archive else None,
+        journal=False if args.no_journal else None,
+        limiter=RateLimiter(rate=args.rate, policy=RetryPolicy(
+            max_attempts=args.retries + 1, statuses=THROTTLE_STATUSES + ((403,) if args.retry_403 else ()))),
+        bandwidth=BandwidthLimiter(getattr(args, "limit_rate", None), getattr(args, "job_rate", None))
+    )
+    metrics = get_metrics()
+    log = JsonLinesLog(args.metrics_log) if args.metrics_log else None
+    if log is not None:
+        metrics.add_sink(log)
+    server = MetricsServer(metrics, port=args.metrics_port) if args.metrics_port else None
+    try:
+        if args.profile:
+            return profile_call(args.profile, args.func, downloader, args)
+        return args.func(downloader, args)
+    except (EngineError, FormatSelectionError) as e:
+        metrics.event("command_failed", command=args.command, error=str(e))
+        print(f"error: {describe_error(str(e))}", file=sys.stderr)
+        return 1
+    finally:
+        # Its worker processes would otherwise keep the interpreter waiting at exit
+        downloader.postprocessor.shutdown()
+        if downloader.journal is not None:
+            downloader.journal.close()
+        if log is not None:
+            metrics.remove_sink(log)
+            log.close()
+        if server is not None:
+            server.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""GUI-free fetch, format selection and download logic.
+
+Nothing in here (or in the modules it imports) may import tkinter or PIL,
+so the same code can back the Tkinter app, the CLI and headless scripts.
+"""
+import os
+
+from engine import get_engine, EngineError
+from urls import is_playlist_url, is_valid_youtube_url, extract_video_id, clean_youtube_url
+from metadata_cache import MetadataCache
+from archive import DownloadArchive
+from ratelimit import get_rate_limiter
+from download_queue import DownloadQueue, DEFAULT_WORKERS, OUTPUT_TEMPLATE, download_info
+from format_selection import AUTO_FORMAT, SelectionRules
+from metadata import VideoInfo
+from postprocess import PostProcessor, context_from_info
+from bandwidth import get_bandwidth_limiter
+from journal import JobJournal
+from progress import DOWNLOADING
+from instrumentation import span, count
+
+DEFAULT_DOWNLOAD_PATH = os.path.join(os.path.expanduser("~"), "Downloads")
+
+
+def describe_error(message):
+    """Turn raw yt-dlp error output into a message fit for the user"""
+    message = message or "Failed to fetch video information"
+    if "This video is unavailable" in message:
+        return "This video is unavailable. It might be private, age-restricted, or removed."
+    if "HTTP Error 429" in message:
+        return "HTTP Error 429: Too Many Requests, even after backing off. Please try again later."
+    return message
+
+
+def summarize_entry(entry):
+    """Reduce a flat playlist entry to what is needed to list and fetch it"""
+    video_id = entry.get('id')
+    url = entry.get('webpage_url') or entry.get('url')
+    if video_id and (not url or not url.startswith("http")):
+        url = f"https://www.youtube.com/watch?v={video_id}"
+    return {
+        'id': video_id,
+        'title': entry.get('title') or video_id or url,
+        'url': url,
+        'duration': entry.get('duration'),
+    }
+
+
+class Downloader:
+    """Programmatic API used by the GUI, the CLI and scripts.
+
+    `cache` may be a MetadataCache, None for the default on-disk cache, or
+    False to always fetch fresh metadata. `rules` (SelectionRules) decide
+    which streams the "auto" format downloads. `archive` works the same way
+    as `cache` for the DownloadArchive of finished downloads, and `limiter`
+    for the RateLimiter shared by every lookup and download (None uses the
+    process-wide one). `retry_policy` overrides the limiter's RetryPolicy.
+    Post-processing pipelines run in `postprocessor` (a PostProcessor with
+    one worker process per CPU by default). `bandwidth` is the
+    BandwidthLimiter whose caps every download obeys, like `limiter`.
+    Queues record their jobs in `journal`, which works like `cache` for the
+    JobJournal that lets unfinished downloads resume after a restart.
+    """
+
+    def __init__(self, download_path=DEFAULT_DOWNLOAD_PATH, engine=None, cache=None, rules=None,
+                 archive=None, limiter=None, retry_policy=None, postprocessor=None, bandwidth=None,
+                 journal=None):
+        self.download_path = download_path
+        if journal is None:
+            journal = JobJournal()
+        self.journal = journal if journal is not False else None
+        if bandwidth is None:
+            bandwidth = get_bandwidth_limiter()
+        self.bandwidth = bandwidth if bandwidth is not False else None
+        self.postprocessor = postprocessor or PostProcessor()
+        if limiter is None:
+            limiter = get_rate_limiter()
+        self.limiter = limiter if limiter is not False else None
+        self.retry_policy = retry_policy
+        self.engine = engine or get_engine()
+        self.rules = rules or SelectionRules()
+        if cache is None:
+            cache = MetadataCache()
+        self.cache = cache if cache is not False else None
+        if archive is None:
+            archive = DownloadArchive()
+        self.archive = archive if archive is not False else None
+
+    def cached_video_info(self, url):
+        """Return (VideoInfo, is_stale) from the cache without any network access"""
+        video_id = extract_video_id(url)
+        if self.cache is not None and video_id:
+            cached = self.cache.get(video_id)
+            if cached is not None:
+                data, is_stale = cached
+                return VideoInfo.from_dict(data), is_stale
+        return None
+
+    def lookup(self, url):
+        """Return (VideoInfo, is_stale), serving from the cache when possible"""
+        cached = self.cached_video_info(url)
+        count("metadata_cache_hits" if cached else "metadata_cache_misses")
+        return cached or (self.fetch_video_info(url), False)
+
+    def fetch_video_info(self, url):
+        """Fetch fresh metadata for `url` as a VideoInfo, raising EngineError on failure"""
+        url = clean_youtube_url(url)
+        video = self._limited(self.engine.extract_video, url)
+        if self.cache is not None and video.id:
+            self.cache.put(video.id, video.as_dict())
+        return video
+
+    def extract_info(self, url):
+        """Return the full `yt-dlp -J` document of `url`, through the rate limiter"""
+        return self._limited(self.engine.extract_info, clean_youtube_url(url))
+
+    def iter_playlist(self, url):
+        """Yield the entries of a playlist or channel as soon as each is known.
+
+        Only flat entries are extracted; call lookup() on an entry's URL to
+        get its formats when they are actually needed.
+        """
+        for entry in self.engine.iter_entries(url):
+            yield summarize_entry(entry)
+
+    def expand_urls(self, urls):
+        """Yield video URLs, lazily replacing playlists and channels by their entries"""
+        for url in urls:
+            if is_playlist_url(url):
+                for entry in self.iter_playlist(url):
+                    yield entry['url']
+            else:
+                yield url
+
+    def list_formats(self, url):
+        return self.lookup(url)[0].formats
+
+    def invalidate(self, url):
+        video_id = extract_video_id(url)
+        if self.cache is not None and video_id:
+            self.cache.invalidate(video_id)
+
+    def archived(self, url, format_id=None):
+        """Return the archive entry of a video previously downloaded in `format_id` (or any format), or None"""
+        video_id = extract_video_id(url)
+        if self.archive is not None and video_id and self.archive.contains(video_id, format_id):
+            return self.archive.get(video_id, format_id)
+        return None
+
+    def download(self, url, format_id="best", output_dir=None, progress_hook=None, connections=1,
+                 force=False, pipeline=(), rate_limit=None):
+        """Download a single video and block until it has finished.
+
+        The "auto" format downloads the best video and audio streams allowed
+        by the selection rules side by side and remuxes them. With more than
+        one connection, progressive HTTP formats are fetched as parallel
+        byte ranges (resumable via a chunk map) and fragmented DASH/HLS
+        formats download several fragments at once. `progress_hook`
+        receives unthrottled ProgressEvents; wrap it in a ProgressThrottle
+        when it drives a display. `rate_limit` caps this download in bytes
+        per second, on top of the bandwidth limiter's caps.
+
+        Videos found in the download archive in the same format are not
+        downloaded again unless `force` is set. The post-processing `pipeline` (a list of stages, see
+        postprocess.parse_pipeline) runs on the downloaded file. Returns the
+        path of the file (the archived one when skipped, the pipeline's
+        output when there is one), or None if the engine did not report it.
+        """
+        output_dir = output_dir or self.download_path
+        url = clean_youtube_url(url)
+        if not force:
+            entry = self.archived(url, format_id)
+            if entry is not None:
+                return entry['path']
+        try:
+            video_id, path = self._limited(self._download, url, format_id, output_dir, progress_hook,
+                                           connections, rate_limit)
+        except EngineError:
+            # The cached format list may be out of date, fetch it again next time
+            self.invalidate(url)
+            raise
+        sha256 = None
+        if pipeline and path:
+            cached = self.cached_video_info(url)
+            context = context_from_info(cached[0].as_dict() if cached else {'id': video_id, 'webpage_url': url})
+            checksum = "sha256" if self.archive is not None and self.archive.checksums else None
+            result = self.postprocessor.run(path, pipeline, context, checksum)
+            path, sha256 = result['path'], result['checksums'].get('sha256')
+        if self.archive is not None and video_id:
+            self.archive.record(video_id, format_id, path, sha256=sha256)
+        return path
+
+    def _download(self, url, format_id, output_dir, progress_hook, connections, rate_limit):
+        throttle = self.bandwidth.throttle(rate_limit) if self.bandwidth is not None else None
+        if throttle is not None:
+            rate_limit = throttle.effective_rate
+        report = progress_hook
+
+        with span("download", format_id=format_id, connections=connections) as fields:
+            fields['bytes'] = 0
+
+            def progress_hook(event):
+                if event.status == DOWNLOADING:
+                    fields['bytes'] = event.downloaded_bytes
+                    if throttle is not None:
+                        # Sleeps in the downloading thread until the caps allow the new bytes
+                        throttle.update(event.downloaded_bytes)
+                if report is not None:
+                    report(event)
+
+            if format_id == AUTO_FORMAT or connections > 1:
+                # Format URLs expire, so this always needs fresh metadata
+                info = self.engine.extract_info(url)
+                return info.get('id'), download_info(self.engine, info, format_id, output_dir, connections,
+                                                     self.rules, progress_hook, rate_limit)
+            path = self.engine.download(url, format_id, os.path.join(output_dir, OUTPUT_TEMPLATE),
+                                        progress_hook=progress_hook, connections=connections,
+                                        rate_limit=rate_limit)
+            return extract_video_id(url), path
+
+    def _limited(self, func, *args):
+        # Throttled calls are retried after a backoff shared by all callers
+        if self.limiter is None:
+            return func(*args)
+        return self.limiter.call(func, *args, policy=self.retry_policy)
+
+    def create_queue(self, workers=DEFAULT_WORKERS, format_id="best", on_update=None, connections=1,
+                     force=False, scheduler=None, pipeline=()):
+        return DownloadQueue(self.download_path, workers=workers, format_id=format_id,
+                             engine=self.engine, on_update=on_update, connections=connections,
+                             rules=self.rules, archive=self.archive, skip_archived=not force,
+                             scheduler=scheduler, limiter=self.limiter, retry_policy=self.retry_policy,
+                             postprocessor=self.postprocessor, pipeline=pipeline, bandwidth=self.bandwidth,
+                             journal=self.journal)
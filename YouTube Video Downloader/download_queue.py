@@ -0,0 +1,500 @@
+import os
+import json
+import time
+import threading
+import itertools
+from collections import deque
+
+from engine import get_engine, JobCancelled
+import chunked_download
+import merge
+from format_selection import AUTO_FORMAT, SelectionRules, select_pair, estimate_size, resolve_format
+from progress import ProgressThrottle, DEFAULT_MAX_RATE, DOWNLOADING as PROGRESS_DOWNLOADING
+from urls import extract_video_id, iter_url_file
+from scheduler import DOWNLOADS as DOWNLOAD_POOL
+from postprocess import PostProcessError, context_from_info, parse_pipeline
+from instrumentation import span, set_gauge, get_metrics
+
+# Item states
+QUEUED = "queued"
+FETCHING = "fetching"
+DOWNLOADING = "downloading"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"  # already in the download archive
+CANCELLED = "cancelled"
+WAITING = "waiting"  # rate limited, retried after a backoff
+PROCESSING = "processing"  # downloaded, post-processing pipeline running
+
+DEFAULT_WORKERS = 3
+DEFAULT_FORMAT = "best"
+# The video ID keeps two videos with the same title from overwriting each other
+OUTPUT_TEMPLATE = "%(title)s [%(id)s].%(ext)s"
+
+
+def expected_size(info, format_id):
+    """Best guess of the download size of `format_id` in bytes, 0 if unknown"""
+    fmt = resolve_format(info, format_id)
+    if fmt is not None:
+        return estimate_size(fmt, info.get('duration'))
+    # yt-dlp fills these in for the format it picked for any other spec
+    return info.get('filesize') or info.get('filesize_approx') or 0
+
+
+def download_info(engine, info, format_id, output_dir, connections=1, rules=None, progress_hook=None,
+                  rate_limit=None):
+    """Download a video whose `-J` document has already been fetched.
+
+    "auto" picks and merges the best video and audio streams according to
+    `rules`, or the best progressive format when ffmpeg is not installed;
+    progressive HTTP formats use parallel ranges when more than one
+    connection is allowed, and everything else is left to yt-dlp. Fails
+    early with InsufficientSpaceError when the expected size does not fit
+    on the disk. `rate_limit` is passed on to yt-dlp for backends that
+    cannot be throttled from the progress hook. Returns the path of the
+    downloaded file when it is known.
+    """
+    # Created up front as yt-dlp would, for the chunked and merged paths too
+    os.makedirs(output_dir, exist_ok=True)
+    if format_id == AUTO_FORMAT:
+        video, audio = select_pair(info, rules, separate=merge.has_ffmpeg())
+        return merge.download_and_merge(engine, info, video, audio, output_dir, rules, connections,
+                                        progress_hook, rate_limit)
+    fmt = chunked_download.direct_http_format(info, format_id) if connections > 1 else None
+    if fmt:
+        return chunked_download.download_format(info, fmt, output_dir, connections, progress_hook)
+    chunked_download.check_free_space(output_dir, expected_size(info, format_id))
+    return engine.download(
+        info.get('webpage_url'),
+        format_id,
+        os.path.join(output_dir, OUTPUT_TEMPLATE),
+        progress_hook=progress_hook,
+        info=info,
+        connections=connections,
+        rate_limit=rate_limit
+    )
+
+
+class QueueItem:
+    """A single URL in the download queue and its current state"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, url, output_dir, format_id=DEFAULT_FORMAT, title=None, retry_policy=None, pipeline=(),
+                 rate_limit=None):
+        self.id = next(self._ids)
+        self.job_id = None  # row in the JobJournal, if the queue has one
+        self.url = url
+        self.output_dir = output_dir
+        self.format_id = format_id
+        self.title = title
+        self.video_id = extract_video_id(url)
+        self.path = None
+        self.files = []
+        self.context = None
+        self.pipeline = list(pipeline)
+        self.rate_limit = rate_limit  # bytes per second, None for the queue's default
+        self.throttle = None
+        self.state = QUEUED
+        self.progress = 0.0
+        self.last_event = None
+        self.error = None
+        self.cancel_requested = False
+        self.retry_policy = retry_policy
+        self.retries = 0
+
+    def __repr__(self):
+        return f"<QueueItem {self.id} {self.state} {self.url}>"
+
+
+class DownloadQueue:
+    """Downloads many URLs with at most `workers` running at the same time.
+
+    `on_update(item)` is called from the worker threads whenever an item
+    changes state, and at most `max_rate` times a second per item while it
+    reports progress. `on_progress(event)` receives the same coalesced
+    ProgressEvents for programmatic consumers. `connections` is the number of
+    parallel connections (ranges or fragments) used for each download, and
+    `rules` are the SelectionRules used for items with the "auto" format.
+
+    With a DownloadArchive, videos already in it in the item's format are
+    marked SKIPPED as soon as they are added (unless `skip_archived` is False) and every finished
+    download is recorded in it.
+
+    Worker loops run on plain threads, or in the "downloads" pool of a
+    Scheduler when one is given.
+
+    With a RateLimiter every item takes a token before it is fetched, and
+    throttled (429) items wait and start over with fresh metadata
+    according to their RetryPolicy (the item's own, else `retry_policy`,
+    else the limiter's).
+
+    Items with a post-processing pipeline (their own, else `pipeline`) are
+    handed to the PostProcessor once downloaded and stay PROCESSING until
+    it is done; the worker moves on to its next download meanwhile.
+
+    With a BandwidthLimiter every download is throttled to the global cap
+    and to its item's `rate_limit` (else the limiter's per-job default);
+    set_rate_limit() changes an item's cap while it downloads.
+
+    With a JobJournal every item is recorded as a job and its state and
+    progress are written along with the update callbacks, so
+    resume_unfinished() can pick up the jobs a previous run left behind.
+    """
+
+    def __init__(self, download_path, workers=DEFAULT_WORKERS, format_id=DEFAULT_FORMAT,
+                 engine=None, on_update=None, connections=1, rules=None, on_progress=None,
+                 max_rate=DEFAULT_MAX_RATE, archive=None, skip_archived=True, scheduler=None,
+                 limiter=None, retry_policy=None, postprocessor=None, pipeline=(), bandwidth=None,
+                 journal=None):
+        self.download_path = download_path
+        self.journal = journal
+        self.bandwidth = bandwidth
+        self.postprocessor = postprocessor
+        self.pipeline = list(pipeline)
+        self._processing = {}  # item ID -> Future of its pipeline
+        self.limiter = limiter
+        self.retry_policy = retry_policy
+        self.scheduler = scheduler
+        self.archive = archive
+        self.skip_archived = skip_archived
+        self.on_progress = on_progress
+        self._throttle = ProgressThrottle(self._forward_progress, max_rate)
+        self._items_by_id = {}
+        self.connections = connections
+        self.rules = rules or SelectionRules()
+        self.format_id = format_id
+        self.engine = engine or get_engine()
+        self.on_update = on_update
+        self.items = []
+        self._workers = max(1, workers)
+        self._running = 0
+        self._pending = deque()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    @property
+    def workers(self):
+        return self._workers
+
+    def set_workers(self, count):
+        """Change the worker limit; extra workers stop after their current item"""
+        with self._lock:
+            self._workers = max(1, count)
+            self._spawn_workers()
+
+    def add(self, url, format_id=None, output_dir=None, title=None, retry_policy=None, pipeline=None,
+            rate_limit=None):
+        item = QueueItem(url, output_dir or self.download_path, format_id or self.format_id, title,
+                         retry_policy, self.pipeline if pipeline is None else pipeline, rate_limit)
+        if self.journal is not None:
+            item.job_id = self.journal.add(item.url, item.format_id, item.output_dir, item.title,
+                                           ", ".join(map(repr, item.pipeline)), item.rate_limit)
+        return self._add_item(item)
+
+    def _add_item(self, item):
+        # A set lookup, so bulk jobs skip finished videos without any network access
+        archived = (self.skip_archived and self.archive is not None and item.video_id
+                    and self.archive.contains(item.video_id, item.format_id))
+        with self._lock:
+            self.items.append(item)
+            self._items_by_id[item.id] = item
+            if archived:
+                item.state = SKIPPED
+                item.progress = 100.0
+            else:
+                self._pending.append(item)
+                self._spawn_workers()
+        self._notify(item)
+        return item
+
+    def resume_unfinished(self):
+        """Queue the jobs the journal holds from earlier runs that never finished.
+
+        Each job is added back under its journal row with its format, output
+        directory, pipeline and cap. Output paths do not change between runs,
+        so yt-dlp continues from its `.part` file and chunked downloads from
+        their chunk map. Jobs that were post-processing when the app stopped
+        run their pipeline again if the downloaded file is still there. Jobs
+        another running instance owns are left to it. Returns the resumed
+        items.
+        """
+        if self.journal is None:
+            return []
+        items = []
+        for job in self.journal.claim_unfinished():
+            try:
+                pipeline = parse_pipeline(job['pipeline'])
+            except PostProcessError as e:
+                self.journal.update(job['id'], state=FAILED, error=str(e))
+                continue
+            item = QueueItem(job['url'], job['output_dir'] or self.download_path, job['format_id'] or self.format_id,
+                             job['title'], pipeline=pipeline, rate_limit=job['rate_limit'])
+            item.job_id = job['id']
+            item.video_id = job['video_id'] or item.video_id
+            if (job['state'] == PROCESSING and pipeline and self.postprocessor is not None
+                    and job['path'] and os.path.exists(job['path'])):
+                item.path = job['path']
+                item.context = json.loads(job['context']) if job['context'] else {}
+                item.progress = 100.0
+                with self._lock:
+                    self.items.append(item)
+                    self._items_by_id[item.id] = item
+                self._start_processing(item)
+            else:
+                self._add_item(item)
+            items.append(item)
+        return items
+
+    def add_many(self, urls, format_id=None, output_dir=None):
+        return [self.add(url, format_id, output_dir) for url in urls]
+
+    def add_file(self, path, format_id=None, output_dir=None):
+        """Queue every YouTube URL in a text file, one per line; '#' starts a comment.
+
+        URLs are normalized and each video is queued once, however often
+        and in whichever form it appears; other lines are ignored.
+        """
+        return self.add_many(iter_url_file(path), format_id, output_dir)
+
+    def cancel(self, item):
+        """Drop a queued item, or abort its download at the next progress update"""
+        with self._lock:
+            if item.state in (DONE, FAILED, SKIPPED, CANCELLED):
+                return False
+            item.cancel_requested = True
+            future = self._processing.get(item.id) if item.state == PROCESSING else None
+        if future is not None:
+            # Only a pipeline that has not started yet can be dropped; the
+            # done callback marks the item cancelled
+            return future.cancel()
+        with self._lock:
+            try:
+                self._pending.remove(item)
+            except ValueError:
+                return True  # running, the worker marks it cancelled
+            item.state = CANCELLED
+        self._notify(item)
+        return True
+
+    def set_rate_limit(self, item, rate):
+        """Cap one item at `rate` bytes per second (None for the default), even mid-download"""
+        item.rate_limit = rate
+        throttle = item.throttle
+        if throttle is not None:
+            throttle.set_rate(rate)
+
+    def cancel_all(self):
+        return sum(1 for item in list(self.items) if self.cancel(item))
+
+    def shutdown(self):
+        """Stop all work for good when the app exits.
+
+        Unlike cancel_all(), the journal keeps every unfinished job in its
+        last state, so resume_unfinished() picks them up on the next start.
+        Running downloads stop at their next progress update.
+        """
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+            for item in self.items:
+                item.cancel_requested = True
+            self._update_gauges()
+            self._idle.notify_all()
+
+    def counts(self):
+        counts = {state: 0 for state in (QUEUED, FETCHING, DOWNLOADING, WAITING, PROCESSING, DONE, FAILED,
+                                             SKIPPED, CANCELLED)}
+        for item in list(self.items):
+            counts[item.state] += 1
+        return counts
+
+    def wait(self, timeout=None):
+        """Block until every queued item has finished or failed, post-processing included"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._running and not self._processing,
+                                       timeout)
+
+    def _spawn_workers(self):
+        # Called with the lock held; each new worker starts with an item
+        while self._running < self._workers and self._pending:
+            self._running += 1
+            item = self._pending.popleft()
+            if self.scheduler is not None:
+                self.scheduler.submit(DOWNLOAD_POOL, self._worker, item, url=item.url)
+            else:
+                threading.Thread(target=self._worker, args=(item,), daemon=True).start()
+        self._update_gauges()
+
+    def _update_gauges(self):
+        # Called with the lock held
+        set_gauge("queue_pending", len(self._pending))
+        set_gauge("queue_running", self._running)
+        set_gauge("queue_processing", len(self._processing))
+
+    def _worker(self, item):
+        handed_on = False
+        try:
+            while True:
+                self._process(item)
+                with self._lock:
+                    if self._running > self._workers or not self._pending:
+                        return
+                    item = self._pending.popleft()
+                    self._update_gauges()
+                    if self.scheduler is not None:
+                        # A job per item, so the host rate limit spaces out every start
+                        self.scheduler.submit(DOWNLOAD_POOL, self._worker, item, url=item.url)
+                        handed_on = True
+                        return
+        finally:
+            # Also when an on_update callback raised, or wait() would never return
+            if not handed_on:
+                with self._lock:
+                    self._running -= 1
+                    self._spawn_workers()
+                    self._idle.notify_all()
+
+    def _process(self, item):
+        try:
+            if self.limiter is not None:
+                # Format URLs may expire while an item waits, so every
+                # attempt starts over from fresh metadata
+                self.limiter.call(self._fetch_and_download, item, policy=item.retry_policy or self.retry_policy,
+                                  on_retry=lambda attempt, delay, error: self._set_waiting(item, delay),
+                                  cancelled=lambda: item.cancel_requested)
+            else:
+                self._fetch_and_download(item)
+            # Finished just as the queue shut down: the pipeline runs after the restart
+            self._check_cancelled(item)
+            item.progress = 100.0
+            if item.pipeline and self.postprocessor is not None and item.path:
+                self._start_processing(item)
+                return
+            self._record(item)
+            item.state = DONE
+        except JobCancelled:
+            item.state = CANCELLED
+        except Exception as e:
+            item.error = str(e)
+            item.state = FAILED
+            get_metrics().event("download_failed", url=item.url, format_id=item.format_id, error=item.error)
+        self._notify(item)
+
+    def _fetch_and_download(self, item):
+        item.state = FETCHING
+        item.error = None
+        self._notify(item)
+        info = self.engine.extract_info(item.url)
+        self._check_cancelled(item)
+        item.title = item.title or info.get('title')
+        item.video_id = info.get('id') or item.video_id
+        item.context = context_from_info(info)
+
+        item.state = DOWNLOADING
+        self._notify(item)
+        rate_limit = None
+        if self.bandwidth is not None:
+            item.throttle = self.bandwidth.throttle(item.rate_limit)
+            rate_limit = item.throttle.effective_rate
+        try:
+            with span("download", format_id=item.format_id, connections=self.connections) as fields:
+                try:
+                    item.path = download_info(self.engine, info, item.format_id, item.output_dir,
+                                              self.connections, self.rules,
+                                              progress_hook=lambda event: self._set_progress(item, event),
+                                              rate_limit=rate_limit)
+                finally:
+                    fields['bytes'] = item.last_event.downloaded_bytes if item.last_event else 0
+        finally:
+            item.throttle = None
+
+    def _record(self, item, sha256=None):
+        if self.archive is not None and item.video_id:
+            self.archive.record(item.video_id, item.format_id, item.path, sha256=sha256)
+
+    def _start_processing(self, item):
+        item.state = PROCESSING
+        if self.journal is not None:
+            # Kept so the pipeline can run again after a restart
+            self.journal.update(item.job_id, context=json.dumps(item.context))
+        with self._lock:
+            # The archive's digest is computed by the worker too, never on
+            # the pool's result thread where it would hold up every pipeline
+            checksum = "sha256" if self.archive is not None and self.archive.checksums else None
+            future = self.postprocessor.submit(item.path, item.pipeline, item.context, checksum)
+            self._processing[item.id] = future
+            self._update_gauges()
+        self._notify(item)
+        start = time.perf_counter()
+        future.add_done_callback(lambda f: self._finish_processing(item, f, start))
+
+    def _finish_processing(self, item, future, start):
+        # Runs on the process pool's result thread; the span includes the
+        # time the pipeline waited for a free worker
+        get_metrics().record_span("postprocess", time.perf_counter() - start,
+                                  None if future.cancelled() or not future.exception()
+                                  else str(future.exception()), pipeline=", ".join(map(repr, item.pipeline)))
+        try:
+            if future.cancelled():
+                item.state = CANCELLED
+            else:
+                result = future.result()
+                item.path = result['path']
+                item.files = result['files']
+                # Recorded under the final name, with the digest the worker computed
+                self._record(item, sha256=result['checksums'].get('sha256'))
+                item.state = DONE
+        except Exception as e:
+            item.error = f"Post-processing failed: {e}"
+            item.state = FAILED
+            get_metrics().event("postprocess_failed", url=item.url, path=item.path, error=item.error)
+        with self._lock:
+            self._processing.pop(item.id, None)
+            self._update_gauges()
+            self._idle.notify_all()
+        self._notify(item)
+
+    def _set_waiting(self, item, delay):
+        item.retries += 1
+        item.state = WAITING
+        item.error = f"Rate limited, retrying in {delay:.0f} s"
+        self._notify(item)
+
+    @staticmethod
+    def _check_cancelled(item):
+        if item.cancel_requested:
+            raise JobCancelled("Cancelled")
+
+    def _set_progress(self, item, event):
+        # Raising here makes yt-dlp (or the chunked downloader) abort
+        self._check_cancelled(item)
+        throttle = item.throttle
+        if throttle is not None and event.status == PROGRESS_DOWNLOADING:
+            # Sleeps in the downloading thread until the caps allow the new bytes
+            throttle.update(event.downloaded_bytes, cancelled=lambda: item.cancel_requested)
+        # Item fields always hold the newest numbers, listeners are throttled
+        event.job_id = item.id
+        item.last_event = event
+        if event.percent is not None:
+            item.progress = event.percent
+        self._throttle(event)
+
+    def _forward_progress(self, event):
+        item = self._items_by_id.get(event.job_id)
+        if item is not None and item.state == DOWNLOADING:
+            self._notify(item)
+        if self.on_progress:
+            self.on_progress(event)
+
+    def _notify(self, item):
+        if self.journal is not None and item.job_id is not None and not self._closed:
+            event = item.last_event
+            self.journal.update(item.job_id, state=item.state, progress=item.progress, title=item.title,
+                                video_id=item.video_id, path=item.path, error=item.error,
+                                rate_limit=item.rate_limit,
+                                downloaded_bytes=event.downloaded_bytes if event else None,
+                                total_bytes=event.total_bytes if event else None)
+        if self.on_update:
+            self.on_update(item)
@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import tempfile
+import importlib.util
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from progress import ProgressEvent, PROGRESS_TEMPLATE
+from metadata import VideoInfo
+from paths import user_cache_dir
+from instrumentation import span
+
+# Marker for the final file name printed by `python -m yt_dlp` after a download
+FILEPATH_PREFIX = "YTD-FILE "
+FILEPATH_TEMPLATE = "after_move:" + FILEPATH_PREFIX + "%(filepath)s"
+OUTPUT_TAIL_LINES = 20
+
+
+class EngineError(Exception):
+    """Raised when yt-dlp fails to fetch information or download a video"""
+
+
+class JobCancelled(EngineError):
+    """Raised from a progress hook (or any other callback) to abort the running job"""
+
+
+class InProcessEngine:
+    """Runs yt-dlp through its Python API inside long-lived worker threads.
+
+    The yt-dlp package and its extractors are imported once, and every
+    worker keeps its own YoutubeDL instance around for metadata lookups, so
+    every search after the first one skips the interpreter start-up and
+    import cost.
+    """
+
+    name = "in-process"
+
+    def __init__(self, ydl_class=None, workers=8):
+        self._ydl_class = ydl_class
+        # YoutubeDL instances are not thread safe, so each worker thread
+        # owns the instance it uses for metadata lookups
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ytdlp-engine")
+
+    def _load(self):
+        if self._ydl_class is None:
+            try:
+                from yt_dlp import YoutubeDL
+            except ImportError as e:
+                raise EngineError(f"yt-dlp is not installed: {e}")
+            self._ydl_class = YoutubeDL
+        return self._ydl_class
+
+    def _get_info_ydl(self):
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            ydl_class = self._load()
+            ydl = self._local.ydl = ydl_class({
+                'quiet': True,
+                'no_warnings': True,
+                'noprogress': True,
+            })
+        return ydl
+
+    def warm_up(self):
+        """Import yt-dlp and build the metadata instance in the background"""
+        return self._executor.submit(self._get_info_ydl)
+
+    def version(self):
+        self._load()
+        try:
+            from yt_dlp.version import __version__
+        except ImportError:
+            return getattr(self._ydl_class, "__version__", "unknown")
+        return __version__
+
+    def _extract(self, url):
+        ydl = self._get_info_ydl()
+        try:
+            with span("extract", engine=self.name):
+                info = ydl.extract_info(url, download=False)
+            # Same JSON-safe document that `yt-dlp -J` prints
+            return ydl.sanitize_info(info)
+        except Exception as e:
+            raise EngineError(str(e)) from e
+
+    def extract_info(self, url):
+        return self._executor.submit(self._extract, url).result()
+
+    def _extract_video(self, url):
+        ydl = self._get_info_ydl()
+        try:
+            # No sanitize_info() copy, only the summary outlives this call
+            with span("extract", engine=self.name):
+                info = ydl.extract_info(url, download=False)
+            return VideoInfo.from_ytdlp(info, url)
+        except Exception as e:
+            raise EngineError(str(e)) from e
+
+    def extract_video(self, url):
+        """Return the compact VideoInfo of a video, for display rather than download"""
+        return self._executor.submit(self._extract_video, url).result()
+
+    def iter_entries(self, url):
+        """Yield the flat entries of a playlist or channel as they are fetched"""
+        ydl_class = self._load()
+        ydl = ydl_class({
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+        })
+        try:
+            # Without processing, yt-dlp hands back the extractor's own lazy
+            # entry generator instead of resolving every entry up front
+            info = ydl.extract_info(url, download=False, process=False)
+            if info.get('_type') not in ('playlist', 'multi_video'):
+                yield ydl.sanitize_info(info)
+                return
+            for entry in info.get('entries') or []:
+                if not entry:
+                    continue
+                if entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab':
+                    # Channels list their tabs (videos, shorts, ...) as nested playlists
+                    yield from self.iter_entries(entry.get('url') or entry['webpage_url'])
+                else:
+                    yield ydl.sanitize_info(entry)
+        except EngineError:
+            raise
+        except Exception as e:
+            raise EngineError(str(e)) from e
+
+    def download(self, url, format_id, output_template, progress_hook=None, info=None, connections=1,
+                 rate_limit=None):
+        """Download `url`, reusing an `info` document from extract_info if given.
+
+        `connections` is the number of DASH/HLS fragments fetched in parallel
+        and `progress_hook` receives a ProgressEvent for every yt-dlp update.
+        Returns the path of the finished file, or None if yt-dlp did not
+        report one.
+
+        `rate_limit` is ignored: the hook runs in yt-dlp's download thread,
+        so callers throttle from there and can change the cap at any time.
+        """
+        def hook(d):
+            if progress_hook is not None:
+                progress_hook(ProgressEvent.from_ytdlp(d))
+
+        # Called with the final path once merging and moving are done
+        filepaths = []
+
+        ydl_class = self._load()
+        options = {
+            'format': format_id,
+            'outtmpl': output_template,
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'progress_hooks': [hook],
+            'post_hooks': [filepaths.append],
+            'concurrent_fragment_downloads': max(1, connections),
+        }
+        try:
+            # Downloads get their own instance so they never block lookups
+            with ydl_class(options) as ydl:
+                if info is not None:
+                    # Skip a second extraction when the caller already has it
+                    ydl.process_ie_result(info, download=True)
+                    retcode = 0
+                else:
+                    retcode = ydl.download([url])
+        except EngineError:
+            raise  # JobCancelled from the progress hook
+        except Exception as e:
+            raise EngineError(str(e)) from e
+        if retcode:
+            raise EngineError(f"Download failed with exit code {retcode}")
+        return filepaths[-1] if filepaths else None
+
+
+class SubprocessEngine:
+    """Fallback backend that runs `python -m yt_dlp` once per operation"""
+
+    name = "subprocess"
+
+    def __init__(self, command=None):
+        self.command = list(command or [sys.executable, "-m", "yt_dlp"])
+
+    def warm_up(self):
+        return None
+
+    def version(self):
+        try:
+            result = subprocess.run(self.command + ["--version"],
+                                    capture_output=True, text=True, check=True)
+        except (subprocess.SubprocessError, FileNotFoundError) as e:
+            raise EngineError(f"yt-dlp is not available: {e}")
+        return result.stdout.strip()
+
+    def _dump_json(self, url):
+        cmd = self.command + ["-J", url]
+        try:
+            with span("extract", engine=self.name):
+                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise EngineError(e.stderr if e.stderr else "Failed to fetch video information")
+        except FileNotFoundError as e:
+            raise EngineError(str(e))
+        return result.stdout
+
+    def extract_info(self, url):
+        text = self._dump_json(url)
+        with span("parse", size=len(text)):
+            return json.loads(text)
+
+    def extract_video(self, url):
+        """Return the compact VideoInfo of a video, for display rather than download"""
+        return VideoInfo.from_json(self._dump_json(url), url)
+
+    def iter_entries(self, url):
+        """Yield the flat entries of a playlist or channel as yt-dlp prints them"""
+        cmd = self.command + ["--flat-playlist", "--lazy-playlist", "-j", url]
+        # stderr goes to a file so a chatty yt-dlp can never block on a full pipe
+        with tempfile.TemporaryFile(mode="w+") as stderr:
+            try:
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr,
+                                           universal_newlines=True, bufsize=1)
+            except FileNotFoundError as e:
+                raise EngineError(str(e))
+            try:
+                for line in process.stdout:
+                    if line.strip():
+                        yield json.loads(line)
+                process.wait()
+                if process.returncode != 0:
+                    stderr.seek(0)
+                    raise EngineError(stderr.read() or "Failed to list playlist entries")
+            finally:
+                # Stop yt-dlp if the caller stopped iterating early
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+
+    def download(self, url, format_id, output_template, progress_hook=None, info=None, connections=1,
+                 rate_limit=None):
+        # Progress arrives through a pipe, so a sleeping hook would only
+        # throttle yt-dlp once the pipe is full; it gets the cap directly
+        cmd = self.command + [
+            "-f", format_id,
+            "-o", output_template,
+            "-N", str(max(1, connections)),
+        ] + (["--limit-rate", str(int(rate_limit))] if rate_limit else []) + [
+            "--newline",
+            "--progress-template", PROGRESS_TEMPLATE,
+            # --print implies --quiet, so progress has to be asked for again
+            "--print", FILEPATH_TEMPLATE,
+            "--progress",
+            url
+        ]
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                bufsize=1
+            )
+        except FileNotFoundError as e:
+            raise EngineError(str(e))
+
+        filepath = None
+        # Anything that is not progress is kept for the error message
+        output = deque(maxlen=OUTPUT_TAIL_LINES)
+        try:
+            for line in process.stdout:
+                if line.startswith(FILEPATH_PREFIX):
+                    filepath = line[len(FILEPATH_PREFIX):].rstrip("\r\n")
+                    continue
+                # yt-dlp prints one JSON progress document per line
+                event = ProgressEvent.from_template_line(line)
+                if event is None:
+                    if line.strip():
+                        output.append(line.rstrip())
+                elif progress_hook is not None:
+                    progress_hook(event)
+        except BaseException:
+            # Stop yt-dlp if the hook aborted the download
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            process.stdout.close()
+        process.wait()
+        if process.returncode != 0:
+            raise EngineError("\n".join(output) or f"Download failed with exit code {process.returncode}")
+        return filepath
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_engine(backend=None):
+    """Create an engine for the requested backend.
+
+    `backend` is "in-process", "subprocess" or None/"auto", in which case the
+    YTD_ENGINE environment variable is honoured and the in-process engine is
+    used whenever yt-dlp can be imported.
+    """
+    backend = backend or os.environ.get("YTD_ENGINE", "auto")
+    if backend == SubprocessEngine.name:
+        return SubprocessEngine()
+    if backend == InProcessEngine.name:
+        return InProcessEngine()
+    # Only look for the package; importing it takes long and happens in warm_up()
+    if importlib.util.find_spec("yt_dlp") is None:
+        return SubprocessEngine()
+    return InProcessEngine()
+
+
+def get_engine(refresh=False):
+    """Return the shared engine, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None or refresh:
+            _engine = create_engine()
+        return _engine
+
+
+def _install_key(engine):
+    # Identifies the installed yt-dlp without importing it; None if unknown
+    spec = importlib.util.find_spec("yt_dlp")
+    if spec is None or not spec.origin:
+        return None
+    version_file = os.path.join(os.path.dirname(spec.origin), "version.py")
+    try:
+        mtime = os.path.getmtime(version_file)
+    except OSError:
+        return None
+    command = getattr(engine, "command", None)
+    return [engine.name, sys.executable, command, version_file, mtime]
+
+
+def ytdlp_version(engine=None, cache_path=None):
+    """Return the yt-dlp version, raising EngineError if it is not available.
+
+    The answer is cached on disk and reused by later runs until the
+    installed yt-dlp changes, so a normal start neither imports yt-dlp nor
+    spawns a process just to check that it is there.
+    """
+    engine = engine or get_engine()
+    cache_path = cache_path or os.path.join(user_cache_dir(), "ytdlp-version.json")
+    key = _install_key(engine)
+    if key is not None:
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get('key') == key:
+                return cached['version']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    version = engine.version()
+    if key is not None:
+        try:
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'key': key, 'version': version}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # only an optimization
+    return version
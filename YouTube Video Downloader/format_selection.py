@@ -0,0 +1,227 @@
+"""Pick the best separate video and audio streams according to simple rules.
+
+Rules are written as comma separated clauses, for example
+
+    <=1080p, prefer av1 then vp9, prefer opus, max 2 GB
+
+Supported clauses:
+    <=1080p / >=480p     bounds on the video height (also "≤" and "≥")
+    <=30fps              upper bound on the frame rate
+    prefer A then B ...  codec preference; video (av1, vp9, avc, hevc) and
+                         audio (opus, aac, vorbis, mp3) codecs may be mixed
+    max 2 GB             cap on the combined size (B, KB, MB, GB; 1024 based)
+    container mkv        output container for the merged file
+"""
+import re
+
+from instrumentation import span
+
+AUTO_FORMAT = "auto"
+
+VIDEO_CODECS = ("av1", "vp9", "hevc", "avc")
+AUDIO_CODECS = ("opus", "aac", "vorbis", "mp3")
+SIZE_UNITS = {'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3}
+
+# Containers that can hold each codec without re-encoding
+MP4_CODECS = {"avc", "hevc", "av1", "aac", "mp3"}
+WEBM_CODECS = {"vp9", "av1", "opus", "vorbis"}
+
+
+class FormatSelectionError(ValueError):
+    """Raised for malformed rules or when no format satisfies them"""
+
+
+def codec_family(codec):
+    """Map a yt-dlp codec string such as 'avc1.64001F' to a family name"""
+    if not codec or codec == "none":
+        return None
+    codec = codec.lower()
+    if codec.startswith(("av01", "av1")):
+        return "av1"
+    if codec.startswith(("vp09", "vp9")):
+        return "vp9"
+    if codec.startswith(("avc", "h264")):
+        return "avc"
+    if codec.startswith(("hev", "hvc", "h265")):
+        return "hevc"
+    if codec.startswith("opus"):
+        return "opus"
+    if codec.startswith(("mp4a", "aac")):
+        return "aac"
+    if codec.startswith("vorbis"):
+        return "vorbis"
+    if codec.startswith("mp3"):
+        return "mp3"
+    return codec.split(".")[0]
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) else 0
+
+
+class SelectionRules:
+    def __init__(self, max_height=None, min_height=None, max_fps=None, video_codecs=(),
+                 audio_codecs=(), max_size=None, container=None):
+        self.max_height = max_height
+        self.min_height = min_height
+        self.max_fps = max_fps
+        self.video_codecs = tuple(video_codecs)
+        self.audio_codecs = tuple(audio_codecs)
+        self.max_size = max_size
+        self.container = container
+
+    @classmethod
+    def parse(cls, text):
+        rules = cls()
+        for clause in filter(None, (c.strip().lower() for c in (text or "").split(","))):
+            clause = clause.replace("≤", "<=").replace("≥", ">=")
+            match = re.fullmatch(r"(<=|>=)\s*(\d+)\s*p", clause)
+            if match:
+                if match.group(1) == "<=":
+                    rules.max_height = int(match.group(2))
+                else:
+                    rules.min_height = int(match.group(2))
+                continue
+            match = re.fullmatch(r"<=\s*(\d+)\s*fps", clause)
+            if match:
+                rules.max_fps = int(match.group(1))
+                continue
+            match = re.fullmatch(r"max\s*([\d.]+)\s*(b|kb|mb|gb)", clause)
+            if match:
+                rules.max_size = int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+                continue
+            match = re.fullmatch(r"container\s+(mp4|mkv|webm)", clause)
+            if match:
+                rules.container = match.group(1)
+                continue
+            if clause.startswith("prefer "):
+                for codec in re.split(r"\s+then\s+|\s+", clause[len("prefer "):].strip()):
+                    codec = codec_family(codec)
+                    if codec in VIDEO_CODECS:
+                        rules.video_codecs += (codec,)
+                    elif codec in AUDIO_CODECS:
+                        rules.audio_codecs += (codec,)
+                    else:
+                        raise FormatSelectionError(f"Unknown codec in rule: {clause!r}")
+                continue
+            raise FormatSelectionError(f"Unknown format rule: {clause!r}")
+        return rules
+
+    def __repr__(self):
+        return (f"SelectionRules(max_height={self.max_height}, min_height={self.min_height}, "
+                f"max_fps={self.max_fps}, video_codecs={self.video_codecs}, "
+                f"audio_codecs={self.audio_codecs}, max_size={self.max_size}, container={self.container})")
+
+    def allows_video(self, fmt):
+        height = _number(fmt.get('height'))
+        if self.max_height and height > self.max_height:
+            return False
+        if self.min_height and height < self.min_height:
+            return False
+        if self.max_fps and _number(fmt.get('fps')) > self.max_fps:
+            return False
+        return True
+
+
+def _preference(family, preferred):
+    # Preferred codecs score by their position, everything else ties last
+    return len(preferred) - preferred.index(family) if family in preferred else 0
+
+
+def video_key(fmt, rules):
+    """Sort key for video streams: resolution, then fps, codec preference, bitrate"""
+    return (
+        _number(fmt.get('height')),
+        _number(fmt.get('fps')),
+        _preference(codec_family(fmt.get('vcodec')), rules.video_codecs),
+        _number(fmt.get('vbr') or fmt.get('tbr')),
+    )
+
+
+def audio_key(fmt, rules):
+    """Sort key for audio streams: codec preference, then bitrate"""
+    return (
+        _preference(codec_family(fmt.get('acodec')), rules.audio_codecs),
+        _number(fmt.get('abr') or fmt.get('tbr')),
+    )
+
+
+def estimate_size(fmt, duration=None):
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and duration and fmt.get('tbr'):
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return size or 0
+
+
+def rank_formats(formats, rules):
+    """Return (videos, audios): video-only and audio-only streams, best first"""
+    videos = [f for f in formats
+              if codec_family(f.get('vcodec')) and not codec_family(f.get('acodec')) and rules.allows_video(f)]
+    audios = [f for f in formats
+              if codec_family(f.get('acodec')) and not codec_family(f.get('vcodec'))]
+    videos.sort(key=lambda f: video_key(f, rules), reverse=True)
+    audios.sort(key=lambda f: audio_key(f, rules), reverse=True)
+    return videos, audios
+
+
+def resolve_format(info, spec):
+    """Return the format dict a simple format spec picks from a `-J` document, or None.
+
+    Understands format IDs, and "best" and "worst" (the best or worst file
+    with both video and audio, as yt-dlp picks them). Anything else, such as
+    "bestvideo+bestaudio" or filters, is left to yt-dlp.
+    """
+    formats = info.get('formats') or []
+    for fmt in formats:
+        if fmt.get('format_id') == spec:
+            return fmt
+    if spec in ("best", "worst"):
+        progressive = [f for f in formats if codec_family(f.get('vcodec')) and codec_family(f.get('acodec'))]
+        if progressive:
+            rules = SelectionRules()
+            pick = max if spec == "best" else min
+            return pick(progressive, key=lambda f: video_key(f, rules))
+    return None
+
+
+def select_pair(info, rules=None, separate=True):
+    """Return the best (video, audio) pair of format dicts for a `-J` document.
+
+    When the video has no separate streams, or `separate` is False because
+    they could not be merged, the best progressive format is returned as
+    (format, None).
+    """
+    rules = rules or SelectionRules()
+    with span("select"):
+        return _select_pair(info, rules, separate)
+
+
+def _select_pair(info, rules, separate=True):
+    formats = info.get('formats', [])
+    duration = info.get('duration')
+    if separate:
+        videos, audios = rank_formats(formats, rules)
+        for video in videos:
+            for audio in audios:
+                if not rules.max_size or estimate_size(video, duration) + estimate_size(audio, duration) <= rules.max_size:
+                    return video, audio
+
+    progressive = [f for f in formats
+                   if codec_family(f.get('vcodec')) and codec_family(f.get('acodec')) and rules.allows_video(f)]
+    progressive.sort(key=lambda f: video_key(f, rules), reverse=True)
+    for fmt in progressive:
+        if not rules.max_size or estimate_size(fmt, duration) <= rules.max_size:
+            return fmt, None
+    raise FormatSelectionError("No format matches the selection rules")
+
+
+def merge_container(video, audio, rules=None):
+    """Pick a container that can hold both streams without re-encoding"""
+    if rules and rules.container:
+        return rules.container
+    codecs = {codec_family(video.get('vcodec')), codec_family(audio.get('acodec'))}
+    if codecs <= MP4_CODECS:
+        return "mp4"
+    if codecs <= WEBM_CODECS:
+        return "webm"
+    return "mkv"
@@ -0,0 +1,326 @@
+"""Per-stage timings and counters of the whole app, and their exporters.
+
+Code wraps each stage it wants to see in `with span("extract"):`, which
+records how long the stage took and whether it raised. Counters (bytes
+downloaded, retries, 429s) only go up, gauges (queue depth) hold the last
+value set, and event() notes something that happened, mostly failures that
+would otherwise only reach print() or a message box.
+
+Everything lands in one process-wide Metrics object. Its sinks see every
+span and event as a record dict (JsonLinesLog appends them to a file), and
+MetricsServer serves its totals in the Prometheus text format. Spans are
+timed one after another, not nested: a lookup records "extract" (or
+"parse" for the subprocess engine's JSON) and then "formats", so each
+stage's time is its own.
+
+profile_call() runs a function under cProfile, threads included, for the
+CLI's --profile mode.
+"""
+import re
+import sys
+import json
+import time
+import threading
+import contextlib
+
+# Upper bounds of the span duration histogram, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+PREFIX = "ytd_"
+DEFAULT_PORT = 9464
+PROFILE_TOP = 25  # functions printed by profile_call()
+
+NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class SpanStats:
+    """Count, errors, total and histogram of one stage's durations"""
+
+    __slots__ = ("count", "errors", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds, error):
+        self.count += 1
+        self.errors += bool(error)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'total_seconds': round(self.total, 6),
+            'mean_seconds': round(self.total / self.count, 6) if self.count else 0.0,
+            'max_seconds': round(self.max, 6),
+        }
+
+
+class Metrics:
+    """Spans, counters and gauges of a process; every method is thread safe"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._spans = {}
+        self._counters = {}
+        self._gauges = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        """Time the body as stage `name`.
+
+        Yields the record's `fields`, so the body can add to them, e.g. the
+        bytes it downloaded. A 'bytes' field also counts towards
+        `<name>_bytes` and adds the throughput to the record.
+        """
+        start = time.perf_counter()
+        error = None
+        try:
+            yield fields
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.record_span(name, time.perf_counter() - start,
+                             f"{type(error).__name__}: {error}" if error is not None else None, **fields)
+
+    def record_span(self, name, seconds, error=None, **fields):
+        """Record a stage timed elsewhere, e.g. across threads"""
+        nbytes = fields.get('bytes')
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = SpanStats()
+            stats.add(seconds, error)
+            if nbytes:
+                self._counters[f"{name}_bytes"] = self._counters.get(f"{name}_bytes", 0) + nbytes
+            sinks = self._sinks
+        if sinks:
+            if nbytes and seconds > 0:
+                fields['bytes_per_second'] = round(nbytes / seconds)
+            self._emit(sinks, dict(type="span", name=name, seconds=round(seconds, 6), error=error, **fields))
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def event(self, name, **fields):
+        """Note that something happened; counted as `events` and passed to the sinks"""
+        with self._lock:
+            key = f"events_{name}"
+            self._counters[key] = self._counters.get(key, 0) + 1
+            sinks = self._sinks
+        if sinks:
+            self._emit(sinks, dict(type="event", name=name, **fields))
+
+    @staticmethod
+    def _emit(sinks, record):
+        record['time'] = round(time.time(), 6)
+        record['thread'] = threading.current_thread().name
+        for sink in sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                # A broken exporter must never fail the download it observes
+                print(f"Error exporting metrics: {e}", file=sys.stderr)
+
+    def add_sink(self, sink):
+        """Call `sink(record)` for every span and event from now on"""
+        with self._lock:
+            # Copied, so emitting never holds the lock
+            self._sinks = self._sinks + [sink]
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self._sinks = [s for s in self._sinks if s is not sink]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'uptime_seconds': round(time.time() - self.started, 3),
+                'spans': {name: stats.as_dict() for name, stats in self._spans.items()},
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+            }
+
+    def prometheus(self):
+        """The totals in the Prometheus text exposition format"""
+        with self._lock:
+            spans = {name: (stats.count, stats.errors, stats.total, list(stats.buckets))
+                     for name, stats in self._spans.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        lines = [
+            f"# TYPE {PREFIX}uptime_seconds gauge",
+            f"{PREFIX}uptime_seconds {time.time() - self.started:.3f}",
+            f"# TYPE {PREFIX}span_seconds histogram",
+        ]
+        for name, (count, errors, total, buckets) in sorted(spans.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append(f'{PREFIX}span_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}span_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{PREFIX}span_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{PREFIX}span_seconds_count{{stage="{name}"}} {count}')
+        lines.append(f"# TYPE {PREFIX}span_errors_total counter")
+        for name, (_, errors, _, _) in sorted(spans.items()):
+            lines.append(f'{PREFIX}span_errors_total{{stage="{name}"}} {errors}')
+        for name, value in sorted(counters.items()):
+            metric = f"{PREFIX}{NAME_RE.sub('_', name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, value in sorted(gauges.items()):
+            metric = f"{PREFIX}{NAME_RE.sub('_', name)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """Return the Metrics object every part of the app records into"""
+    return _metrics
+
+
+def span(name, **fields):
+    return _metrics.span(name, **fields)
+
+
+def count(name, value=1):
+    _metrics.count(name, value)
+
+
+def set_gauge(name, value):
+    _metrics.set_gauge(name, value)
+
+
+def event(name, **fields):
+    _metrics.event(name, **fields)
+
+
+class JsonLinesLog:
+    """Sink that appends each record to `path` as one line of JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _handler_class():
+    # http.server is imported only when an endpoint is actually started
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            metrics = self.server.metrics
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body = metrics.prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body = json.dumps(metrics.snapshot()).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return MetricsHandler
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /metrics.json on a local port"""
+
+    def __init__(self, metrics=None, host="127.0.0.1", port=DEFAULT_PORT):
+        from http.server import ThreadingHTTPServer
+        self.httpd = ThreadingHTTPServer((host, port), _handler_class())
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = metrics or get_metrics()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def profile_call(path, func, *args, **kwargs):
+    """Run `func(*args, **kwargs)` under cProfile and write the stats to `path`.
+
+    Lookups and downloads run in worker threads, so every thread started
+    meanwhile gets a profiler too and all of them are merged. The hottest
+    functions by cumulative time are printed to stderr.
+    """
+    import cProfile
+    import pstats
+
+    profiles = []
+
+    def start_thread_profiler(frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return  # Python 3.12+ profiles every thread from the first profiler
+        profiles.append(profile)
+
+    main = cProfile.Profile()
+    threading.setprofile(start_thread_profiler)
+    main.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        main.disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(main, stream=sys.stderr)
+        for profile in profiles:
+            stats.add(profile)
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(f"Profile written to {path}", file=sys.stderr)
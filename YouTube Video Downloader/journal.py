@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+from paths import user_data_dir
+from download_queue import DONE, FAILED, SKIPPED, CANCELLED
+
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds between commits
+DEFAULT_RETENTION = 30 * 24 * 60 * 60  # finished jobs are kept this long
+DEFAULT_LEASE = 15.0  # seconds an unfinished job stays claimed after its journal stops renewing it
+
+COLUMNS = ("id", "url", "format_id", "output_dir", "title", "video_id", "path", "state", "progress",
+           "downloaded_bytes", "total_bytes", "pipeline", "context", "rate_limit", "error",
+           "created_at", "updated_at")
+FINISHED_STATES = (DONE, FAILED, SKIPPED, CANCELLED)
+# Written on every flush; the ID and creation time never change
+UPDATED_COLUMNS = tuple(column for column in COLUMNS if column not in ("id", "created_at"))
+OWNER_COLUMNS = ("owner", "owner_host", "owner_pid", "lease_until")
+HOST = socket.gethostname()
+
+
+def pid_alive(pid):
+    """Whether a process with this ID is running on this machine"""
+    if sys.platform == "win32":
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED: it exists
+        code = ctypes.c_ulong()
+        try:
+            return not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)) or code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # EPERM: it exists, it just is not ours
+        return True
+    return True
+
+
+def claimable(owner, owner_host, owner_pid, lease_until, now):
+    """Whether an unfinished job may be taken over, given its OWNER_COLUMNS"""
+    if owner is None or lease_until is None or lease_until < now:
+        return True
+    # Its owner crashed or was killed on this machine
+    return owner_host == HOST and owner_pid is not None and not pid_alive(owner_pid)
+
+
+class JobJournal:
+    """Durable record of download jobs, so unfinished ones survive a restart.
+
+    Every job is a row with its URL, format, output directory and path,
+    state and progress. update() only changes an in-memory copy of the row
+    and a background thread writes all changed rows in one transaction every
+    `flush_interval` seconds, so hundreds of progress updates a second cost
+    one small commit. At most that much progress is lost in a crash, and
+    partial downloads resume from their `.part` files anyway. Rows are
+    returned as plain dicts with the keys in COLUMNS.
+
+    The GUI and the CLI may share the database. IDs come from SQLite, as
+    add() inserts the row straight away, and every unfinished job is owned
+    by the journal that added or claimed it. Owners renew their lease with
+    each flush and release their jobs on close(); claim_unfinished() only
+    takes over jobs without an owner, whose lease ran out, or whose owner
+    was a process on this machine that is no longer running, so a restart
+    right after a crash gets its jobs back at once.
+    """
+
+    def __init__(self, path=None, flush_interval=DEFAULT_FLUSH_INTERVAL, retention=DEFAULT_RETENTION,
+                 lease=DEFAULT_LEASE):
+        self.path = path or os.path.join(user_data_dir(), "jobs.sqlite3")
+        self.flush_interval = flush_interval
+        self.lease = max(lease, 2 * flush_interval)
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                format_id TEXT,
+                output_dir TEXT,
+                title TEXT,
+                video_id TEXT,
+                path TEXT,
+                state TEXT NOT NULL,
+                progress REAL,
+                downloaded_bytes INTEGER,
+                total_bytes INTEGER,
+                pipeline TEXT,
+                context TEXT,
+                rate_limit INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                owner_host TEXT,
+                owner_pid INTEGER,
+                lease_until REAL
+            )
+        """)
+        # Journals written before jobs had owners
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("owner_host", "TEXT"), ("owner_pid", "INTEGER"),
+                             ("lease_until", "REAL")):
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self._db.commit()
+        if retention:
+            self.prune(retention)
+        self._rows = {}  # job ID -> row of every live job this journal writes
+        self._dirty = set()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal", daemon=True)
+        self._flusher.start()
+
+    def add(self, url, format_id=None, output_dir=None, title=None, pipeline=None, rate_limit=None,
+            state="queued"):
+        """Record a new job, owned by this journal, and return its ID"""
+        now = time.time()
+        row = dict(dict.fromkeys(COLUMNS), url=url, format_id=format_id, output_dir=output_dir, title=title,
+                   pipeline=pipeline, rate_limit=rate_limit, state=state, progress=0.0,
+                   created_at=now, updated_at=now)
+        columns = COLUMNS[1:]
+        with self._lock:
+            # Inserted now rather than with the next batch, so SQLite hands
+            # out the ID even with other processes adding jobs
+            cursor = self._db.execute(
+                f"INSERT INTO jobs ({', '.join(columns + OWNER_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(columns) + len(OWNER_COLUMNS)))})",
+                [row[column] for column in columns] + list(self._ownership(now))
+            )
+            self._db.commit()
+            row['id'] = cursor.lastrowid
+            self._rows[row['id']] = row
+        return row['id']
+
+    def update(self, job_id, **fields):
+        """Change columns of a job; cheap enough to call on every progress update"""
+        with self._lock:
+            row = self._rows.get(job_id)
+            if row is None:
+                row = self._select(job_id)
+                if row is None:
+                    return
+                self._rows[job_id] = row
+            row.update(fields, updated_at=time.time())
+            self._dirty.add(job_id)
+
+    def _ownership(self, now):
+        # Values of OWNER_COLUMNS for a job this journal adds or claims
+        return self.owner, HOST, os.getpid(), now + self.lease
+
+    def _select(self, job_id):
+        # Called with the lock held
+        found = self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(COLUMNS, found)) if found is not None else None
+
+    def flush(self):
+        """Write every changed job now and renew the lease on the live ones; returns the rows written"""
+        with self._lock:
+            if not self._rows:
+                return 0
+            rows = [[self._rows[job_id][column] for column in UPDATED_COLUMNS] + [job_id] for job_id in self._dirty]
+            if rows:
+                self._db.executemany(
+                    f"UPDATE jobs SET {', '.join(f'{column} = ?' for column in UPDATED_COLUMNS)} WHERE id = ?",
+                    rows
+                )
+            self._db.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE owner = ? "
+                f"AND state NOT IN ({', '.join('?' * len(FINISHED_STATES))})",
+                (time.time() + self.lease, self.owner) + FINISHED_STATES
+            )
+            self._db.commit()
+            # Finished jobs are not updated any more, only keep the live ones
+            for job_id in self._dirty:
+                if self._rows[job_id]['state'] in FINISHED_STATES:
+                    del self._rows[job_id]
+            self._dirty.clear()
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                # Keep the rows dirty and try again with the next batch
+                print(f"Error writing the job journal: {e}")
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._rows.get(job_id) or self._select(job_id)
+            return dict(row) if row is not None else None
+
+    def unfinished(self):
+        """Return the jobs that were neither finished, failed, skipped nor cancelled, oldest first.
+
+        Jobs other processes are still working on are included; use
+        claim_unfinished() to take over jobs for resuming them.
+        """
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE state NOT IN ({', '.join('?' * len(FINISHED_STATES))}) "
+                "ORDER BY id", FINISHED_STATES
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def claim_unfinished(self):
+        """Take over the unfinished jobs nobody is working on and return them, oldest first.
+
+        Claiming happens in one write transaction, so two processes resuming
+        at the same time never get the same job. Jobs this journal already
+        owns are not returned.
+        """
+        self.flush()
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                found = self._db.execute(
+                    f"SELECT {', '.join(COLUMNS + OWNER_COLUMNS)} FROM jobs "
+                    f"WHERE state NOT IN ({', '.join('?' * len(FINISHED_STATES))}) "
+                    "AND (owner IS NULL OR owner != ?) ORDER BY id",
+                    FINISHED_STATES + (self.owner,)
+                ).fetchall()
+                rows = [row[:len(COLUMNS)] for row in found if claimable(*row[len(COLUMNS):], now)]
+                self._db.executemany(
+                    f"UPDATE jobs SET {', '.join(f'{column} = ?' for column in OWNER_COLUMNS)} WHERE id = ?",
+                    [self._ownership(now) + (row[0],) for row in rows]
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+            jobs = [dict(zip(COLUMNS, row)) for row in rows]
+            for job in jobs:
+                self._rows[job['id']] = dict(job)
+        return jobs
+
+    def lease_expiry(self):
+        """When the first lease another journal holds on an unfinished job runs out, or None.
+
+        Those jobs are claimable from then on unless their owner keeps it
+        renewed, so callers can try claim_unfinished() again at that time.
+        """
+        with self._lock:
+            found = self._db.execute(
+                f"SELECT MIN(lease_until) FROM jobs WHERE state NOT IN ({', '.join('?' * len(FINISHED_STATES))}) "
+                "AND owner IS NOT NULL AND owner != ?", FINISHED_STATES + (self.owner,)
+            ).fetchone()
+        return found[0]
+
+    def query(self, state=None, limit=None):
+        """Return jobs, newest first, optionally only those in `state`"""
+        self.flush()
+        sql = f"SELECT {', '.join(COLUMNS)} FROM jobs"
+        params = []
+        if state is not None:
+            sql += " WHERE state = ?"
+            params.append(state)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def remove(self, job_id):
+        with self._lock:
+            self._rows.pop(job_id, None)
+            self._dirty.discard(job_id)
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+
+    def prune(self, older_than=DEFAULT_RETENTION):
+        """Forget finished jobs last updated more than `older_than` seconds ago"""
+        with self._lock:
+            cursor = self._db.execute(
+                f"DELETE FROM jobs WHERE state IN ({', '.join('?' * len(FINISHED_STATES))}) AND updated_at < ?",
+                FINISHED_STATES + (time.time() - older_than,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def close(self):
+        """Write what is left, release the unfinished jobs and close the database"""
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        with self._lock:
+            # Resumable by the next journal right away
+            self._db.execute("UPDATE jobs SET owner = NULL, lease_until = NULL WHERE owner = ?", (self.owner,))
+            self._db.commit()
+            self._db.close()
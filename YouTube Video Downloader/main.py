@@ -1,16 +1,31 @@
 import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import threading
-import re
-from PIL import Image, ImageTk
-import requests
-from io import BytesIO
 import time
+from collections import deque
 import subprocess
 import sys
-import json
-import platform
+from engine import get_engine, ytdlp_version, EngineError
+from core import Downloader, describe_error, is_valid_youtube_url, is_playlist_url, clean_youtube_url
+from download_queue import DEFAULT_WORKERS, DOWNLOADING, DONE, FAILED, SKIPPED, CANCELLED, WAITING
+from scheduler import Scheduler, METADATA, THUMBNAILS, FAILED as JOB_FAILED, current_job
+from progress import describe_progress
+from thumbnails import ThumbnailCache, THUMBNAIL_SIZE
+from postprocess import parse_pipeline
+from instrumentation import get_metrics, JsonLinesLog, MetricsServer
+
+POLL_INTERVAL_MS = 50
+# Choices of the "After download" box -> post-processing pipeline spec
+POSTPROCESS_PRESETS = {
+    "Nothing": "",
+    "Extract MP3": "audio:mp3",
+    "Extract MP3 with tags and cover": "audio:mp3, tags",
+    "Extract Opus": "audio:opus, tags:nocover",
+    "Embed tags and cover": "tags",
+    "Remux to MKV": "remux:mkv",
+    "Write SHA-256 checksum": "hash",
+}
+
 
 class YouTubeDownloaderApp(ttk.Frame):
     def __init__(self, master=None):
@@ -26,42 +41,109 @@ class YouTubeDownloaderApp(ttk.Frame):
         # State variables
         self.video_info = None
         self.thumbnail_image = None
+        self.thumbnails = ThumbnailCache()
         self.formats = []
         self.download_path = os.path.join(os.path.expanduser("~"), "Downloads")
+        self.core = Downloader(self.download_path)
+        # All background work goes through the scheduler; its results are
+        # handed to the Tk thread by _poll_scheduler
+        self.scheduler = Scheduler(polled=True)
+        self.download_queue = self.core.create_queue(on_update=self._on_queue_update, scheduler=self.scheduler)
+        self.playlist_entries = {}
+        self._lookup_job = None
+        self._refresh_job = None
+        self._playlist_job = None
+        self._pending_entries = deque()
+        # Set once yt-dlp was found; the window is usable before that
+        self.ytdlp_ready = False
         
         # Configure the master window
         self.master.title("YouTube Video Downloader")
-        self.master.geometry("800x600")
+        self.master.geometry("800x700")
         self.master.minsize(600, 500)
         self.master.configure(bg=self.bg_color)
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
         self.configure(style="Main.TFrame")
         
-        # Check for yt-dlp installation
-        self.check_ytdlp()
-        
         # Create custom styles
         self.create_styles()
         
         # Create the UI elements
         self.create_widgets()
+        self._poll_scheduler()
+        
+        # Check for yt-dlp installation once the window is on screen
+        self.after_idle(self.check_ytdlp)
+    
+    def _poll_scheduler(self):
+        # The single bridge between the worker threads and Tk
+        self.scheduler.poll()
+        self._drain_playlist_entries()
+        self.after(POLL_INTERVAL_MS, self._poll_scheduler)
     
     def check_ytdlp(self):
-        """Check if yt-dlp is installed and install it if not"""
-        try:
-            # Try to run yt-dlp --version
-            if platform.system() == "Windows":
-                subprocess.run(["yt-dlp", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-            else:
-                subprocess.run(["yt-dlp", "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        except (subprocess.SubprocessError, FileNotFoundError):
+        """Check in the background if yt-dlp is installed and install it if not"""
+        self.scheduler.submit(METADATA, ytdlp_version, self.core.engine, key="ytdlp-version",
+                              on_done=self._on_ytdlp_checked)
+    
+    def _on_ytdlp_checked(self, job):
+        if job.state == JOB_FAILED:
             # yt-dlp is not installed, try to install it
-            try:
-                messagebox.showinfo("Installing yt-dlp", "yt-dlp is not installed. Installing now...")
-                subprocess.run([sys.executable, "-m", "pip", "install", "--upgrade", "yt-dlp"], check=True)
-                messagebox.showinfo("Success", "yt-dlp installed successfully!")
-            except subprocess.SubprocessError:
-                messagebox.showerror("Error", "Failed to install yt-dlp. Please install it manually using: pip install yt-dlp")
-                sys.exit(1)
+            messagebox.showinfo("Installing yt-dlp", "yt-dlp is not installed. Installing now...")
+            self.status_var.set("Installing yt-dlp...")
+            self.scheduler.submit(METADATA, self._install_ytdlp, key="ytdlp-install",
+                                  on_done=self._on_ytdlp_installed)
+            return
+        self.ytdlp_ready = True
+        # Import the extractors now so the first search is already warm
+        self.scheduler.submit(METADATA, self.core.engine.warm_up, key="ytdlp-warm-up")
+        self.resume_downloads()
+    
+    @staticmethod
+    def _install_ytdlp():
+        subprocess.run([sys.executable, "-m", "pip", "install", "--upgrade", "yt-dlp"], check=True)
+        return get_engine(refresh=True)
+    
+    def _on_ytdlp_installed(self, job):
+        if job.state == JOB_FAILED:
+            messagebox.showerror("Error", "Failed to install yt-dlp. Please install it manually using: pip install yt-dlp")
+            self.master.destroy()
+            return
+        self.core.engine = self.download_queue.engine = job.result
+        self.ytdlp_ready = True
+        self.status_var.set("")
+        messagebox.showinfo("Success", "yt-dlp installed successfully!")
+        self.resume_downloads()
+    
+    def resume_downloads(self):
+        """Queue the downloads that were still unfinished when the app last closed"""
+        self.scheduler.submit(METADATA, self._resume_unfinished, key="resume-downloads",
+                              on_done=self._on_downloads_resumed)
+    
+    def _resume_unfinished(self):
+        items = self.download_queue.resume_unfinished()
+        journal = self.core.journal
+        return items, journal.lease_expiry() if journal is not None else None
+    
+    def _on_downloads_resumed(self, job):
+        if job.state == JOB_FAILED:
+            return
+        items, lease_expiry = job.result
+        if lease_expiry is not None:
+            # Jobs another instance still held a lease on; try again once it runs
+            # out, which only happens if that instance is gone
+            self.after(max(0, int((lease_expiry - time.time()) * 1000)) + 100, self.resume_downloads)
+        if items:
+            self.status_var.set(f"Resumed {len(items)} unfinished downloads.")
+    
+    def on_close(self):
+        # Unfinished jobs stay in the journal and resume on the next start
+        self.download_queue.shutdown()
+        self.scheduler.shutdown()
+        self.core.postprocessor.shutdown(wait=False)
+        if self.core.journal is not None:
+            self.core.journal.close()
+        self.master.destroy()
     
     def create_styles(self):
         style = ttk.Style()
@@ -131,10 +213,37 @@ class YouTubeDownloaderApp(ttk.Frame):
         self.url_entry.bind("<FocusIn>", self.clear_placeholder)
         self.url_entry.bind("<FocusOut>", self.restore_placeholder)
         
-        # Search button (centered below URL input)
-        search_button = ttk.Button(main_container, text="Search", style="Accent.TButton", 
+        # Search and import buttons (centered below URL input)
+        self.search_frame = ttk.Frame(main_container, style="Main.TFrame")
+        self.search_frame.pack(pady=(0, 20))
+        
+        search_button = ttk.Button(self.search_frame, text="Search", style="Accent.TButton", 
                                   command=self.search_video)
-        search_button.pack(pady=(0, 20))
+        search_button.pack(side=tk.LEFT, padx=(0, 10))
+        
+        import_button = ttk.Button(self.search_frame, text="Import URL List", style="Secondary.TButton",
+                                  command=self.import_url_list)
+        import_button.pack(side=tk.LEFT, padx=(0, 10))
+        
+        cancel_button = ttk.Button(self.search_frame, text="Cancel", style="Secondary.TButton",
+                                  command=self.cancel_lookup)
+        cancel_button.pack(side=tk.LEFT)
+        
+        # Playlist entries (initially hidden)
+        self.playlist_frame = ttk.Frame(main_container, style="Main.TFrame")
+        
+        self.playlist_tree = ttk.Treeview(self.playlist_frame, columns=("title", "duration"),
+                                          show="headings", height=6, selectmode="browse")
+        self.playlist_tree.heading("title", text="Video")
+        self.playlist_tree.heading("duration", text="Duration")
+        self.playlist_tree.column("title", width=560)
+        self.playlist_tree.column("duration", width=80, anchor="e")
+        self.playlist_tree.pack(fill=tk.BOTH, expand=True)
+        self.playlist_tree.bind("<<TreeviewSelect>>", self._select_playlist_entry)
+        
+        download_all_button = ttk.Button(self.playlist_frame, text="Download All", style="Secondary.TButton",
+                                         command=self.download_playlist)
+        download_all_button.pack(pady=(5, 0))
         
         # Video info container (initially hidden)
         self.video_container = ttk.Frame(main_container, style="Main.TFrame")
@@ -163,6 +272,18 @@ class YouTubeDownloaderApp(ttk.Frame):
                                         state="readonly", width=30)
         self.format_combo.pack(side=tk.LEFT)
         
+        # Post-processing of the finished download
+        postprocess_frame = ttk.Frame(self.video_container, style="Main.TFrame")
+        postprocess_frame.pack(pady=(0, 15))
+        
+        postprocess_label = ttk.Label(postprocess_frame, text="After download:", style="Normal.TLabel")
+        postprocess_label.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.postprocess_var = tk.StringVar(value="Nothing")
+        self.postprocess_combo = ttk.Combobox(postprocess_frame, textvariable=self.postprocess_var,
+                                              values=list(POSTPROCESS_PRESETS), state="readonly", width=30)
+        self.postprocess_combo.pack(side=tk.LEFT)
+        
         # Download and reset buttons
         button_frame = ttk.Frame(self.video_container, style="Main.TFrame")
         button_frame.pack(pady=(0, 15))
@@ -175,15 +296,63 @@ class YouTubeDownloaderApp(ttk.Frame):
                                       command=self.reset_form)
         self.reset_button.pack(side=tk.LEFT)
         
-        # Progress bar (initially hidden)
-        self.progress_frame = ttk.Frame(main_container, style="Main.TFrame")
-        self.progress_frame.pack(fill=tk.X, pady=(0, 15))
-        self.progress_frame.pack_forget()  # Hide initially
-        
-        self.progress_var = tk.DoubleVar()
-        self.progress_bar = ttk.Progressbar(self.progress_frame, variable=self.progress_var, 
-                                           maximum=100, length=400)
-        self.progress_bar.pack(pady=(0, 5))
+        # Download queue (initially hidden)
+        self.queue_frame = ttk.Frame(main_container, style="Main.TFrame")
+        self.queue_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 15))
+        self.queue_frame.pack_forget()  # Hide initially
+        
+        queue_controls = ttk.Frame(self.queue_frame, style="Main.TFrame")
+        queue_controls.pack(fill=tk.X, pady=(0, 5))
+        
+        workers_label = ttk.Label(queue_controls, text="Parallel downloads:", style="Normal.TLabel")
+        workers_label.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+        workers_spinbox = ttk.Spinbox(queue_controls, from_=1, to=16, width=4,
+                                      textvariable=self.workers_var, command=self._set_queue_workers)
+        workers_spinbox.pack(side=tk.LEFT, padx=(0, 20))
+        
+        connections_label = ttk.Label(queue_controls, text="Connections per download:", style="Normal.TLabel")
+        connections_label.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.connections_var = tk.IntVar(value=self.download_queue.connections)
+        connections_spinbox = ttk.Spinbox(queue_controls, from_=1, to=16, width=4,
+                                          textvariable=self.connections_var, command=self._set_queue_connections)
+        connections_spinbox.pack(side=tk.LEFT, padx=(0, 20))
+        
+        # Bandwidth caps in MB/s, 0 = unlimited; they apply to running downloads too
+        total_rate_label = ttk.Label(queue_controls, text="Max MB/s total:", style="Normal.TLabel")
+        total_rate_label.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.total_rate_var = tk.DoubleVar(value=0)
+        total_rate_spinbox = ttk.Spinbox(queue_controls, from_=0, to=1000, increment=0.5, width=5,
+                                         textvariable=self.total_rate_var, command=self._set_bandwidth)
+        total_rate_spinbox.pack(side=tk.LEFT, padx=(0, 20))
+        
+        job_rate_label = ttk.Label(queue_controls, text="per download:", style="Normal.TLabel")
+        job_rate_label.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.job_rate_var = tk.DoubleVar(value=0)
+        job_rate_spinbox = ttk.Spinbox(queue_controls, from_=0, to=1000, increment=0.5, width=5,
+                                       textvariable=self.job_rate_var, command=self._set_bandwidth)
+        job_rate_spinbox.pack(side=tk.LEFT, padx=(0, 20))
+        for spinbox in (total_rate_spinbox, job_rate_spinbox):
+            spinbox.bind("<Return>", lambda event: self._set_bandwidth())
+            spinbox.bind("<FocusOut>", lambda event: self._set_bandwidth())
+        
+        cancel_downloads_button = ttk.Button(queue_controls, text="Cancel", style="Secondary.TButton",
+                                             command=self.cancel_downloads)
+        cancel_downloads_button.pack(side=tk.LEFT)
+        
+        self.queue_tree = ttk.Treeview(self.queue_frame, columns=("title", "status", "progress"),
+                                       show="headings", height=6)
+        self.queue_tree.heading("title", text="Video")
+        self.queue_tree.heading("status", text="Status")
+        self.queue_tree.heading("progress", text="Progress")
+        self.queue_tree.column("title", width=360)
+        self.queue_tree.column("status", width=220)
+        self.queue_tree.column("progress", width=80, anchor="e")
+        self.queue_tree.pack(fill=tk.BOTH, expand=True)
         
         # Status message
         self.status_var = tk.StringVar()
@@ -205,130 +374,185 @@ class YouTubeDownloaderApp(ttk.Frame):
         if not self.url_entry.get():
             self.url_entry.insert(0, "Paste a Youtube video URL here")
     
-    def is_valid_youtube_url(self, url):
-        # More comprehensive regex pattern to match YouTube URLs
-        youtube_regex = r'(https?://)?(www\.)?(youtube\.com/watch\?v=|youtu\.be/|youtube\.com/shorts/)[\w-]+'
-        return re.match(youtube_regex, url) is not None
-    
-    def clean_youtube_url(self, url):
-        """Extract video ID from any YouTube URL and return canonical watch URL"""
-        # Try to find a video ID in the URL
-        patterns = [
-            r"youtu\.be/([A-Za-z0-9_-]{11})",
-            r"youtube\.com/watch\?v=([A-Za-z0-9_-]{11})",
-            r"youtube\.com/shorts/([A-Za-z0-9_-]{11})",
-            r"youtube\.com/embed/([A-Za-z0-9_-]{11})"
-        ]
-        video_id = None
-        for pat in patterns:
-            match = re.search(pat, url)
-            if match:
-                video_id = match.group(1)
-                break
-        if not video_id:
-            # Try to extract v=... from any query string
-            match = re.search(r"[?&]v=([A-Za-z0-9_-]{11})", url)
-            if match:
-                video_id = match.group(1)
-        if video_id:
-            return f"https://www.youtube.com/watch?v={video_id}"
-        return url
-    
     def search_video(self):
         url = self.url_var.get().strip()
         if url == "Paste a Youtube video URL here" or not url:
             messagebox.showerror("Error", "Please enter a YouTube URL")
             return
         
-        if not self.is_valid_youtube_url(url):
+        if not is_valid_youtube_url(url):
             messagebox.showerror("Error", "Invalid YouTube URL")
             return
         
+        # A new search replaces whatever is still being fetched
+        self._cancel_lookups()
+        
+        if is_playlist_url(url):
+            self._start_playlist(url)
+            return
+        
+        # A single video replaces any playlist that was shown before
+        self.playlist_frame.pack_forget()
+        
         # Clean the URL
-        clean_url = self.clean_youtube_url(url)
+        self._show_video(clean_youtube_url(url))
+    
+    def _show_video(self, clean_url):
+        # Show cached metadata straight away, refreshing it if it is stale
+        cached = self.core.cached_video_info(clean_url)
+        if cached:
+            video_info, is_stale = cached
+            self._update_video_info(video_info, video_info.formats)
+            if is_stale:
+                self._fetch_video_info(clean_url, refresh=True)
+            return
         
         # Show status and hide previous results
         self.status_var.set("Fetching video information...")
         self.video_container.pack_forget()
-        self.progress_frame.pack_forget()
         self.update_idletasks()
         
-        # Fetch video in a separate thread to avoid freezing the UI
-        threading.Thread(target=self._fetch_video_info, args=(clean_url,), daemon=True).start()
+        # Fetch video in the background to avoid freezing the UI
+        self._fetch_video_info(clean_url)
+    
+    def cancel_lookup(self):
+        """Stop the search, playlist listing and thumbnail fetches in flight"""
+        if self._cancel_lookups():
+            self.status_var.set("Cancelled.")
+    
+    def _cancel_lookups(self):
+        # Only the user's own lookups: the yt-dlp check, warm-up and resume
+        # share the METADATA pool and must still finish
+        jobs = [job for job in (self._lookup_job, self._refresh_job, self._playlist_job)
+                if job is not None and not job.done]
+        self._lookup_job = self._refresh_job = self._playlist_job = None
+        self._pending_entries.clear()
+        for job in jobs:
+            job.cancel()
+        return len(jobs) + self.scheduler.cancel_all(THUMBNAILS)
+    
+    def _start_playlist(self, url):
+        self.playlist_tree.delete(*self.playlist_tree.get_children())
+        self.playlist_entries = {}
+        
+        self.video_container.pack_forget()
+        self.playlist_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 15), after=self.search_frame)
+        self.status_var.set("Loading playlist entries...")
+        
+        self._playlist_job = self.scheduler.submit(METADATA, self._load_playlist, url, url=url)
     
-    def _fetch_video_info(self, url):
+    def _load_playlist(self, url):
+        job = current_job()
         try:
-            # Use yt-dlp to get video info
-            cmd = [sys.executable, "-m", "yt_dlp", "-J", url]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            video_info = json.loads(result.stdout)
-            
-            # Extract formats
-            formats = []
-            
-            # Add video+audio formats
-            for fmt in video_info.get('formats', []):
-                if fmt.get('vcodec', 'none') != 'none' and fmt.get('acodec', 'none') != 'none':
-                    resolution = fmt.get('height', 'unknown')
-                    fps = fmt.get('fps', 'unknown')
-                    ext = fmt.get('ext', 'unknown')
-                    format_id = fmt.get('format_id', '')
-                    
-                    format_name = f"{resolution}p"
-                    if fps:
-                        format_name += f", {fps}fps"
-                    format_name += f" ({ext.upper()})"
-                    
-                    formats.append({
-                        'name': format_name,
-                        'format_id': format_id,
-                        'resolution': resolution,
-                        'fps': fps,
-                        'ext': ext,
-                        'type': 'video'
-                    })
-            
-            # Add audio-only formats
-            for fmt in video_info.get('formats', []):
-                if fmt.get('vcodec', 'none') == 'none' and fmt.get('acodec', 'none') != 'none':
-                    abr = fmt.get('abr', 'unknown')
-                    ext = fmt.get('ext', 'unknown')
-                    format_id = fmt.get('format_id', '')
-                    
-                    format_name = f"Audio {abr}kbps ({ext.upper()})"
-                    
-                    formats.append({
-                        'name': format_name,
-                        'format_id': format_id,
-                        'abr': abr,
-                        'ext': ext,
-                        'type': 'audio'
-                    })
-            
-            # Sort formats by resolution (for video) or bitrate (for audio)
-            video_formats = sorted([f for f in formats if f['type'] == 'video'], 
-                                  key=lambda x: (x['resolution'] if isinstance(x['resolution'], int) else 0), 
-                                  reverse=True)
-            audio_formats = sorted([f for f in formats if f['type'] == 'audio'], 
-                                  key=lambda x: (x['abr'] if isinstance(x['abr'], (int, float)) else 0), 
-                                  reverse=True)
-            
-            # Combine sorted formats
-            sorted_formats = video_formats + audio_formats
-            
-            # Update UI in the main thread
-            self.master.after(0, lambda: self._update_video_info(video_info, sorted_formats))
-            
-        except subprocess.CalledProcessError as e:
-            error_msg = e.stderr if e.stderr else "Failed to fetch video information"
-            if "This video is unavailable" in error_msg:
-                error_msg = "This video is unavailable. It might be private, age-restricted, or removed."
-            elif "HTTP Error 429" in error_msg:
-                error_msg = "HTTP Error 429: Too Many Requests. Please try again later."
-            
-            self.master.after(0, lambda: self._show_error(error_msg))
-        except Exception as e:
-            self.master.after(0, lambda: self._show_error(str(e)))
+            for entry in self.core.iter_playlist(url):
+                # Leaving the loop closes the generator, which stops yt-dlp
+                job.check_cancelled()
+                self._pending_entries.append((job, entry))
+        except EngineError as e:
+            if not job.cancelled:
+                self.scheduler.call_soon(self._show_error, describe_error(str(e)))
+        finally:
+            # None marks the end of the playlist
+            self._pending_entries.append((job, None))
+    
+    def _drain_playlist_entries(self):
+        # Entries are added in batches so long playlists don't flood the event loop
+        job = self._playlist_job
+        if job is None:
+            return
+        finished = False
+        while self._pending_entries:
+            entry_job, entry = self._pending_entries.popleft()
+            if entry_job is not job:
+                continue  # from a playlist that was replaced or cancelled
+            if entry is None:
+                finished = True
+                break
+            iid = str(len(self.playlist_entries))
+            self.playlist_entries[iid] = entry['url']
+            self.playlist_tree.insert("", tk.END, iid=iid,
+                                      values=(entry['title'], self._format_duration(entry['duration'])))
+        
+        count = len(self.playlist_entries)
+        if finished:
+            self._playlist_job = None
+            self.status_var.set(f"{count} videos found. Select one to see its formats.")
+        else:
+            self.status_var.set(f"Loading playlist entries... ({count} so far)")
+    
+    def _format_duration(self, seconds):
+        if not isinstance(seconds, (int, float)):
+            return ""
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return f"{hours}:{minutes:02d}:{seconds:02d}"
+        return f"{minutes}:{seconds:02d}"
+    
+    def _select_playlist_entry(self, event):
+        # Formats are only fetched for the entry the user actually picks
+        selection = self.playlist_tree.selection()
+        if selection and selection[0] in self.playlist_entries:
+            # Only the video lookup is replaced, the playlist keeps loading
+            if self._lookup_job is not None:
+                self._lookup_job.cancel()
+            self.scheduler.cancel_all(THUMBNAILS)
+            self._show_video(clean_youtube_url(self.playlist_entries[selection[0]]))
+    
+    def download_playlist(self):
+        if not self.playlist_entries:
+            messagebox.showerror("Error", "No playlist entries loaded")
+            return
+        
+        download_dir = filedialog.askdirectory(initialdir=self.download_path)
+        if not download_dir:
+            return  # User cancelled
+        
+        self.download_path = download_dir
+        self.download_queue.download_path = download_dir
+        self.download_queue.add_many(self.playlist_entries.values())
+        self.status_var.set(f"Added {len(self.playlist_entries)} videos to the download queue.")
+    
+    def _fetch_video_info(self, url, refresh=False):
+        # Identical lookups still in flight are shared instead of repeated
+        job = self.scheduler.submit(METADATA, self.core.fetch_video_info, url, key=url, url=url,
+                                    on_done=lambda job: self._on_video_info(job, refresh))
+        if refresh:
+            self._refresh_job = job
+        else:
+            self._lookup_job = job
+    
+    def _on_video_info(self, job, refresh):
+        if job.state == JOB_FAILED:
+            if refresh:
+                # The cached result is already on screen, keep showing it
+                return
+            if job is self._lookup_job:
+                if isinstance(job.error, EngineError):
+                    self._show_error(describe_error(str(job.error)))
+                else:
+                    self._show_error(str(job.error))
+            return
+        
+        summary = job.result
+        if refresh:
+            self._refresh_video_info(summary)
+        elif job is self._lookup_job:
+            # Results of a search the user already replaced are dropped
+            self._update_video_info(summary, summary.formats)
+    
+    def _refresh_video_info(self, video_info):
+        # Only replace the formats if the user is still looking at this video
+        if self.video_info and self.video_info.id == video_info.id:
+            selected = self.format_var.get()
+            self.video_info = video_info
+            self.formats = video_info.formats
+            format_names = [fmt.name for fmt in self.formats]
+            self.format_combo.config(values=format_names)
+            if selected in format_names:
+                self.format_combo.current(format_names.index(selected))
+            elif format_names:
+                self.format_combo.current(0)
     
     def _update_video_info(self, video_info, formats):
         # Store video info and formats
@@ -336,46 +560,40 @@ class YouTubeDownloaderApp(ttk.Frame):
         self.formats = formats
         
         # Update video title
-        title = video_info.get('title', 'Unknown Title')
+        title = video_info.title
         self.title_var.set(title)
         
         # Update format dropdown
-        format_names = [fmt['name'] for fmt in formats]
+        format_names = [fmt.name for fmt in formats]
         self.format_combo.config(values=format_names)
         if format_names:
             self.format_combo.current(0)
         
         # Load and display thumbnail
-        thumbnail_url = video_info.get('thumbnail')
+        thumbnail_url = video_info.thumbnail
         if thumbnail_url:
-            threading.Thread(target=self._load_thumbnail, args=(thumbnail_url,), daemon=True).start()
+            self._load_thumbnail(video_info.id, thumbnail_url)
         
         # Show video container and update status
         self.video_container.pack()
         self.status_var.set("Video found. Select format and click Download.")
     
-    def _load_thumbnail(self, url):
-        try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                img_data = BytesIO(response.content)
-                img = Image.open(img_data)
-                
-                # Resize to fit in the UI (maintain aspect ratio)
-                img.thumbnail((320, 180))
-                
-                # Convert to PhotoImage for tkinter
-                photo = ImageTk.PhotoImage(img)
-                
-                # Update thumbnail in main thread
-                self.master.after(0, lambda: self._set_thumbnail(photo))
-            else:
-                raise Exception(f"Failed to load thumbnail: HTTP {response.status_code}")
-                
-        except Exception as e:
-            print(f"Error loading thumbnail: {e}")
+    def _load_thumbnail(self, video_id, url):
+        # Served from memory or disk when this video was seen before
+        self.scheduler.submit(THUMBNAILS, self.thumbnails.get, video_id, url, key=video_id or url, url=url,
+                              on_done=lambda job: self._on_thumbnail(job, video_id))
+    
+    def _on_thumbnail(self, job, video_id):
+        if not self.video_info or self.video_info.id != video_id:
+            return  # the user moved on to another video
+        if job.state == JOB_FAILED:
+            get_metrics().event("thumbnail_failed", video_id=video_id, error=str(job.error))
             # Use a placeholder image instead
-            self.master.after(0, self._use_placeholder_thumbnail)
+            self._use_placeholder_thumbnail()
+            return
+        from PIL import ImageTk
+        # PhotoImages must be created on the Tk thread
+        self._set_thumbnail(ImageTk.PhotoImage(job.result))
     
     def _set_thumbnail(self, photo):
         # Store reference to prevent garbage collection
@@ -383,12 +601,14 @@ class YouTubeDownloaderApp(ttk.Frame):
         self.thumbnail_label.config(image=photo)
     
     def _use_placeholder_thumbnail(self):
+        from PIL import Image, ImageTk
         # Create a placeholder image (gray rectangle)
-        placeholder = Image.new('RGB', (320, 180), color=(200, 200, 200))
+        placeholder = Image.new('RGB', THUMBNAIL_SIZE, color=(200, 200, 200))
         photo = ImageTk.PhotoImage(placeholder)
         self._set_thumbnail(photo)
     
     def _show_error(self, message):
+        get_metrics().event("ui_error", message=message)
         self.status_var.set(f"Error: {message}")
         messagebox.showerror("Error", message)
     
@@ -410,97 +630,120 @@ class YouTubeDownloaderApp(ttk.Frame):
             return  # User cancelled
         
         self.download_path = download_dir
+        self.download_queue.download_path = download_dir
+        
+        # Hand the download over to the queue; post-processing runs in
+        # worker processes while the queue goes on downloading
+        pipeline = parse_pipeline(POSTPROCESS_PRESETS[self.postprocess_var.get()])
+        self.download_queue.add(self.video_info.webpage_url, selected_format.format_id,
+                                title=self.video_info.title, pipeline=pipeline)
+        self.status_var.set("Added to the download queue.")
+    
+    def import_url_list(self):
+        """Queue every URL from a text file with one URL per line"""
+        path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if not path:
+            return  # User cancelled
+        
+        download_dir = filedialog.askdirectory(initialdir=self.download_path)
+        if not download_dir:
+            return  # User cancelled
+        
+        self.download_path = download_dir
+        self.download_queue.download_path = download_dir
         
-        # Show progress bar and update status
-        self.progress_frame.pack()
-        self.progress_var.set(0)
-        self.status_var.set("Starting download...")
-        self.download_button.config(state="disabled")
-        self.reset_button.config(state="disabled")
-        
-        # Start download in a separate thread
-        threading.Thread(
-            target=self._download_thread,
-            args=(selected_format,),
-            daemon=True
-        ).start()
-    
-    def _download_thread(self, format_info):
         try:
-            # Prepare filename template
-            output_template = os.path.join(self.download_path, "%(title)s.%(ext)s")
-            # Prepare command
-            cmd = [
-                sys.executable, "-m", "yt_dlp",
-                "-f", format_info['format_id'],
-                "-o", output_template,
-                "--newline",
-                self.video_info['webpage_url']
-            ]
-            
-            # Start the download process
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-            
-            # Track progress
-            for line in process.stdout:
-                if "[download]" in line and "%" in line:
-                    try:
-                        # Extract percentage
-                        percent_str = line.split("%")[0].split()[-1]
-                        percent = float(percent_str)
-                        self.master.after(0, lambda p=percent: self._update_progress(p))
-                    except (ValueError, IndexError):
-                        pass
-            
-            # Wait for process to complete
-            process.wait()
-            
-            # Check if download was successful
-            if process.returncode == 0:
-                self.master.after(0, self._handle_download_complete)
-            else:
-                raise Exception(f"Download failed with exit code {process.returncode}")
-            
-        except Exception as e:
-            self.master.after(0, lambda: self._handle_download_error(str(e)))
-    
-    def _update_progress(self, percentage):
-        self.progress_var.set(percentage)
-        self.status_var.set(f"Downloading: {percentage:.1f}%")
-    
-    def _handle_download_error(self, message):
-        self.status_var.set("Download failed")
-        self.download_button.config(state="normal")
-        self.reset_button.config(state="normal")
-        messagebox.showerror("Download Error", message)
-    
-    def _handle_download_complete(self):
-        self.progress_var.set(100)
-        self.status_var.set("Download complete!")
-        self.download_button.config(state="normal")
-        self.reset_button.config(state="normal")
-        
-        messagebox.showinfo("Success", f"Video downloaded successfully to:\n{self.download_path}")
+            items = self.download_queue.add_file(path)
+        except OSError as e:
+            self._show_error(f"Could not read URL list: {e}")
+            return
+        self.status_var.set(f"Added {len(items)} URLs to the download queue.")
+    
+    def _set_queue_workers(self):
+        try:
+            self.download_queue.set_workers(int(self.workers_var.get()))
+        except (ValueError, tk.TclError):
+            pass
+    
+    def _set_queue_connections(self):
+        try:
+            self.download_queue.connections = max(1, int(self.connections_var.get()))
+        except (ValueError, tk.TclError):
+            pass
+    
+    def _set_bandwidth(self):
+        bandwidth = self.core.bandwidth
+        try:
+            bandwidth.set_rate(int(float(self.total_rate_var.get()) * 1024 * 1024) or None)
+            bandwidth.set_job_rate(int(float(self.job_rate_var.get()) * 1024 * 1024) or None)
+        except (ValueError, tk.TclError):
+            pass
+    
+    def cancel_downloads(self):
+        """Cancel the selected downloads, or every unfinished one if none is selected"""
+        selection = self.queue_tree.selection()
+        if selection:
+            items = [item for item in self.download_queue.items if str(item.id) in selection]
+            count = sum(1 for item in items if self.download_queue.cancel(item))
+        else:
+            count = self.download_queue.cancel_all()
+        self.status_var.set(f"Cancelling {count} downloads.")
+    
+    def _on_queue_update(self, item):
+        # Called from the queue's worker threads
+        self.scheduler.call_soon(self._update_queue_item, item)
+    
+    def _update_queue_item(self, item):
+        self.queue_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 15))
+        
+        status = item.state.capitalize()
+        if item.state == DOWNLOADING and item.last_event is not None:
+            status = describe_progress(item.last_event)
+        elif item.state == FAILED:
+            status = f"Failed: {item.error}"
+            # The cached format list may be out of date, fetch it again next time
+            self.core.invalidate(item.url)
+        elif item.state == SKIPPED:
+            status = "Already downloaded"
+        elif item.state == CANCELLED:
+            status = "Cancelled"
+        elif item.state == WAITING:
+            status = item.error
+        values = (item.title or item.url, status, f"{item.progress:.1f}%")
+        
+        iid = str(item.id)
+        if self.queue_tree.exists(iid):
+            self.queue_tree.item(iid, values=values)
+        else:
+            self.queue_tree.insert("", tk.END, iid=iid, values=values)
+        
+        # Summarise the whole queue in the status line
+        counts = self.download_queue.counts()
+        active = (len(self.download_queue.items) - counts[DONE] - counts[FAILED] - counts[SKIPPED]
+                  - counts[CANCELLED])
+        self.status_var.set(f"Queue: {active} active, {counts[DONE]} done, {counts[SKIPPED]} skipped, "
+                            f"{counts[FAILED]} failed")
     
     def reset_form(self):
         # Clear form and hide video info
         self.url_var.set("Paste a Youtube video URL here")
         self.video_container.pack_forget()
-        self.progress_frame.pack_forget()
+        self.playlist_frame.pack_forget()
         self.status_var.set("")
         
-        # Reset state variables
+        # Reset state variables, stopping any lookup still in flight
+        self._cancel_lookups()
+        self.playlist_entries = {}
         self.video_info = None
         self.thumbnail_image = None
         self.formats = []
 
 def main():
+    # Optional exporters, e.g. YTD_METRICS_PORT=9464 python main.py
+    if os.environ.get("YTD_METRICS_LOG"):
+        get_metrics().add_sink(JsonLinesLog(os.environ["YTD_METRICS_LOG"]))
+    if os.environ.get("YTD_METRICS_PORT"):
+        MetricsServer(port=int(os.environ["YTD_METRICS_PORT"]))
     root = tk.Tk()
     root.configure(bg="#f5f0ff")  # Set background color
     app = YouTubeDownloaderApp(root)
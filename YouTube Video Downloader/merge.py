@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import EngineError
+import chunked_download
+from format_selection import merge_container, estimate_size
+from progress import ProgressEvent, DOWNLOADING, FINISHED
+
+
+class MergeError(EngineError):
+    """Raised when the downloaded streams cannot be remuxed"""
+
+
+def has_ffmpeg():
+    return shutil.which("ffmpeg") is not None
+
+
+def find_ffmpeg():
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise MergeError("ffmpeg was not found. Please install it to merge video and audio streams.")
+    return ffmpeg
+
+
+def remux(video_path, audio_path, output_path, ffmpeg=None):
+    """Copy both streams into one container in a single pass, without re-encoding"""
+    cmd = [
+        ffmpeg or find_ffmpeg(), "-y", "-loglevel", "error",
+        "-i", video_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c", "copy",
+    ]
+    if output_path.endswith(".mp4"):
+        cmd += ["-movflags", "+faststart"]
+    try:
+        subprocess.run(cmd + [output_path], capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise MergeError(e.stderr or "ffmpeg failed to merge the streams")
+    return output_path
+
+
+def _download_stream(engine, info, fmt, path, connections, progress_hook, rate_limit=None):
+    if connections > 1 and chunked_download.direct_http_format(info, fmt['format_id']):
+        chunked_download.ChunkedDownloader(fmt['url'], path, connections=connections,
+                                           headers=fmt.get('http_headers'),
+                                           progress_hook=progress_hook).run()
+    else:
+        # A literal file name, so escape yt-dlp's template markers
+        engine.download(info['webpage_url'], fmt['format_id'], path.replace("%", "%%"),
+                        progress_hook=progress_hook, info=info, connections=connections, rate_limit=rate_limit)
+
+
+def download_and_merge(engine, info, video, audio, output_dir, rules=None, connections=1,
+                       progress_hook=None, rate_limit=None):
+    """Download a video and an audio stream side by side, then remux them.
+
+    Each stream gets half of `rate_limit`, which only the subprocess
+    engine uses (see download_info).
+    """
+    base = chunked_download.output_basename(info)
+    if audio is None:
+        # Progressive format, nothing to merge
+        path = os.path.join(output_dir, f"{base}.{video.get('ext', 'mp4')}")
+        chunked_download.check_free_space(output_dir, estimate_size(video, info.get('duration')))
+        _download_stream(engine, info, video, path, connections, progress_hook, rate_limit)
+        return path
+
+    # Fail before downloading anything
+    ffmpeg = find_ffmpeg()
+    streams = [video, audio]
+    # Both streams and the merged copy exist on disk until the remux is done
+    chunked_download.check_free_space(output_dir, 2 * sum(estimate_size(fmt, info.get('duration'))
+                                                          for fmt in streams))
+    stream_rate = rate_limit / 2 if rate_limit else None
+    paths = [os.path.join(output_dir, f"{base}.f{fmt['format_id']}.{fmt.get('ext', 'bin')}") for fmt in streams]
+    latest = [ProgressEvent(total_bytes=estimate_size(fmt, info.get('duration')) or None) for fmt in streams]
+
+    def stream_hook(index):
+        def hook(event):
+            latest[index] = event
+            if progress_hook:
+                # Report both streams as one job; it is only finished
+                # once the remux is done
+                progress_hook(ProgressEvent(
+                    status=DOWNLOADING,
+                    downloaded_bytes=sum(e.downloaded_bytes for e in latest),
+                    total_bytes=sum(e.total_bytes or 0 for e in latest) or None,
+                    speed=sum(e.speed or 0 for e in latest) or None,
+                    eta=max((e.eta for e in latest if e.eta is not None), default=None),
+                ))
+        return hook
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(_download_stream, engine, info, fmt, path, connections, stream_hook(i),
+                                   stream_rate)
+                   for i, (fmt, path) in enumerate(zip(streams, paths))]
+        for future in futures:
+            future.result()
+
+    output_path = os.path.join(output_dir, f"{base}.{merge_container(video, audio, rules)}")
+    remux(paths[0], paths[1], output_path, ffmpeg)
+    for path in paths:
+        os.remove(path)
+    if progress_hook:
+        progress_hook(ProgressEvent(status=FINISHED, downloaded_bytes=os.path.getsize(output_path),
+                                    total_bytes=os.path.getsize(output_path)))
+    return output_path
@@ -0,0 +1,150 @@
+"""Compact model of the video metadata the front ends display.
+
+A `yt-dlp -J` document is several hundred kilobytes to megabytes (every
+format's URL and fragments, captions, thumbnails, the description), while
+the app only shows a title, a thumbnail and a short list of formats. The
+classes here keep just that, in `__slots__` records built in a single pass
+over the formats, so the raw document can be dropped right after parsing.
+"""
+import json
+
+from format_selection import AUTO_FORMAT
+from instrumentation import span
+
+VIDEO = "video"
+AUDIO = "audio"
+AUTO = "auto"
+
+# Everything from_json() keeps; every other key is dropped while decoding
+VIDEO_KEYS = frozenset(("id", "title", "thumbnail", "webpage_url", "duration", "formats"))
+FORMAT_KEYS = frozenset(("format_id", "ext", "vcodec", "acodec", "height", "fps", "abr", "tbr",
+                         "filesize", "filesize_approx"))
+KEEP_KEYS = VIDEO_KEYS | FORMAT_KEYS
+
+
+def _pruned(pairs):
+    return {key: value for key, value in pairs if key in KEEP_KEYS}
+
+
+def _has_codec(codec):
+    return bool(codec) and codec != "none"
+
+
+class Format:
+    """One entry of the format list offered to the user"""
+
+    __slots__ = ("format_id", "name", "type", "ext", "height", "fps", "abr", "filesize")
+
+    def __init__(self, format_id, name, type=VIDEO, ext=None, height=None, fps=None, abr=None, filesize=None):
+        self.format_id = format_id
+        self.name = name
+        self.type = type
+        self.ext = ext
+        self.height = height
+        self.fps = fps
+        self.abr = abr
+        self.filesize = filesize
+
+    @classmethod
+    def from_ytdlp(cls, fmt):
+        """Build a Format from a yt-dlp format dict, or None if it is not offered"""
+        has_video = _has_codec(fmt.get('vcodec', 'none'))
+        has_audio = _has_codec(fmt.get('acodec', 'none'))
+        ext = fmt.get('ext', 'unknown')
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if has_video and has_audio:
+            height = fmt.get('height')
+            fps = fmt.get('fps')
+            name = f"{height or 'unknown'}p"
+            if fps:
+                name += f", {fps}fps"
+            name += f" ({ext.upper()})"
+            return cls(fmt.get('format_id', ''), name, VIDEO, ext, height=height, fps=fps, filesize=size)
+        if has_audio and not has_video:
+            abr = fmt.get('abr')
+            name = f"Audio {abr or 'unknown'}kbps ({ext.upper()})"
+            return cls(fmt.get('format_id', ''), name, AUDIO, ext, abr=abr, filesize=size)
+        return None  # video-only streams are only used by the "auto" format
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['format_id'], data['name'], data.get('type', VIDEO), data.get('ext'),
+                   data.get('height', data.get('resolution')), data.get('fps'), data.get('abr'),
+                   data.get('filesize'))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"<Format {self.format_id} {self.name}>"
+
+
+AUTO_ENTRY = Format(AUTO_FORMAT, "Best quality (auto)", AUTO)
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) else 0
+
+
+class VideoInfo:
+    """Title, thumbnail and the offered formats of one video, best first"""
+
+    __slots__ = ("id", "title", "thumbnail", "webpage_url", "duration", "formats")
+
+    def __init__(self, id, title, thumbnail=None, webpage_url=None, duration=None, formats=()):
+        self.id = id
+        self.title = title
+        self.thumbnail = thumbnail
+        self.webpage_url = webpage_url
+        self.duration = duration
+        self.formats = tuple(formats)
+
+    @classmethod
+    def from_ytdlp(cls, info, url=None):
+        """Summarize a `-J` document; walks the format list once"""
+        videos, audios = [], []
+        with span("formats"):
+            for fmt in info.get('formats') or ():
+                entry = Format.from_ytdlp(fmt)
+                if entry is None:
+                    continue
+                (videos if entry.type == VIDEO else audios).append(entry)
+            videos.sort(key=lambda f: _number(f.height), reverse=True)
+            audios.sort(key=lambda f: _number(f.abr), reverse=True)
+        return cls(
+            info.get('id'),
+            info.get('title', 'Unknown Title'),
+            info.get('thumbnail'),
+            info.get('webpage_url', url),
+            info.get('duration'),
+            # Led by the automatic best video + audio pair
+            [AUTO_ENTRY] + videos + audios,
+        )
+
+    @classmethod
+    def from_json(cls, text, url=None, prune=True):
+        """Parse `yt-dlp -J` output; only the summary survives the call.
+
+        With `prune`, captions, thumbnails, fragments and every other unused
+        field are dropped as soon as their object is decoded, so peak memory
+        stays at a fraction of the document's size. The Python callback per
+        object costs about what building the dropped objects saves.
+        """
+        with span("parse", size=len(text)):
+            info = json.loads(text, object_pairs_hook=_pruned) if prune else json.loads(text)
+        return cls.from_ytdlp(info, url)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('id'), data.get('title', 'Unknown Title'), data.get('thumbnail'),
+                   data.get('webpage_url'), data.get('duration'),
+                   [Format.from_dict(fmt) for fmt in data.get('formats', ())])
+
+    def as_dict(self):
+        """JSON-safe form, used by the metadata cache and `--json` output"""
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['formats'] = [fmt.as_dict() for fmt in self.formats]
+        return data
+
+    def __repr__(self):
+        return f"<VideoInfo {self.id} {self.title!r} {len(self.formats)} formats>"
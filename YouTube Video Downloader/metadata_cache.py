@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from paths import user_cache_dir
+
+DEFAULT_TTL = 6 * 60 * 60  # seconds before an entry is refreshed
+DEFAULT_MAX_ENTRIES = 2000
+
+
+class MetadataCache:
+    """On-disk cache of video metadata keyed by YouTube video ID.
+
+    Entries older than `ttl` are still returned, flagged as stale, so the
+    caller can show them straight away and refresh in the background. The
+    cache keeps at most `max_entries` rows and evicts the least recently
+    used ones first.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or os.path.join(user_cache_dir(), "metadata.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                video_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed_at)")
+        self._db.commit()
+
+    def get(self, video_id):
+        """Return (info, is_stale) for a cached video or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, fetched_at FROM metadata WHERE video_id = ?", (video_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE metadata SET accessed_at = ? WHERE video_id = ?", (now, video_id))
+            self._db.commit()
+        data, fetched_at = row
+        return json.loads(data), now - fetched_at > self.ttl
+
+    def put(self, video_id, info):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO metadata (video_id, data, fetched_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (video_id, json.dumps(info), now, now)
+            )
+            # Evict least recently used entries beyond the size cap
+            self._db.execute(
+                "DELETE FROM metadata WHERE video_id IN ("
+                "SELECT video_id FROM metadata ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def invalidate(self, video_id):
+        with self._lock:
+            self._db.execute("DELETE FROM metadata WHERE video_id = ?", (video_id,))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM metadata")
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,297 @@
+"""Post-processing of finished downloads in a pool of worker processes.
+
+A pipeline is a list of stages run one after the other on a downloaded
+file. Each stage gets the current path and returns the path the next stage
+works on, so "remux:mkv, audio:opus, tags, hash" remuxes the download,
+extracts its audio, tags the audio file and writes a checksum next to it.
+
+Pipelines run in a ProcessPoolExecutor sized to the CPU count. The download
+queue hands each finished file over and moves on to its next download, so
+ffmpeg runs and hashing overlap with the network transfers.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import EngineError
+from merge import find_ffmpeg
+from archive import file_checksum
+
+# Audio codec name -> (ffmpeg encoder, file extension)
+AUDIO_CODECS = {
+    "mp3": ("libmp3lame", "mp3"),
+    "opus": ("libopus", "opus"),
+    "m4a": ("aac", "m4a"),
+    "flac": ("flac", "flac"),
+}
+AUDIO_EXTS = ("mp3", "opus", "m4a", "flac", "ogg", "wav")
+# Containers ffmpeg can write an attached cover picture to
+COVER_EXTS = ("mp3", "m4a", "mp4", "m4v", "mov")
+COVER_TIMEOUT = 10
+
+
+class PostProcessError(EngineError):
+    """Raised when a post-processing stage fails or a pipeline spec is invalid"""
+
+
+def _ffmpeg(args, action):
+    cmd = [find_ffmpeg(), "-y", "-nostdin", "-loglevel", "error"] + args
+    try:
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise PostProcessError((e.stderr or "").strip() or f"ffmpeg failed to {action}") from e
+
+
+def _ext(path):
+    return os.path.splitext(path)[1][1:].lower()
+
+
+def _with_ext(path, ext):
+    return f"{os.path.splitext(path)[0]}.{ext}"
+
+
+def context_from_info(info):
+    """The fields of a `-J` document (or VideoInfo.as_dict()) the stages use"""
+    return {
+        'id': info.get('id'),
+        'title': info.get('title'),
+        'uploader': info.get('uploader'),
+        'upload_date': info.get('upload_date'),
+        'webpage_url': info.get('webpage_url'),
+        'thumbnail': info.get('thumbnail'),
+    }
+
+
+class Stage:
+    """One step of a pipeline; instances are pickled to the worker processes.
+
+    __call__(path, context) returns the path of the file the next stage
+    should work on. Extra files a stage writes go into context['files'] and
+    checksums into context['checksums'].
+    """
+
+    name = None
+
+    @classmethod
+    def from_spec(cls, arg):
+        return cls(arg) if arg else cls()
+
+    def __call__(self, path, context):
+        raise NotImplementedError
+
+
+class Remux(Stage):
+    """Copy all streams into another container without re-encoding"""
+
+    name = "remux"
+
+    def __init__(self, container="mp4"):
+        self.container = container.lower()
+
+    def __call__(self, path, context):
+        if _ext(path) == self.container:
+            return path
+        output = _with_ext(path, self.container)
+        args = ["-i", path, "-map", "0", "-c", "copy"]
+        if self.container in ("mp4", "m4v", "mov"):
+            args += ["-movflags", "+faststart"]
+        _ffmpeg(args + [output], "remux")
+        os.remove(path)
+        return output
+
+    def __repr__(self):
+        return f"remux:{self.container}"
+
+
+class ExtractAudio(Stage):
+    """Encode the audio track into its own file; the source is kept unless keep=False"""
+
+    name = "audio"
+
+    def __init__(self, codec="mp3", bitrate="192k", keep=True):
+        if codec not in AUDIO_CODECS:
+            raise PostProcessError(f"Unsupported audio codec: {codec} (use one of {', '.join(AUDIO_CODECS)})")
+        self.codec = codec
+        self.bitrate = bitrate
+        self.keep = keep
+
+    def __call__(self, path, context):
+        encoder, ext = AUDIO_CODECS[self.codec]
+        output = _with_ext(path, ext)
+        if output == path:
+            return path
+        args = ["-i", path, "-vn", "-map", "0:a:0", "-c:a", encoder]
+        if self.codec != "flac":
+            args += ["-b:a", self.bitrate]
+        _ffmpeg(args + [output], "extract the audio")
+        if not self.keep:
+            os.remove(path)
+        return output
+
+    def __repr__(self):
+        return f"audio:{self.codec}"
+
+
+class EmbedTags(Stage):
+    """Write title, uploader, date and URL tags, plus the thumbnail as cover art"""
+
+    name = "tags"
+
+    def __init__(self, cover=True):
+        self.cover = cover
+
+    @classmethod
+    def from_spec(cls, arg):
+        return cls(cover=arg != "nocover")
+
+    def __call__(self, path, context):
+        ext = _ext(path)
+        metadata = {
+            'title': context.get('title'),
+            'artist': context.get('uploader'),
+            'date': (context.get('upload_date') or "")[:4] or None,
+            'comment': context.get('webpage_url'),
+        }
+        output = _with_ext(path, f"tagging.{ext}")
+        with tempfile.TemporaryDirectory() as tmp:
+            cover = self._cover(context, tmp) if self.cover and ext in COVER_EXTS else None
+            args = ["-i", path]
+            if cover:
+                args += ["-i", cover, "-map", "0", "-map", "1", "-c", "copy",
+                         # The picture follows the video stream, if there is one
+                         "-disposition:v:0" if ext in AUDIO_EXTS else "-disposition:v:1", "attached_pic"]
+            else:
+                args += ["-map", "0", "-c", "copy"]
+            for key, value in metadata.items():
+                if value:
+                    args += ["-metadata", f"{key}={value}"]
+            if ext == "mp3":
+                args += ["-id3v2_version", "3"]
+            try:
+                _ffmpeg(args + [output], "write the tags")
+            except PostProcessError:
+                if os.path.exists(output):
+                    os.remove(output)
+                raise
+        os.replace(output, path)
+        return path
+
+    @staticmethod
+    def _cover(context, directory):
+        # A JPEG of the video's thumbnail, or None when it cannot be had
+        url = context.get('thumbnail')
+        if not url:
+            return None
+        import urllib.request
+        source = os.path.join(directory, "thumbnail")
+        try:
+            with urllib.request.urlopen(url, timeout=COVER_TIMEOUT) as response, open(source, "wb") as f:
+                f.write(response.read())
+        except OSError:
+            return None  # tags without a cover beat no tags
+        cover = os.path.join(directory, "cover.jpg")
+        try:
+            # YouTube serves WebP thumbnails, which most players cannot show
+            _ffmpeg(["-i", source, "-frames:v", "1", cover], "convert the thumbnail")
+        except PostProcessError:
+            return None
+        return cover
+
+    def __repr__(self):
+        return "tags" if self.cover else "tags:nocover"
+
+
+class Checksum(Stage):
+    """Hash the file and write a `<file>.<algorithm>` sidecar in sha256sum format"""
+
+    name = "hash"
+
+    def __init__(self, algorithm="sha256"):
+        if algorithm not in hashlib.algorithms_available:
+            raise PostProcessError(f"Unsupported hash algorithm: {algorithm}")
+        self.algorithm = algorithm
+
+    def __call__(self, path, context):
+        digest = file_checksum(path, self.algorithm)
+        sidecar = f"{path}.{self.algorithm}"
+        with open(sidecar, "w", encoding="utf-8") as f:
+            f.write(f"{digest} *{os.path.basename(path)}\n")
+        context['checksums'][self.algorithm] = digest
+        context['files'].append(sidecar)
+        return path
+
+    def __repr__(self):
+        return f"hash:{self.algorithm}"
+
+
+STAGES = {stage.name: stage for stage in (Remux, ExtractAudio, EmbedTags, Checksum)}
+
+
+def parse_pipeline(text):
+    """Parse a spec such as "remux:mkv, audio:mp3, tags, hash" into a list of stages"""
+    stages = []
+    for part in filter(None, (p.strip().lower() for p in (text or "").split(","))):
+        name, _, arg = part.partition(":")
+        stage = STAGES.get(name.strip())
+        if stage is None:
+            raise PostProcessError(f"Unknown post-processing stage: {name} (use one of {', '.join(STAGES)})")
+        stages.append(stage.from_spec(arg.strip()))
+    return stages
+
+
+def run_pipeline(path, stages, context=None, checksum=None):
+    """Run `stages` on `path` in this process.
+
+    Returns a dict with the final 'path', every file the pipeline left
+    behind ('files') and the digests of hash stages ('checksums'). With a
+    `checksum` algorithm, 'checksums' holds the final file's digest in it
+    even when no hash stage computed one, without writing a sidecar.
+    """
+    context = dict(context or {}, files=[], checksums={})
+    files = [path]
+    for stage in stages:
+        path = stage(path, context)
+        files.append(path)
+    files += context['files']
+    if checksum and checksum not in context['checksums'] and os.path.isfile(path):
+        context['checksums'][checksum] = file_checksum(path, checksum)
+    return {
+        'path': path,
+        'files': [f for f in dict.fromkeys(files) if os.path.exists(f)],
+        'checksums': context['checksums'],
+    }
+
+
+class PostProcessor:
+    """Runs pipelines in a pool of `workers` processes (the CPU count by default).
+
+    The pool is started on the first submit(). Workers are spawned rather
+    than forked, since forking a process that runs Tk and several threads
+    is not safe.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, path, stages, context=None, checksum=None):
+        """Start a pipeline and return the Future of run_pipeline()'s result"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor.submit(run_pipeline, path, list(stages), context, checksum)
+
+    def run(self, path, stages, context=None, checksum=None):
+        return self.submit(path, stages, context, checksum).result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
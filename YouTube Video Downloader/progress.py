@@ -0,0 +1,178 @@
+import json
+import time
+import threading
+
+DOWNLOADING = "downloading"
+FINISHED = "finished"
+ERROR = "error"
+
+DEFAULT_MAX_RATE = 10  # updates per second and job
+
+# Marker for the JSON progress lines requested from `python -m yt_dlp`
+TEMPLATE_PREFIX = "YTD-PROGRESS "
+PROGRESS_TEMPLATE = "download:" + TEMPLATE_PREFIX + "%(progress)j"
+
+
+class ProgressEvent:
+    """One progress report of a download job"""
+
+    __slots__ = ("job_id", "status", "downloaded_bytes", "total_bytes", "speed", "eta",
+                 "fragment_index", "fragment_count", "timestamp")
+
+    def __init__(self, status=DOWNLOADING, downloaded_bytes=0, total_bytes=None, speed=None, eta=None,
+                 fragment_index=None, fragment_count=None, job_id=None, timestamp=None):
+        self.job_id = job_id
+        self.status = status
+        self.downloaded_bytes = downloaded_bytes or 0
+        self.total_bytes = total_bytes
+        self.speed = speed
+        self.eta = eta
+        self.fragment_index = fragment_index
+        self.fragment_count = fragment_count
+        self.timestamp = timestamp or time.monotonic()
+
+    @classmethod
+    def from_ytdlp(cls, d, job_id=None):
+        """Build an event from a yt-dlp progress hook dictionary"""
+        return cls(
+            status=d.get('status', DOWNLOADING),
+            downloaded_bytes=d.get('downloaded_bytes'),
+            total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+            speed=d.get('speed'),
+            eta=d.get('eta'),
+            fragment_index=d.get('fragment_index'),
+            fragment_count=d.get('fragment_count'),
+            job_id=job_id,
+        )
+
+    @classmethod
+    def from_template_line(cls, line, job_id=None):
+        """Parse a `--progress-template` line, returning None for other output"""
+        if not line.startswith(TEMPLATE_PREFIX):
+            return None
+        try:
+            return cls.from_ytdlp(json.loads(line[len(TEMPLATE_PREFIX):]), job_id)
+        except (ValueError, AttributeError):
+            return None
+
+    @property
+    def percent(self):
+        if self.status == FINISHED:
+            return 100.0
+        if not self.total_bytes:
+            return None
+        return min(100.0, self.downloaded_bytes * 100.0 / self.total_bytes)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"<ProgressEvent {self.job_id} {self.status} {self.downloaded_bytes}/{self.total_bytes}>"
+
+
+class ProgressThrottle:
+    """Forwards progress events to `callback` at most `max_rate` times a second per job.
+
+    Events in between are coalesced: only the newest one is kept and sent
+    with the next allowed update, or from a timer once the interval is over,
+    so a download that stalls after a burst still shows its latest numbers.
+    Finished and error events are always forwarded straight away.
+
+    Callbacks run one at a time. Every downloading event gets a sequence
+    number per job, and one is only sent if no newer event of its job came
+    in meanwhile, so the timer never sends a coalesced event after the
+    job's finished or error event.
+    """
+
+    def __init__(self, callback, max_rate=DEFAULT_MAX_RATE):
+        self.callback = callback
+        self.interval = 1.0 / max_rate if max_rate else 0
+        self._last_sent = {}
+        self._pending = {}  # job ID -> (event, sequence number)
+        self._seq = {}  # job ID -> sequence number of its newest downloading event
+        self._timer = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def __call__(self, event):
+        now = time.monotonic()
+        job_id = event.job_id
+        with self._lock:
+            self._pending.pop(job_id, None)
+            if event.status != DOWNLOADING:
+                self._last_sent.pop(job_id, None)
+                self._seq.pop(job_id, None)
+                seq = None
+            else:
+                seq = self._seq[job_id] = self._seq.get(job_id, 0) + 1
+                if now - self._last_sent.get(job_id, -1e9) < self.interval:
+                    self._pending[job_id] = (event, seq)
+                    if self._timer is None:
+                        self._arm(self.interval - (now - self._last_sent[job_id]))
+                    return
+                self._last_sent[job_id] = now
+        self._send(event, seq)
+
+    def _send(self, event, seq):
+        # `seq` is None for events that are sent whatever came before them
+        with self._send_lock:
+            if seq is not None:
+                with self._lock:
+                    if self._seq.get(event.job_id) != seq:
+                        return
+            self.callback(event)
+
+    def _arm(self, delay):
+        # Called with the lock held; one timer serves every job
+        self._timer = threading.Timer(max(0.0, delay), self._flush_due)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_due(self):
+        # Sends the pending events whose interval is over and waits for the rest
+        now = time.monotonic()
+        with self._lock:
+            self._timer = None
+            due = [(job_id, queued) for job_id, queued in self._pending.items()
+                   if now - self._last_sent.get(job_id, -1e9) >= self.interval]
+            for job_id, _ in due:
+                del self._pending[job_id]
+                self._last_sent[job_id] = now
+            if self._pending:
+                self._arm(min(self._last_sent.get(job_id, now) for job_id in self._pending) + self.interval - now)
+        for _, (event, seq) in due:
+            self._send(event, seq)
+
+    def flush(self):
+        """Send every coalesced event that has not been forwarded yet"""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            now = time.monotonic()
+            for event, _ in pending:
+                self._last_sent[event.job_id] = now
+        for event, seq in pending:
+            self._send(event, seq)
+
+
+def format_bytes(nbytes):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(nbytes) < 1024 or unit == "GiB":
+            return f"{nbytes:.1f} {unit}" if unit != "B" else f"{int(nbytes)} B"
+        nbytes /= 1024
+
+
+def describe_progress(event):
+    """Short human readable summary such as '42.0% at 3.1 MiB/s, ETA 0:12'"""
+    parts = []
+    if event.percent is not None:
+        parts.append(f"{event.percent:.1f}%")
+    else:
+        parts.append(format_bytes(event.downloaded_bytes))
+    if event.speed:
+        parts.append(f"at {format_bytes(event.speed)}/s")
+    text = " ".join(parts)
+    if event.eta is not None:
+        minutes, seconds = divmod(int(event.eta), 60)
+        text += f", ETA {minutes}:{seconds:02d}"
+    return text
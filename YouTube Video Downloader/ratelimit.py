@@ -0,0 +1,250 @@
+"""Token bucket rate limiting with backoff for throttled (429) requests.
+
+All metadata lookups and downloads of the app draw from one shared
+RateLimiter. When the service answers with a throttling status, every
+caller sharing the bucket pauses (honouring Retry-After when the response
+carries one) and the failed call is retried according to its RetryPolicy.
+
+A 403 is usually permanent (a geo-blocked video, a forbidden format), so
+it only counts as throttling when it carries Retry-After, or when a policy
+lists it among its statuses.
+"""
+import re
+import time
+import random
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+
+from engine import JobCancelled
+from instrumentation import count
+
+DEFAULT_RATE = 2.0  # calls per second
+DEFAULT_BURST = 5
+THROTTLE_STATUSES = (429,)
+# Throttling only when the response says when to come back
+RETRY_AFTER_STATUSES = (403,)
+MAX_SLEEP = 0.25  # seconds between cancellation checks while waiting
+
+HTTP_ERROR_RE = re.compile(r"HTTP Error (\d{3})")
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date)"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _causes(exc):
+    # The exception itself, what it wraps and what yt-dlp kept in exc_info
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc_info = getattr(exc, "exc_info", None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1 and isinstance(exc_info[1], BaseException):
+            yield from _causes(exc_info[1])
+        exc = exc.__cause__ or exc.__context__
+
+
+def http_status(exc):
+    """Return (status, retry_after) of the HTTP error behind `exc`, or (None, None)"""
+    for cause in _causes(exc):
+        status = getattr(cause, "status", None) or getattr(cause, "code", None)
+        if isinstance(status, int) and status >= 400:
+            headers = getattr(cause, "headers", None) or getattr(getattr(cause, "response", None), "headers", None)
+            retry_after = parse_retry_after(headers.get("Retry-After")) if headers is not None else None
+            return status, retry_after
+    # The subprocess engine only has yt-dlp's error message
+    match = HTTP_ERROR_RE.search(str(exc))
+    if match:
+        return int(match.group(1)), None
+    return None, None
+
+
+class RetryPolicy:
+    """How often and how long to back off when a call is throttled.
+
+    The n-th retry waits base_delay * 2**(n-1) seconds, capped at
+    max_delay, minus up to `jitter` of it at random so callers that were
+    throttled together do not retry together. A longer Retry-After from
+    the server always wins. `statuses` are the HTTP statuses that count
+    as throttling, Retry-After or not.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=2.0, max_delay=120.0, jitter=0.5, statuses=THROTTLE_STATUSES):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.statuses = tuple(statuses)
+
+    def delay(self, attempt, retry_after=None):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay *= 1 - self.jitter * random.random()
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def __repr__(self):
+        return (f"RetryPolicy(max_attempts={self.max_attempts}, base_delay={self.base_delay}, "
+                f"max_delay={self.max_delay}, jitter={self.jitter}, statuses={self.statuses})")
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens a second, at most `burst` saved up.
+
+    A request for more tokens than the bucket holds is granted once the
+    bucket is full and leaves it in debt, so large requests are paced
+    instead of blocking forever. pause() stops all takers for a while.
+    The bucket starts full unless `tokens` says otherwise.
+    """
+
+    def __init__(self, rate, burst=None, tokens=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate or 1.0)
+        self._tokens = self.capacity if tokens is None else tokens
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Called with the lock held
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, cancelled=None):
+        """Take `tokens`, sleeping as needed; returns the seconds spent waiting.
+
+        `cancelled` is polled while waiting and JobCancelled is raised once
+        it returns True.
+        """
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif not self.rate:
+                    return now - started
+                else:
+                    self._refill(now)
+                    needed = min(tokens, self.capacity)
+                    if self._tokens >= needed:
+                        self._tokens -= tokens
+                        return now - started
+                    wait = (needed - self._tokens) / self.rate
+            if cancelled is not None and cancelled():
+                raise JobCancelled("Cancelled")
+            time.sleep(min(wait, MAX_SLEEP))
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate (and capacity) while takers may be waiting"""
+        with self._lock:
+            now = time.monotonic()
+            if self.rate:
+                self._refill(now)
+            self._updated = now
+            self.rate = rate
+            self.capacity = burst or max(1.0, rate or 1.0)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def pause(self, seconds):
+        """Make every taker wait at least `seconds` from now"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RateLimitMetrics:
+    """Counters of a RateLimiter; snapshot() returns them as a dict"""
+
+    def __init__(self):
+        self.calls = 0
+        self.throttled_seconds = 0.0
+        self.rate_limited = 0  # throttling responses seen
+        self.retries = 0
+        self.gave_up = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'rate_limited': self.rate_limited,
+                'retries': self.retries,
+                'gave_up': self.gave_up,
+            }
+
+
+class RateLimiter:
+    """Runs calls through a shared TokenBucket and retries throttled ones"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, policy=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.policy = policy or RetryPolicy()
+        self.metrics = RateLimitMetrics()
+
+    def call(self, func, *args, policy=None, on_retry=None, cancelled=None, **kwargs):
+        """Call `func(*args, **kwargs)` once a token is available.
+
+        When it raises an error caused by one of the policy's throttling
+        statuses (or a 403 with Retry-After), the whole bucket is paused for
+        the backoff delay and the call is retried. `on_retry(attempt, delay, error)` is told about
+        each retry; the last error is re-raised when attempts run out.
+        """
+        policy = policy or self.policy
+        for attempt in itertools.count(1):
+            waited = self.bucket.acquire(cancelled=cancelled)
+            self.metrics.add(calls=1, throttled_seconds=waited)
+            if waited:
+                count("rate_limit_wait_seconds", waited)
+            try:
+                return func(*args, **kwargs)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                status, retry_after = http_status(e)
+                if status not in policy.statuses and not (status in RETRY_AFTER_STATUSES
+                                                          and retry_after is not None):
+                    raise
+                self.metrics.add(rate_limited=1)
+                count(f"http_{status}")
+                if attempt >= policy.max_attempts:
+                    self.metrics.add(gave_up=1)
+                    raise
+                delay = policy.delay(attempt, retry_after)
+                # Everybody sharing the bucket backs off, not only this call
+                self.bucket.pause(delay)
+                self.metrics.add(retries=1)
+                count("retries")
+                if on_retry is not None:
+                    on_retry(attempt, delay, e)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the limiter shared by every metadata lookup and download"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,267 @@
+"""Central scheduler for background work of the front ends.
+
+Jobs are blocking functions (yt-dlp lookups, thumbnail fetches, download
+workers) that run in separate bounded pools. An asyncio loop in one
+background thread admits them, so waiting for a pool slot or for a host's
+rate limit never ties up a thread. Jobs with the same key in the same pool
+are deduplicated while they are in flight, and cancelled jobs never report
+a result.
+
+Cancellation is cooperative for code that is already running: the job's
+function (or a progress hook it passed to yt-dlp) calls
+`current_job().check_cancelled()`, which raises JobCancelled. Jobs that
+have not started yet are dropped straight away.
+"""
+import asyncio
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from engine import JobCancelled
+
+# Pools
+METADATA = "metadata"
+THUMBNAILS = "thumbnails"
+DOWNLOADS = "downloads"
+
+DEFAULT_POOLS = {METADATA: 4, THUMBNAILS: 8, DOWNLOADS: 16}
+DEFAULT_HOST_RATE = 5.0  # job starts per second and host
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_local = threading.local()
+
+
+def current_job():
+    """Return the Job running in this thread, or None outside the scheduler"""
+    return getattr(_local, "job", None)
+
+
+class Job:
+    """Handle for one scheduled call; `result` or `error` is set once it is done"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, scheduler, pool, func, args, key=None, host=None):
+        self.id = next(self._ids)
+        self.pool = pool
+        self.key = key
+        self.host = host
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self._scheduler = scheduler
+        self._func = func
+        self._args = args
+        self._callbacks = []
+        self._cancel_event = threading.Event()
+        self._finished = threading.Event()
+        self._task = None
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancel() was called; for use inside the job"""
+        if self._cancel_event.is_set():
+            raise JobCancelled("Cancelled")
+
+    def cancel(self):
+        self._scheduler.cancel(self)
+
+    def wait(self, timeout=None):
+        """Block until the job has finished, failed or was cancelled"""
+        return self._finished.wait(timeout)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.pool} {self.state} {self.key or self._func.__name__}>"
+
+
+class HostRateLimit:
+    """Spaces out job starts so each host sees at most `rate` of them a second.
+
+    Only used from the scheduler's event loop thread, so it needs no lock.
+    """
+
+    def __init__(self, rate=DEFAULT_HOST_RATE, host_rates=None):
+        self.rate = rate
+        self.host_rates = dict(host_rates or {})
+        self._next_start = {}
+
+    async def wait(self, host):
+        rate = self.host_rates.get(host, self.rate)
+        if not host or not rate:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + 1.0 / rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class Scheduler:
+    """Runs jobs in named pools with at most `pools[name]` running at once.
+
+    `on_done(job)` callbacks run on the scheduler's threads, unless the
+    scheduler is `polled`: then they, and anything passed to call_soon(),
+    are queued until the owner calls poll(), which is how the Tk front end
+    gets every result on its own thread.
+    """
+
+    def __init__(self, pools=None, host_rate=DEFAULT_HOST_RATE, host_rates=None, polled=False):
+        self.pools = dict(DEFAULT_POOLS, **(pools or {}))
+        self.polled = polled
+        self._rate_limit = HostRateLimit(host_rate, host_rates)
+        self._executors = {}
+        self._semaphores = {}
+        self._inflight = {}
+        self._jobs = set()
+        self._calls = deque()
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def _ensure_loop(self):
+        # Called with the lock held
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="scheduler", daemon=True).start()
+            self._loop = loop
+        return self._loop
+
+    def submit(self, pool, func, *args, key=None, url=None, on_done=None):
+        """Schedule `func(*args)` in `pool` and return its Job.
+
+        While a job with the same `key` is pending or running in the pool,
+        that job is returned instead and `on_done` is added to it. `url`
+        names the host whose rate limit applies.
+        """
+        with self._lock:
+            if key is not None:
+                job = self._inflight.get((pool, key))
+                if job is not None and not job.cancelled:
+                    if on_done is not None:
+                        job._callbacks.append(on_done)
+                    return job
+            host = urlparse(url).hostname if url else None
+            job = Job(self, pool, func, args, key, host)
+            if on_done is not None:
+                job._callbacks.append(on_done)
+            if key is not None:
+                self._inflight[(pool, key)] = job
+            self._jobs.add(job)
+            loop = self._ensure_loop()
+        loop.call_soon_threadsafe(self._start, job)
+        return job
+
+    def _start(self, job):
+        # Runs in the loop thread
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job._task = self._loop.create_task(self._run(job))
+
+    def _semaphore(self, pool):
+        # Runs in the loop thread, so the semaphore belongs to that loop
+        semaphore = self._semaphores.get(pool)
+        if semaphore is None:
+            semaphore = self._semaphores[pool] = asyncio.Semaphore(self.pools.get(pool, 1))
+            self._executors[pool] = ThreadPoolExecutor(max_workers=self.pools.get(pool, 1),
+                                                       thread_name_prefix=f"scheduler-{pool}")
+        return semaphore
+
+    async def _run(self, job):
+        try:
+            async with self._semaphore(job.pool):
+                await self._rate_limit.wait(job.host)
+                job.check_cancelled()
+                job.state = RUNNING
+                result = await self._loop.run_in_executor(self._executors[job.pool], self._call, job)
+        except (JobCancelled, asyncio.CancelledError):
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = e
+            self._finish(job, FAILED)
+        else:
+            job.result = result
+            self._finish(job, CANCELLED if job.cancelled else DONE)
+
+    @staticmethod
+    def _call(job):
+        _local.job = job
+        try:
+            return job._func(*job._args)
+        finally:
+            _local.job = None
+
+    def _finish(self, job, state):
+        with self._lock:
+            if job.done:
+                return
+            job.state = state
+            if self._inflight.get((job.pool, job.key)) is job:
+                del self._inflight[(job.pool, job.key)]
+            self._jobs.discard(job)
+            callbacks = [] if state == CANCELLED else job._callbacks
+        job._finished.set()
+        for callback in callbacks:
+            self.call_soon(callback, job)
+
+    def cancel(self, job):
+        """Drop a pending job, or ask a running one to stop at its next check"""
+        job._cancel_event.set()
+        with self._lock:
+            if self._inflight.get((job.pool, job.key)) is job:
+                del self._inflight[(job.pool, job.key)]
+            loop = self._loop
+        if loop is not None and job._task is not None and job.state == PENDING:
+            loop.call_soon_threadsafe(job._task.cancel)
+
+    def cancel_all(self, pool=None):
+        """Cancel every job, or only the jobs in `pool`"""
+        with self._lock:
+            jobs = [job for job in self._jobs if pool is None or job.pool == pool]
+        for job in jobs:
+            self.cancel(job)
+        return len(jobs)
+
+    def active(self, pool=None):
+        with self._lock:
+            return [job for job in self._jobs if pool is None or job.pool == pool]
+
+    def call_soon(self, func, *args):
+        """Run `func(*args)` on the polling thread (or right away when not polled)"""
+        if self.polled:
+            self._calls.append((func, args))
+        else:
+            func(*args)
+
+    def poll(self, limit=None):
+        """Run queued callbacks in the calling thread; returns how many ran"""
+        count = 0
+        while self._calls and (limit is None or count < limit):
+            func, args = self._calls.popleft()
+            func(*args)
+            count += 1
+        return count
+
+    def shutdown(self):
+        self.cancel_all()
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        for executor in list(self._executors.values()):
+            executor.shutdown(wait=False)
@@ -0,0 +1,48 @@
+"""Tests; run from the app directory with `python -m unittest discover -s tests -t .` (or pytest)."""
+import os
+import json
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(APP_DIR, "benchmarks", "fixtures")
+
+
+def load_fixture(name):
+    """A recorded `yt-dlp -J` document from benchmarks/fixtures"""
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeEngine:
+    """Engine that "downloads" a few bytes per video without any network access.
+
+    `fail` maps video IDs to the exception their download raises. With a
+    `gate` (a threading.Event) downloads wait for it to be set and then
+    report their progress, which is where queues cancel them.
+    """
+
+    def __init__(self, payload=b"video", fail=None, gate=None):
+        self.payload = payload
+        self.fail = dict(fail or {})
+        self.gate = gate
+        self.downloads = []
+
+    def extract_info(self, url):
+        from urls import extract_video_id
+        video_id = extract_video_id(url)
+        return {'id': video_id, 'title': f"Video {video_id}", 'webpage_url': url, 'duration': 1, 'formats': []}
+
+    def download(self, url, format_id, output_template, progress_hook=None, info=None, connections=1,
+                 rate_limit=None):
+        info = info or self.extract_info(url)
+        self.downloads.append((info['id'], format_id))
+        if self.gate is not None:
+            self.gate.wait(10)
+        if progress_hook is not None:
+            from progress import ProgressEvent
+            progress_hook(ProgressEvent(downloaded_bytes=len(self.payload), total_bytes=len(self.payload)))
+        if info['id'] in self.fail:
+            raise self.fail[info['id']]
+        path = output_template % {'title': info['title'], 'id': info['id'], 'ext': "mp4"}
+        with open(path, "wb") as f:
+            f.write(self.payload)
+        return path
@@ -0,0 +1,130 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from chunked_download import (ChunkedDownloader, ChunkedDownloadError, InsufficientSpaceError, check_free_space,
+                              direct_http_format)
+from download_queue import download_info
+from benchmarks.media_server import MediaServer, make_payload
+
+KB = 1024
+CHUNK = 16 * KB
+
+
+class Interrupt(Exception):
+    pass
+
+
+class ChunkedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.payload = make_payload(256 * KB + 123)
+        self.server = MediaServer({"/video.mp4": self.payload})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def downloader(self, name="video.mp4", **kwargs):
+        kwargs.setdefault('connections', 4)
+        kwargs.setdefault('chunk_size', CHUNK)
+        return ChunkedDownloader(self.server.url("/video.mp4"), os.path.join(self.tmp, name), **kwargs)
+
+    def chunk_requests(self):
+        return [rng for method, _, rng in self.server.requests if method == "GET" and rng != "bytes=0-0"]
+
+    def info(self):
+        url = self.server.url("/video.mp4")
+        return {
+            'id': "aaaaaaaaaaa",
+            'title': "Clip",
+            'formats': [
+                {'format_id': "137", 'ext': "mp4", 'vcodec': "avc1.640028", 'acodec': "none", 'height': 1080,
+                 'protocol': "http_dash_segments", 'url': url, 'fragments': [{'path': "sq/0"}]},
+                {'format_id': "18", 'ext': "mp4", 'vcodec': "avc1.42001E", 'acodec': "mp4a.40.2", 'height': 360,
+                 'protocol': "https", 'url': url, 'filesize': len(self.payload)},
+            ],
+        }
+
+    def test_download(self):
+        events = []
+        path = self.downloader(progress_hook=events.append).run()
+        self.assertEqual(self.read(path), self.payload)
+        self.assertEqual(len(self.chunk_requests()), len(self.payload) // CHUNK + 1)
+        self.assertFalse(os.path.exists(path + ".part") or os.path.exists(path + ".chunks.json"))
+        self.assertEqual(events[-1].downloaded_bytes, len(self.payload))
+
+    def test_resume_from_chunk_map(self):
+        def interrupt(event):
+            if event.downloaded_bytes >= len(self.payload) // 2:
+                raise Interrupt
+
+        with self.assertRaises(Interrupt):
+            self.downloader(connections=1, progress_hook=interrupt).run()
+        path = os.path.join(self.tmp, "video.mp4")
+        with open(path + ".chunks.json", encoding="utf-8") as f:
+            done = json.load(f)['done']
+        self.assertIn("1", done)
+        self.assertIn("0", done)
+        del self.server.requests[:]
+
+        events = []
+        self.downloader(progress_hook=events.append).run()
+        self.assertEqual(self.read(path), self.payload)
+        # Only the chunks missing from the map are fetched again
+        self.assertEqual(sorted(self.chunk_requests()),
+                         sorted(f"bytes={i * CHUNK}-{min((i + 1) * CHUNK, len(self.payload)) - 1}"
+                                for i, chunk in enumerate(done) if chunk == "0"))
+        self.assertEqual(events[0].downloaded_bytes, done.count("1") * CHUNK)
+
+    def test_failed_chunk_stops_the_others(self):
+        server = self.server
+
+        def fail_next_request(event):
+            # Queued once the probe is done, so the first chunk request fails
+            if not server.httpd.status_queue and not self.chunk_requests():
+                server.fail_with(500)
+
+        self.server.set_rate(256 * KB)
+        with self.assertRaises(ChunkedDownloadError):
+            self.downloader(connections=2, progress_hook=fail_next_request).run()
+        # The chunks already running were dropped and the rest never
+        # requested; a connection may have just started its next chunk
+        self.assertLessEqual(len(self.chunk_requests()), 2 * 2)
+
+    def test_failed_probe(self):
+        self.server.fail_with(429, {"Retry-After": "1"})
+        with self.assertRaises(ChunkedDownloadError):
+            self.downloader().run()
+
+    def test_best_resolves_to_a_progressive_format(self):
+        info = self.info()
+        self.assertEqual(direct_http_format(info, "best")['format_id'], "18")
+        self.assertEqual(direct_http_format(info, "18")['format_id'], "18")
+        self.assertIsNone(direct_http_format(info, "137"))
+        self.assertIsNone(direct_http_format(info, "bestvideo+bestaudio"))
+
+        # No engine: only the chunked downloader can fetch this
+        path = download_info(None, info, "best", self.tmp, connections=4)
+        self.assertEqual(self.read(path), self.payload)
+        self.assertEqual(self.chunk_requests(), [f"bytes=0-{len(self.payload) - 1}"])
+
+    def test_missing_output_directory_is_created(self):
+        output_dir = os.path.join(self.tmp, "new", "sub")
+        path = download_info(None, self.info(), "18", output_dir, connections=2)
+        self.assertEqual(os.path.dirname(path), output_dir)
+        self.assertEqual(self.read(path), self.payload)
+
+    def test_free_space_of_missing_directory(self):
+        check_free_space(os.path.join(self.tmp, "missing", "deeper"), 1)
+        with self.assertRaises(InsufficientSpaceError):
+            check_free_space(os.path.join(self.tmp, "missing"), shutil.disk_usage(self.tmp).free + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
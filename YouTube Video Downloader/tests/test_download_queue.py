@@ -0,0 +1,96 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from archive import DownloadArchive
+from journal import JobJournal
+from scheduler import Scheduler
+from download_queue import DownloadQueue, DONE, SKIPPED, DOWNLOADING, QUEUED
+from tests import FakeEngine
+
+URL = "https://www.youtube.com/watch?v=aaaaaaaaaaa"
+
+
+class DownloadQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.engine = FakeEngine()
+
+    def queue(self, **kwargs):
+        return DownloadQueue(self.tmp, engine=self.engine, **kwargs)
+
+    def test_downloads_every_item(self):
+        queue = self.queue(workers=2)
+        items = queue.add_many([URL, "https://youtu.be/bbbbbbbbbbb", "https://youtu.be/ccccccccccc"])
+        self.assertTrue(queue.wait(5))
+        self.assertEqual([item.state for item in items], [DONE] * 3)
+        self.assertEqual(len(self.engine.downloads), 3)
+
+    def test_archive_skips_only_the_archived_format(self):
+        archive = DownloadArchive(":memory:")
+        archive.record("aaaaaaaaaaa", "18")
+        queue = self.queue(archive=archive)
+        same, other = queue.add(URL, "18"), queue.add(URL, "137")
+        self.assertTrue(queue.wait(5))
+        self.assertEqual((same.state, other.state), (SKIPPED, DONE))
+        self.assertEqual(self.engine.downloads, [("aaaaaaaaaaa", "137")])
+        self.assertTrue(archive.contains("aaaaaaaaaaa", "137"))
+
+    def test_failing_callback_does_not_stall_the_queue(self):
+        def on_update(item):
+            # Only in the worker; add() may already see the item done
+            if item.state == DONE and item.url == URL and threading.current_thread() is not threading.main_thread():
+                raise RuntimeError("listener failed")
+
+        errors = []
+        with mock.patch.object(threading, "excepthook", errors.append):
+            queue = self.queue(workers=1, on_update=on_update)
+            items = queue.add_many([URL, "https://youtu.be/bbbbbbbbbbb", "https://youtu.be/ccccccccccc"])
+            self.assertTrue(queue.wait(5))
+            # The worker's thread reports the error once its slot is given back
+            deadline = time.monotonic() + 5
+            while not errors and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual([item.state for item in items], [DONE] * 3)
+        self.assertEqual([type(error.exc_value) for error in errors], [RuntimeError])
+
+    def test_shutdown_keeps_jobs_resumable(self):
+        path = os.path.join(self.tmp, "jobs.sqlite3")
+        journal = JobJournal(path)
+        self.engine.gate = threading.Event()
+        queue = self.queue(workers=1, journal=journal)
+        running, waiting = queue.add_many([URL, "https://youtu.be/bbbbbbbbbbb"])
+        while running.state != DOWNLOADING:
+            time.sleep(0.01)
+        queue.shutdown()
+        self.engine.gate.set()
+        self.assertTrue(queue.wait(5))
+        journal.close()
+
+        jobs = JobJournal(path)
+        self.addCleanup(jobs.close)
+        states = {job['url']: job['state'] for job in jobs.claim_unfinished()}
+        self.assertEqual(states, {URL: DOWNLOADING, "https://youtu.be/bbbbbbbbbbb": QUEUED})
+
+    def test_scheduled_downloads_are_rate_limited_per_host(self):
+        scheduler = Scheduler(host_rate=5)
+        self.addCleanup(scheduler.shutdown)
+        queue = self.queue(workers=4, scheduler=scheduler)
+        start = time.monotonic()
+        items = queue.add_many([f"https://youtu.be/{c * 11}" for c in "abcd"])
+        self.assertTrue(queue.wait(5))
+        self.assertEqual([item.state for item in items], [DONE] * 4)
+        # Four starts on one host at 5 a second
+        self.assertGreaterEqual(time.monotonic() - start, 3 / 5 * 0.9)
+        # Let the last job finish on the scheduler's loop before it is shut down
+        while scheduler.active():
+            time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import glob
+import os
+import unittest
+
+from format_selection import (SelectionRules, FormatSelectionError, select_pair, merge_container,
+                              codec_family)
+from tests import FIXTURES, load_fixture
+
+MB = 1024 ** 2
+
+
+def ids(pair):
+    return tuple(fmt and fmt['format_id'] for fmt in pair)
+
+
+class ParseRulesTest(unittest.TestCase):
+    def test_all_clauses(self):
+        rules = SelectionRules.parse("<=1080p, >=480p, <=30fps, prefer av1 then vp9, prefer opus, "
+                                     "max 2 GB, container mkv")
+        self.assertEqual(rules.max_height, 1080)
+        self.assertEqual(rules.min_height, 480)
+        self.assertEqual(rules.max_fps, 30)
+        self.assertEqual(rules.video_codecs, ("av1", "vp9"))
+        self.assertEqual(rules.audio_codecs, ("opus",))
+        self.assertEqual(rules.max_size, 2 * 1024 ** 3)
+        self.assertEqual(rules.container, "mkv")
+
+    def test_unicode_bounds_and_case(self):
+        rules = SelectionRules.parse("≤720P, ≥360p, MAX 1.5 mb")
+        self.assertEqual((rules.max_height, rules.min_height), (720, 360))
+        self.assertEqual(rules.max_size, int(1.5 * MB))
+
+    def test_codecs_may_be_mixed(self):
+        rules = SelectionRules.parse("prefer opus then avc then aac")
+        self.assertEqual(rules.video_codecs, ("avc",))
+        self.assertEqual(rules.audio_codecs, ("opus", "aac"))
+
+    def test_empty(self):
+        rules = SelectionRules.parse("")
+        self.assertIsNone(rules.max_height)
+        self.assertEqual(rules.video_codecs, ())
+
+    def test_unknown_clause(self):
+        with self.assertRaises(FormatSelectionError):
+            SelectionRules.parse("<=1080p, best please")
+
+    def test_unknown_codec(self):
+        with self.assertRaises(FormatSelectionError):
+            SelectionRules.parse("prefer theora")
+
+
+class SelectPairTest(unittest.TestCase):
+    def setUp(self):
+        self.uhd = load_fixture("video_2160p60.json")
+        self.hd = load_fixture("video_720p.json")
+
+    def select(self, info, rules="", **kwargs):
+        return ids(select_pair(info, SelectionRules.parse(rules), **kwargs))
+
+    def test_best_without_rules(self):
+        self.assertEqual(self.select(self.uhd), ("315", "251"))
+        self.assertEqual(self.select(self.hd), ("298", "251"))
+
+    def test_max_height(self):
+        self.assertEqual(self.select(self.uhd, "<=1080p"), ("299", "251"))
+        self.assertEqual(self.select(self.uhd, "<=480p"), ("135", "251"))
+
+    def test_max_fps(self):
+        self.assertEqual(self.select(self.uhd, "<=1080p, <=30fps"), ("137", "251"))
+
+    def test_codec_preference(self):
+        self.assertEqual(self.select(self.uhd, "<=1080p, prefer av1 then vp9"), ("399", "251"))
+        self.assertEqual(self.select(self.uhd, "<=1080p, prefer vp9"), ("303", "251"))
+        self.assertEqual(self.select(self.uhd, "prefer aac"), ("315", "140"))
+
+    def test_resolution_beats_codec_preference(self):
+        # avc tops out at 1080p, so a 2160p stream of another codec still wins
+        self.assertEqual(self.select(self.uhd, "prefer avc")[0], "315")
+
+    def test_max_size(self):
+        # 399 + 251 is ~146 MB, so the 720p60 av1 stream is the best that fits
+        self.assertEqual(self.select(self.uhd, "<=1080p, prefer av1, max 100 MB"), ("398", "251"))
+        video, audio = select_pair(self.uhd, SelectionRules.parse("max 100 MB"))
+        self.assertLessEqual(video['filesize'] + audio['filesize'], 100 * MB)
+
+    def test_max_size_uses_bitrate_without_filesize(self):
+        info = dict(self.hd, formats=[dict(fmt, filesize=None) for fmt in self.hd['formats']])
+        # Sizes are estimated from tbr and the 19 s duration: 298 + 251 is ~4.0 MB
+        self.assertEqual(self.select(info, "max 3.5 MB"), ("302", "251"))
+
+    def test_progressive_fallback(self):
+        progressive_only = dict(self.hd, formats=[fmt for fmt in self.hd['formats']
+                                                  if fmt['format_id'] == "18" or fmt['ext'] == "mhtml"])
+        self.assertEqual(self.select(progressive_only), ("18", None))
+
+    def test_separate_false_picks_progressive(self):
+        self.assertEqual(self.select(self.uhd, separate=False), ("18", None))
+
+    def test_nothing_matches(self):
+        with self.assertRaises(FormatSelectionError):
+            self.select(self.hd, ">=1080p")
+        with self.assertRaises(FormatSelectionError):
+            self.select(self.hd, ">=480p", separate=False)
+        with self.assertRaises(FormatSelectionError):
+            self.select(self.hd, "max 1 KB")
+
+    def test_every_fixture_respects_rules(self):
+        rules = SelectionRules.parse("<=720p, prefer vp9, prefer opus")
+        for path in glob.glob(os.path.join(FIXTURES, "*.json")):
+            info = load_fixture(os.path.basename(path))
+            video, audio = select_pair(info, rules)
+            self.assertLessEqual(video['height'], 720, path)
+            self.assertEqual(codec_family(audio['acodec']), "opus", path)
+
+
+class MergeContainerTest(unittest.TestCase):
+    def test_containers(self):
+        av1 = {'vcodec': "av01.0.08M.08", 'acodec': "none"}
+        vp9 = {'vcodec': "vp9", 'acodec': "none"}
+        avc = {'vcodec': "avc1.640028", 'acodec': "none"}
+        opus = {'vcodec': "none", 'acodec': "opus"}
+        aac = {'vcodec': "none", 'acodec': "mp4a.40.2"}
+        self.assertEqual(merge_container(avc, aac), "mp4")
+        self.assertEqual(merge_container(av1, opus), "webm")
+        self.assertEqual(merge_container(vp9, aac), "mkv")
+        self.assertEqual(merge_container(vp9, aac, SelectionRules(container="mp4")), "mp4")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+
+from journal import JobJournal
+from download_queue import DOWNLOADING, DONE, QUEUED
+
+
+class JobJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "jobs.sqlite3")
+
+    def open(self, **kwargs):
+        journal = JobJournal(self.path, flush_interval=kwargs.pop('flush_interval', 60), **kwargs)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_update_and_reopen(self):
+        journal = JobJournal(self.path)
+        job_id = journal.add("https://www.youtube.com/watch?v=aaaaaaaaaaa", "18", "/tmp/out")
+        journal.update(job_id, state=DOWNLOADING, progress=42.0, downloaded_bytes=1000)
+        journal.close()
+        job = self.open().get(job_id)
+        self.assertEqual((job['state'], job['progress'], job['downloaded_bytes']), (DOWNLOADING, 42.0, 1000))
+        self.assertEqual((job['format_id'], job['output_dir']), ("18", "/tmp/out"))
+
+    def test_two_journals_get_distinct_ids(self):
+        gui, cli = self.open(), self.open()
+        first = gui.add("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+        second = cli.add("https://www.youtube.com/watch?v=bbbbbbbbbbb")
+        self.assertNotEqual(first, second)
+        gui.update(first, state=DOWNLOADING)
+        cli.update(second, state=DOWNLOADING)
+        gui.flush()
+        cli.flush()
+        urls = {job['url'] for job in self.open().unfinished()}
+        self.assertEqual(urls, {"https://www.youtube.com/watch?v=aaaaaaaaaaa",
+                                "https://www.youtube.com/watch?v=bbbbbbbbbbb"})
+
+    def test_live_jobs_are_not_claimed(self):
+        gui = self.open()
+        gui.add("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+        other = self.open()
+        self.assertEqual(other.claim_unfinished(), [])
+        self.assertEqual(len(other.unfinished()), 1)
+        # Nor by the journal that owns them
+        self.assertEqual(gui.claim_unfinished(), [])
+
+    def test_jobs_are_released_on_close(self):
+        first = JobJournal(self.path)
+        job_id = first.add("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+        first.close()
+        a, b = self.open(), self.open()
+        self.assertEqual([job['id'] for job in a.claim_unfinished()], [job_id])
+        self.assertEqual(b.claim_unfinished(), [])
+
+    def test_expired_lease_is_claimed(self):
+        crashed = self.open(lease=0.1, flush_interval=0.05)
+        job_id = crashed.add("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+        crashed._closed.set()  # the flusher stops renewing, as if the process died
+        crashed._flusher.join()
+        time.sleep(0.3)
+        self.assertEqual([job['id'] for job in self.open().claim_unfinished()], [job_id])
+
+    def test_restart_within_the_lease_of_a_dead_process(self):
+        crashed = self.open(lease=60)
+        job_id = crashed.add("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+        crashed._closed.set()
+        crashed._flusher.join()
+        # Its rows now look like those of a process that exited without close()
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        with sqlite3.connect(self.path) as db:
+            db.execute("UPDATE jobs SET owner_pid = ?", (process.pid,))
+        restarted = self.open(lease=60)
+        self.assertEqual([job['id'] for job in restarted.claim_unfinished()], [job_id])
+        self.assertIsNone(restarted.lease_expiry())
+
+    def test_lease_expiry_of_live_owner(self):
+        live = self.open(lease=60, flush_interval=1)
+        live.add("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+        other = self.open()
+        self.assertEqual(other.claim_unfinished(), [])
+        self.assertAlmostEqual(other.lease_expiry(), time.time() + 60, delta=5)
+        self.assertIsNone(live.lease_expiry())
+
+    def test_finished_jobs_are_not_claimed(self):
+        journal = JobJournal(self.path)
+        done = journal.add("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+        queued = journal.add("https://www.youtube.com/watch?v=bbbbbbbbbbb")
+        journal.update(done, state=DONE, progress=100.0)
+        journal.close()
+        jobs = self.open().claim_unfinished()
+        self.assertEqual([(job['id'], job['state']) for job in jobs], [(queued, QUEUED)])
+
+
+if __name__ == "__main__":
+    unittest.main()
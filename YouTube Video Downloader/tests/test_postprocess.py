@@ -0,0 +1,211 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import subprocess
+import unittest
+from concurrent.futures import Future
+
+from archive import DownloadArchive
+from engine import EngineError
+from download_queue import DownloadQueue, PROCESSING, DONE, FAILED, CANCELLED
+from merge import has_ffmpeg, find_ffmpeg
+from postprocess import (PostProcessor, PostProcessError, Stage, Checksum, ExtractAudio, parse_pipeline,
+                         run_pipeline)
+from tests import FakeEngine
+
+URL = "https://www.youtube.com/watch?v=aaaaaaaaaaa"
+
+
+class Rename(Stage):
+    """Moves the file, standing in for the ffmpeg stages"""
+
+    name = "rename"
+
+    def __call__(self, path, context):
+        renamed = path + ".renamed"
+        os.replace(path, renamed)
+        return renamed
+
+
+class ParsePipelineTest(unittest.TestCase):
+    def test_stages(self):
+        stages = parse_pipeline(" remux:MKV, audio:opus , tags:nocover, tags, hash:md5, hash")
+        self.assertEqual(list(map(repr, stages)), ["remux:mkv", "audio:opus", "tags:nocover", "tags", "hash:md5",
+                                                   "hash:sha256"])
+
+    def test_empty(self):
+        self.assertEqual(parse_pipeline(""), [])
+        self.assertEqual(parse_pipeline(None), [])
+        self.assertEqual(parse_pipeline(" , "), [])
+
+    def test_round_trip(self):
+        # The journal stores pipelines as their repr
+        stages = parse_pipeline("remux:mkv, audio:mp3, hash")
+        self.assertEqual(list(map(repr, parse_pipeline(", ".join(map(repr, stages))))), list(map(repr, stages)))
+
+    def test_errors(self):
+        for spec in ("transcode", "remux:mkv, upload", "audio:wma", "hash:crc32"):
+            with self.assertRaises(PostProcessError, msg=spec):
+                parse_pipeline(spec)
+
+
+class PipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "video.mp4")
+        with open(self.path, "wb") as f:
+            f.write(b"not really a video")
+
+    def test_hash_only(self):
+        result = run_pipeline(self.path, [Checksum(), Checksum("md5")], {'title': "Clip"})
+        sha256 = hashlib.sha256(b"not really a video").hexdigest()
+        self.assertEqual(result['path'], self.path)
+        self.assertEqual(result['checksums'], {'sha256': sha256, 'md5': hashlib.md5(b"not really a video").hexdigest()})
+        self.assertEqual(result['files'], [self.path, self.path + ".sha256", self.path + ".md5"])
+        with open(self.path + ".sha256", encoding="utf-8") as f:
+            self.assertEqual(f.read(), f"{sha256} *video.mp4\n")
+
+    def test_process_pool(self):
+        postprocessor = PostProcessor(workers=1)
+        self.addCleanup(postprocessor.shutdown)
+        result = postprocessor.run(self.path, parse_pipeline("hash"))
+        self.assertEqual(result['checksums']['sha256'], hashlib.sha256(b"not really a video").hexdigest())
+
+    def test_checksum_without_hash_stage(self):
+        result = run_pipeline(self.path, [Rename()], checksum="sha256")
+        self.assertEqual(result['checksums'], {'sha256': hashlib.sha256(b"not really a video").hexdigest()})
+        self.assertEqual(result['files'], [self.path + ".renamed"])
+
+    def test_failing_stage(self):
+        # Not a video, so ffmpeg fails (or is missing: MergeError)
+        with self.assertRaises(EngineError):
+            run_pipeline(self.path, [ExtractAudio("mp3")])
+
+
+@unittest.skipUnless(has_ffmpeg(), "ffmpeg is not installed")
+class FfmpegStagesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, "clip.mp4")
+        subprocess.run([find_ffmpeg(), "-y", "-loglevel", "error",
+                        "-f", "lavfi", "-i", "testsrc=duration=1:size=160x120:rate=10",
+                        "-f", "lavfi", "-i", "sine=duration=1",
+                        "-c:v", "mpeg4", "-c:a", "aac", "-shortest", self.path], check=True)
+
+    def probe(self, path, entries):
+        ffprobe = os.path.join(os.path.dirname(find_ffmpeg()), "ffprobe")
+        return subprocess.run([ffprobe, "-v", "error", "-show_entries", entries, "-of", "default=nw=1", path],
+                              capture_output=True, text=True, check=True).stdout
+
+    def test_remux_audio_tags_hash(self):
+        context = {'title': "Test clip", 'uploader': "Tester", 'upload_date': "20240102",
+                   'webpage_url': URL}
+        result = run_pipeline(self.path, parse_pipeline("remux:mkv, audio:mp3, tags, hash"), context)
+        mkv = os.path.join(self.tmp, "clip.mkv")
+        mp3 = os.path.join(self.tmp, "clip.mp3")
+        self.assertEqual(result['path'], mp3)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(set(result['files']), {mkv, mp3, mp3 + ".sha256"})
+        tags = self.probe(mp3, "format_tags=title,artist")
+        self.assertIn("Test clip", tags)
+        self.assertIn("Tester", tags)
+
+
+class ManualPostProcessor:
+    """Hands out futures the test completes or cancels itself"""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, path, stages, context=None, checksum=None):
+        future = Future()
+        self.futures.append((path, future))
+        return future
+
+
+class QueueProcessingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.states = []
+
+    def queue(self, postprocessor, **kwargs):
+        return DownloadQueue(self.tmp, engine=FakeEngine(), postprocessor=postprocessor, pipeline=[Checksum()],
+                             on_update=lambda item: self.states.append(item.state), **kwargs)
+
+    def wait_for(self, postprocessor):
+        for _ in range(500):
+            if postprocessor.futures:
+                return postprocessor.futures[-1]
+            time.sleep(0.01)
+        self.fail("nothing was submitted")
+
+    def test_processing_then_done(self):
+        postprocessor = ManualPostProcessor()
+        archive = DownloadArchive(":memory:")
+        queue = self.queue(postprocessor, archive=archive)
+        item = queue.add(URL)
+        path, future = self.wait_for(postprocessor)
+        self.assertEqual(item.state, PROCESSING)
+        # Still busy while the pipeline runs
+        self.assertFalse(queue.wait(0.05))
+        future.set_running_or_notify_cancel()
+        future.set_result({'path': path, 'files': [path, path + ".sha256"], 'checksums': {'sha256': "ab" * 32}})
+        self.assertTrue(queue.wait(5))
+        self.assertEqual(item.state, DONE)
+        self.assertEqual(self.states[-2:], [PROCESSING, DONE])
+        self.assertEqual(item.files, [path, path + ".sha256"])
+        self.assertEqual(archive.get("aaaaaaaaaaa")['sha256'], "ab" * 32)
+
+    def test_cancel_while_waiting_for_a_worker(self):
+        postprocessor = ManualPostProcessor()
+        queue = self.queue(postprocessor)
+        item = queue.add(URL)
+        self.wait_for(postprocessor)
+        self.assertTrue(queue.cancel(item))
+        self.assertTrue(queue.wait(5))
+        self.assertEqual(item.state, CANCELLED)
+        self.assertEqual(self.states[-2:], [PROCESSING, CANCELLED])
+
+    def test_running_pipeline_cannot_be_cancelled(self):
+        postprocessor = ManualPostProcessor()
+        queue = self.queue(postprocessor)
+        item = queue.add(URL)
+        path, future = self.wait_for(postprocessor)
+        future.set_running_or_notify_cancel()
+        self.assertFalse(queue.cancel(item))
+        future.set_exception(PostProcessError("ffmpeg failed"))
+        self.assertTrue(queue.wait(5))
+        self.assertEqual(item.state, FAILED)
+        self.assertIn("ffmpeg failed", item.error)
+
+    def test_process_pool(self):
+        postprocessor = PostProcessor(workers=1)
+        self.addCleanup(postprocessor.shutdown)
+        queue = self.queue(postprocessor)
+        item = queue.add(URL)
+        self.assertTrue(queue.wait(60))
+        self.assertEqual(item.state, DONE)
+        self.assertIn(PROCESSING, self.states)
+        self.assertTrue(os.path.exists(item.path + ".sha256"))
+
+    def test_archive_digest_without_hash_stage(self):
+        postprocessor = PostProcessor(workers=1)
+        self.addCleanup(postprocessor.shutdown)
+        archive = DownloadArchive(":memory:")
+        queue = DownloadQueue(self.tmp, engine=FakeEngine(), postprocessor=postprocessor, pipeline=[Rename()],
+                              archive=archive)
+        item = queue.add(URL)
+        self.assertTrue(queue.wait(60))
+        self.assertEqual(item.state, DONE)
+        entry = archive.get("aaaaaaaaaaa")
+        self.assertEqual(entry['path'], item.path)
+        self.assertEqual(entry['sha256'], hashlib.sha256(b"video").hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import time
+import threading
+import unittest
+
+from progress import ProgressEvent, ProgressThrottle, DOWNLOADING, FINISHED, describe_progress
+
+
+def event(downloaded, status=DOWNLOADING, job_id=1):
+    return ProgressEvent(status=status, downloaded_bytes=downloaded, total_bytes=1000, job_id=job_id)
+
+
+class ProgressThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.throttle = ProgressThrottle(self.sent.append, max_rate=20)
+
+    def bytes_sent(self, job_id=1):
+        return [e.downloaded_bytes for e in self.sent if e.job_id == job_id]
+
+    def test_coalesces_bursts(self):
+        for n in range(100):
+            self.throttle(event(n))
+        self.assertEqual(self.bytes_sent(), [0])
+
+    def test_stalled_download_gets_its_last_event(self):
+        self.throttle(event(1))
+        self.throttle(event(2))
+        self.throttle(event(3))
+        # No further events arrive; the timer sends the newest one
+        time.sleep(0.2)
+        self.assertEqual(self.bytes_sent(), [1, 3])
+
+    def test_rate_is_bounded(self):
+        start = time.monotonic()
+        n = 0
+        while time.monotonic() - start < 0.5:
+            self.throttle(event(n))
+            n += 1
+            time.sleep(0.001)
+        time.sleep(0.1)
+        self.assertLessEqual(len(self.sent), 0.6 * 20 + 2)
+        self.assertEqual(self.sent[-1].downloaded_bytes, n - 1)
+
+    def test_finished_is_forwarded_at_once(self):
+        self.throttle(event(1))
+        self.throttle(event(2))
+        self.throttle(event(1000, FINISHED))
+        self.assertEqual([e.status for e in self.sent], [DOWNLOADING, FINISHED])
+        # The coalesced event is dropped, not sent after the finished one
+        time.sleep(0.2)
+        self.assertEqual(len(self.sent), 2)
+
+    def test_finished_while_the_timer_sends(self):
+        taken, finished = threading.Event(), threading.Event()
+
+        class Paused(ProgressThrottle):
+            def _send(self, event, seq):
+                # The timer has taken the coalesced event; the job finishes before it is sent
+                if threading.current_thread() is not threading.main_thread():
+                    taken.set()
+                    finished.wait(5)
+                super()._send(event, seq)
+
+        throttle = Paused(self.sent.append, max_rate=20)
+        throttle(event(1))
+        throttle(event(2))
+        self.assertTrue(taken.wait(5))
+        throttle(event(1000, FINISHED))
+        finished.set()
+        time.sleep(0.1)
+        self.assertEqual([(e.status, e.downloaded_bytes) for e in self.sent], [(DOWNLOADING, 1), (FINISHED, 1000)])
+
+    def test_jobs_are_throttled_separately(self):
+        self.throttle(event(1, job_id=1))
+        self.throttle(event(1, job_id=2))
+        self.throttle(event(2, job_id=1))
+        self.assertEqual(len(self.sent), 2)
+        time.sleep(0.2)
+        self.assertEqual(self.bytes_sent(1), [1, 2])
+        self.assertEqual(self.bytes_sent(2), [1])
+
+    def test_flush(self):
+        self.throttle(event(1))
+        self.throttle(event(2))
+        self.throttle.flush()
+        self.assertEqual(self.bytes_sent(), [1, 2])
+
+
+class DescribeProgressTest(unittest.TestCase):
+    def test_describe(self):
+        e = ProgressEvent(downloaded_bytes=420, total_bytes=1000, speed=3.1 * 1024 * 1024, eta=72)
+        self.assertEqual(describe_progress(e), "42.0% at 3.1 MiB/s, ETA 1:12")
+        self.assertEqual(describe_progress(ProgressEvent(downloaded_bytes=2048)), "2.0 KiB")
+
+
+if __name__ == "__main__":
+    unittest.main()
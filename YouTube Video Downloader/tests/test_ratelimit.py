@@ -0,0 +1,164 @@
+import time
+import random
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from email.utils import formatdate
+
+from engine import EngineError, JobCancelled
+from ratelimit import RateLimiter, RetryPolicy, TokenBucket, http_status, parse_retry_after
+from benchmarks.media_server import MediaServer
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_exponential_delay_within_jitter_bounds(self):
+        policy = RetryPolicy(base_delay=1, max_delay=8, jitter=0.5)
+        random.seed(1)
+        for attempt, full in ((1, 1), (2, 2), (3, 4), (4, 8), (5, 8), (9, 8)):
+            delays = [policy.delay(attempt) for _ in range(200)]
+            self.assertTrue(all(full * 0.5 <= delay <= full for delay in delays), (attempt, min(delays), max(delays)))
+            # Spread out, not all the same
+            self.assertGreater(max(delays) - min(delays), full * 0.3)
+
+    def test_no_jitter(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=10, jitter=0)
+        self.assertEqual([policy.delay(n) for n in (1, 2, 3)], [0.5, 1.0, 2.0])
+
+    def test_longer_retry_after_wins(self):
+        policy = RetryPolicy(base_delay=1, jitter=0)
+        self.assertEqual(policy.delay(1, retry_after=30), 30)
+        self.assertEqual(policy.delay(3, retry_after=0.5), 4)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertAlmostEqual(parse_retry_after(formatdate(time.time() + 60, usegmt=True)), 60, delta=2)
+        self.assertEqual(parse_retry_after(formatdate(time.time() - 60, usegmt=True)), 0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_status_from_ytdlp_message(self):
+        error = EngineError("ERROR: unable to download video data: HTTP Error 429: Too Many Requests")
+        self.assertEqual(http_status(error), (429, None))
+        self.assertEqual(http_status(EngineError("Video unavailable")), (None, None))
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_paces_takers(self):
+        bucket = TokenBucket(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50 * 0.9)
+
+    def test_cancelled_while_paused(self):
+        bucket = TokenBucket(rate=10)
+        bucket.pause(30)
+        start = time.monotonic()
+        with self.assertRaises(JobCancelled):
+            bucket.acquire(cancelled=lambda: time.monotonic() - start > 0.1)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class RateLimiterTest(unittest.TestCase):
+    """Against a local server that answers with queued 429s and 403s"""
+
+    def setUp(self):
+        self.server = MediaServer({"/video.mp4": b"video"})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.retries = []
+
+    def fetch(self):
+        with urllib.request.urlopen(self.server.url("/video.mp4"), timeout=5) as response:
+            return response.read()
+
+    def call(self, limiter, **kwargs):
+        return limiter.call(self.fetch, on_retry=lambda attempt, delay, error: self.retries.append(delay), **kwargs)
+
+    def requests(self):
+        return len(self.server.requests)
+
+    def test_retry_after_is_honoured(self):
+        self.server.fail_with(429, {"Retry-After": "1"})
+        limiter = RateLimiter(rate=0, policy=RetryPolicy(base_delay=0.01))
+        start = time.monotonic()
+        self.assertEqual(self.call(limiter), b"video")
+        self.assertGreaterEqual(time.monotonic() - start, 0.95)
+        self.assertEqual(len(self.retries), 1)
+        self.assertGreaterEqual(self.retries[0], 1)
+
+    def test_backoff_pauses_every_caller(self):
+        self.server.fail_with(429, {"Retry-After": "1"})
+        limiter = RateLimiter(rate=0, policy=RetryPolicy(base_delay=0.01))
+        self.call(limiter)
+        # The bucket was paused for everyone; a call right after does not wait
+        start = time.monotonic()
+        limiter.call(lambda: None)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        self.server.fail_with(429, {"Retry-After": "1"})
+        other = []
+        thread = threading.Thread(target=lambda: self.call(limiter))
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not self.retries[1:] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        start = time.monotonic()
+        limiter.call(lambda: other.append(time.monotonic() - start))
+        thread.join()
+        self.assertGreater(other[0], 0.5)
+
+    def test_gives_up_after_max_attempts(self):
+        self.server.fail_with(429, count=5)
+        limiter = RateLimiter(rate=0, policy=RetryPolicy(max_attempts=3, base_delay=0.01))
+        with self.assertRaises(urllib.error.HTTPError) as caught:
+            self.call(limiter)
+        self.assertEqual(caught.exception.code, 429)
+        self.assertEqual(self.requests(), 3)
+        self.assertEqual(limiter.metrics.snapshot()['gave_up'], 1)
+        self.assertEqual(limiter.metrics.snapshot()['retries'], 2)
+
+    def test_403_without_retry_after_is_not_retried(self):
+        self.server.fail_with(403, count=2)
+        limiter = RateLimiter(rate=0, policy=RetryPolicy(base_delay=5))
+        start = time.monotonic()
+        with self.assertRaises(urllib.error.HTTPError):
+            self.call(limiter)
+        self.assertEqual(self.requests(), 1)
+        self.assertEqual(self.retries, [])
+        # Nobody else was paused either
+        limiter.call(lambda: None)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_403_with_retry_after_is_retried(self):
+        self.server.fail_with(403, {"Retry-After": "0"})
+        limiter = RateLimiter(rate=0, policy=RetryPolicy(base_delay=0.01))
+        self.assertEqual(self.call(limiter), b"video")
+        self.assertEqual(len(self.retries), 1)
+
+    def test_403_opt_in(self):
+        self.server.fail_with(403, count=2)
+        limiter = RateLimiter(rate=0, policy=RetryPolicy(base_delay=0.01, statuses=(429, 403)))
+        self.assertEqual(self.call(limiter), b"video")
+        self.assertEqual(self.requests(), 3)
+
+    def test_other_errors_are_not_retried(self):
+        self.server.fail_with(500, count=2)
+        limiter = RateLimiter(rate=0)
+        with self.assertRaises(urllib.error.HTTPError):
+            self.call(limiter)
+        self.assertEqual(self.requests(), 1)
+
+    def test_cancelled_during_backoff(self):
+        self.server.fail_with(429, {"Retry-After": "30"})
+        limiter = RateLimiter(rate=0)
+        start = time.monotonic()
+        with self.assertRaises(JobCancelled):
+            self.call(limiter, cancelled=lambda: bool(self.retries))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.requests(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+
+# requests and PIL are imported when the first thumbnail is needed; both
+# add noticeably to the app's startup time
+
+from paths import user_cache_dir
+from instrumentation import span
+
+THUMBNAIL_SIZE = (320, 180)
+DEFAULT_MEMORY_ITEMS = 64
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Shared HTTP session so thumbnail requests reuse pooled connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+class ThumbnailError(Exception):
+    """Raised when a thumbnail cannot be downloaded or decoded"""
+
+
+class ThumbnailCache:
+    """Two level cache of thumbnails already resized to THUMBNAIL_SIZE.
+
+    Images are looked up in an in-memory LRU first, then in a directory of
+    resized JPEGs keyed by video ID, and only downloaded when both miss.
+    """
+
+    def __init__(self, directory=None, max_items=DEFAULT_MEMORY_ITEMS, session=None):
+        self.directory = directory or os.path.join(user_cache_dir(), "thumbnails")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_items = max_items
+        self._session = session
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = get_session()
+        return self._session
+
+    def _key(self, video_id, url):
+        if video_id:
+            return video_id
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, img):
+        with self._lock:
+            self._memory[key] = img
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def get(self, video_id, url):
+        """Return a resized PIL image for the video, downloading it if needed"""
+        key = self._key(video_id, url)
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+                return img
+
+        from PIL import Image
+        path = os.path.join(self.directory, f"{key}.jpg")
+        if os.path.exists(path):
+            try:
+                with Image.open(path) as cached:
+                    img = cached.copy()
+                self._remember(key, img)
+                return img
+            except OSError:
+                os.remove(path)  # corrupt cache file, fetch it again
+
+        img = self._download(url)
+        try:
+            img.save(path, "JPEG", quality=85)
+        except OSError:
+            pass  # the cache directory is only an optimization
+        self._remember(key, img)
+        return img
+
+    def _download(self, url):
+        import requests
+        from PIL import Image
+        try:
+            with span("thumbnail.fetch") as fields:
+                response = self.session.get(url, timeout=10)
+                fields['bytes'] = len(response.content)
+        except requests.RequestException as e:
+            raise ThumbnailError(str(e))
+        if response.status_code != 200:
+            raise ThumbnailError(f"Failed to load thumbnail: HTTP {response.status_code}")
+        with span("thumbnail.decode"):
+            try:
+                img = Image.open(BytesIO(response.content))
+                # Let the JPEG decoder scale down while decoding instead of
+                # decoding the full image first (no-op for other formats)
+                img.draft("RGB", THUMBNAIL_SIZE)
+                img = img.convert("RGB")
+            except OSError as e:
+                raise ThumbnailError(f"Failed to decode thumbnail: {e}")
+            # Resize to fit in the UI (maintain aspect ratio)
+            img.thumbnail(THUMBNAIL_SIZE)
+        return img
+
+    def invalidate(self, video_id, url=None):
+        key = self._key(video_id, url or "")
+        with self._lock:
+            self._memory.pop(key, None)
+        path = os.path.join(self.directory, f"{key}.jpg")
+        if os.path.exists(path):
+            os.remove(path)
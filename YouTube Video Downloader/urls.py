@@ -0,0 +1,163 @@
+"""Recognise, validate and normalize YouTube URLs.
+
+parse_youtube_url() splits a URL once and looks its host and first path
+segment up in fixed tables, so every function here agrees on what a YouTube
+URL is and no pattern is compiled per call. The split is the generic URI
+pattern of RFC 3986 (appendix B), precompiled: an uncached
+urllib.parse.urlsplit() call costs more than all the old per-URL regexes
+together. Hosts with user info, a port or an IPv6 address are still left
+to urllib.parse. Watch, shorts,
+embed, live, youtu.be, mobile and music links are videos (a watch URL with
+&list= still is); /playlist?list= links are playlists and /channel/, /c/,
+/user/ and @handle links are channels.
+
+normalize_urls() and iter_url_file() stream large URL lists, e.g. exported
+from logs, yielding each video, playlist or channel once in its canonical
+form.
+"""
+import re
+from urllib.parse import urlsplit
+
+VIDEO = "video"
+PLAYLIST = "playlist"
+CHANNEL = "channel"
+
+HOSTS = frozenset(("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com",
+                   "youtube-nocookie.com", "www.youtube-nocookie.com"))
+SHORT_HOSTS = frozenset(("youtu.be", "www.youtu.be"))
+# /<segment>/<video ID> forms
+VIDEO_PATHS = frozenset(("shorts", "embed", "live", "v", "e"))
+# /<segment>/<name> forms
+CHANNEL_PATHS = frozenset(("channel", "c", "user"))
+
+# scheme, authority, path and query; never fails to match
+_split_url = re.compile(r"(?:([A-Za-z][A-Za-z0-9+.-]*):)?//([^/?#]*)([^?#]*)(?:\?([^#]*))?").match
+_is_video_id = re.compile(r"[A-Za-z0-9_-]{11}").fullmatch
+_is_list_id = re.compile(r"[A-Za-z0-9_-]+").fullmatch
+_is_channel_name = re.compile(r"@?[\w.-]+").fullmatch
+
+
+def _query_value(query, name):
+    # First value of `name`; much cheaper than parse_qs() for one key
+    prefix = name + "="
+    for pair in query.split("&"):
+        if pair.startswith(prefix):
+            return pair[len(prefix):]
+    return None
+
+
+def parse_youtube_url(url):
+    """Return (kind, key) for a YouTube URL, or None for anything else.
+
+    `kind` is VIDEO, PLAYLIST or CHANNEL and `key` the video ID, the
+    playlist ID or the channel path ("@name", "channel/UC...") respectively.
+    The scheme may be left out.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "//" + url.lstrip("/")
+    scheme, host, path, query = _split_url(url).groups()
+    if scheme is not None and scheme.lower() not in ("http", "https"):
+        return None
+    if "@" in host or ":" in host or "[" in host:
+        try:
+            host = urlsplit(url).hostname
+        except ValueError:
+            return None
+        if not host:
+            return None
+    else:
+        host = host.lower()
+
+    if host in SHORT_HOSTS:
+        video_id = path[1:].split("/", 1)[0]
+        return (VIDEO, video_id) if _is_video_id(video_id) else None
+    if host not in HOSTS:
+        return None
+
+    segments = path.strip("/").split("/")
+    first = segments[0]
+    query = query or ""
+    if first == "watch":
+        video_id = _query_value(query, "v")
+        if video_id is not None:
+            return (VIDEO, video_id) if _is_video_id(video_id) else None
+        first = "playlist"  # watch?list=... without a video plays the playlist
+    if first == "playlist":
+        list_id = _query_value(query, "list")
+        return (PLAYLIST, list_id) if list_id and _is_list_id(list_id) else None
+    if first in VIDEO_PATHS:
+        if len(segments) > 1 and _is_video_id(segments[1]):
+            return VIDEO, segments[1]
+        return None
+    if first in CHANNEL_PATHS:
+        if len(segments) > 1 and _is_channel_name(segments[1]):
+            return CHANNEL, "/".join(segments)
+        return None
+    if first.startswith("@") and _is_channel_name(first):
+        return CHANNEL, "/".join(segments)
+    return None
+
+
+def canonical_url(kind, key):
+    """The URL the app uses for a parse_youtube_url() result"""
+    if kind == VIDEO:
+        return f"https://www.youtube.com/watch?v={key}"
+    if kind == PLAYLIST:
+        return f"https://www.youtube.com/playlist?list={key}"
+    return f"https://www.youtube.com/{key}"
+
+
+def is_playlist_url(url):
+    """Check for playlist and channel URLs (a watch URL with &list= is a video)"""
+    parsed = parse_youtube_url(url)
+    return parsed is not None and parsed[0] != VIDEO
+
+
+def is_valid_youtube_url(url):
+    return parse_youtube_url(url) is not None
+
+
+def extract_video_id(url):
+    """Extract the 11 character video ID from any YouTube URL"""
+    parsed = parse_youtube_url(url)
+    return parsed[1] if parsed is not None and parsed[0] == VIDEO else None
+
+
+def clean_youtube_url(url):
+    """Return the canonical watch URL of a video URL; any other URL is returned unchanged"""
+    parsed = parse_youtube_url(url)
+    if parsed is not None and parsed[0] == VIDEO:
+        return canonical_url(*parsed)
+    return url
+
+
+def normalize_urls(lines, dedupe=True, on_invalid=None):
+    """Yield the canonical URL of every YouTube link in `lines`, lazily.
+
+    Blank lines and lines starting with '#' are skipped. With `dedupe`, a
+    video, playlist or channel is only yielded the first time it appears,
+    whatever form each occurrence is written in. Lines that are not
+    YouTube URLs are passed to `on_invalid(line)` if given.
+    """
+    seen = set()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parsed = parse_youtube_url(line)
+        if parsed is None:
+            if on_invalid is not None:
+                on_invalid(line)
+            continue
+        if dedupe:
+            if parsed in seen:
+                continue
+            seen.add(parsed)
+        yield canonical_url(*parsed)
+
+
+def iter_url_file(path, dedupe=True, on_invalid=None):
+    """normalize_urls() over a text file, read a line at a time"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        yield from normalize_urls(f, dedupe, on_invalid)